@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+"""
+Micro-benchmark of `Processing.hash_columns_sha256_salt` at low and high cardinality.
+
+Compares the previous row-by-row hashing with the dictionary-encoded path, with and without a warm `DigestCache` (as for the second file of a run).
+
+Usage:
+    python -m benchmarks.bench_hashing --rows 1000000
+"""
+
+import argparse
+import hashlib
+import time
+
+import numpy as np
+import pandas as pd
+
+from utils import utils
+
+SALT = "benchmark-salt"
+
+
+def per_row(df: pd.DataFrame, column: str) -> pd.DataFrame:
+    """The previous implementation: one SHA-256 per row."""
+    df[f'{column}_hashed'] = df[column].apply(
+        lambda x: hashlib.sha256(f'{x}{SALT}'.encode('utf-8')).hexdigest())
+    df.drop(columns=[column], inplace=True)
+    return df
+
+
+def timed(func, df: pd.DataFrame) -> float:
+    start = time.perf_counter()
+    func(df.copy())
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    print(f"{'distinct':>10}{'per row':>10}{'encoded':>10}{'cached':>10}")
+    for distinct in (300, args.rows // 2):
+        df = pd.DataFrame({"Job Title": [f"Job title {i}" for i in rng.integers(0, distinct, args.rows)]})
+        cache = utils.DigestCache(maxsize=args.rows)
+        utils.Processing.hash_columns_sha256_salt(df.copy(), ["Job Title"], SALT, cache)
+
+        results = [
+            timed(lambda d: per_row(d, "Job Title"), df),
+            timed(lambda d: utils.Processing.hash_columns_sha256_salt(d, ["Job Title"], SALT), df),
+            timed(lambda d: utils.Processing.hash_columns_sha256_salt(d, ["Job Title"], SALT, cache), df),
+        ]
+        print(f"{distinct:>10}" + "".join(f"{seconds:>10.3f}" for seconds in results))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark of the intermediate formats of `data/temp`.
+
+Streams one synthetic CSV through extract, clean and process into its intermediate file, once per format: Parquet (snappy), and Arrow IPC uncompressed and with LZ4. It then reads the file back whole and reads a single column, as the metrics and output stages and the key index do. The table reports the seconds taken by each step and the size of the file. Arrow IPC files are memory-mapped, so reading one column only pages in that column.
+
+Usage:
+    python -m benchmarks.bench_intermediate --rows 1000000
+"""
+
+import argparse
+import os
+import tempfile
+import time
+
+from benchmarks.common import bench_config, write_people_csv
+from utils.engine import PipelineRunner, load_stages
+
+FORMATS = {
+    "parquet": {"format": "parquet"},
+    "arrow": {"format": "arrow", "compression": "none"},
+    "arrow-lz4": {"format": "arrow", "compression": "lz4"},
+}
+
+
+def timed(func):
+    """Returns the result of a call and the seconds it took."""
+    start = time.perf_counter()
+    result = func()
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--column", default="User Id", help="the column read on its own")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        config = bench_config(workdir, ["bench"])
+        config["streaming"] = {"enabled": True, "batch_size": 100_000}
+        config["parallel"] = {"enabled": False}
+        config["scheduler"] = {"workers": 0}
+        write_people_csv(f"{config['inputs']}/bench.csv", args.rows)
+        stages = [s for s in load_stages() if s.name in ("extract", "clean", "process")]
+
+        print(f"{'format':<10}{'write s':>10}{'read s':>10}{'column s':>10}{'MB':>10}")
+        for name, intermediate in FORMATS.items():
+            config["intermediate"] = intermediate
+            context, write_seconds = timed(lambda: PipelineRunner(config, stages).run())
+            _, read_seconds = timed(lambda: context.read_checkpoint("bench").to_pandas())
+            _, column_seconds = timed(lambda: context.read_checkpoint("bench", [args.column]).to_pandas())
+            size = os.path.getsize(context.checkpoint_path("bench"))
+            print(f"{name:<10}{write_seconds:>10.2f}{read_seconds:>10.3f}{column_seconds:>10.3f}{size / 1e6:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark of the quality metrics history against loading the per-run summaries.
+
+Writes the processed summaries of `--files` files over `--runs` runs, as the metrics stage does (`{file}_processed_{datetime}.parquet`), with values that drift now and then. The `glob` mode answers a query the way it had to be answered before the store: it lists and loads every summary, then picks the metric. The `store` mode backfills the summaries into a `MetricsStore` once, then answers the same query from the compacted table. Both modes time a null percentage time series of one file and the runs whose null percentage or distinct count drifted.
+
+Usage:
+    python -m benchmarks.bench_metrics_store --runs 1000 --files 5
+"""
+
+import argparse
+import glob
+import os
+import re
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+from utils.metrics_store import DRIFT_THRESHOLDS, MetricsStore
+
+COLUMNS = ["User Id", "Sex", "Date of birth", "Job Title_hashed", "Year of birth", "source_file"]
+
+
+def write_summaries(metrics_dir: str, runs: int, files: int, seed: int = 0) -> None:
+    """Writes the processed summaries of every file and run, with occasional jumps of the null percentage."""
+    rng = np.random.default_rng(seed)
+    os.makedirs(f"{metrics_dir}/processed", exist_ok=True)
+    start = datetime(2025, 1, 1)
+    for run in range(runs):
+        stamp = (start + timedelta(hours=run)).strftime("%Y%m%d_%H%M%S")
+        for index in range(files):
+            nulls = rng.choice([1.0, 20.0], p=[0.98, 0.02], size=len(COLUMNS))
+            summary = pd.DataFrame({
+                "Total Count": 1000.0,
+                "Null Percentage (%)": nulls,
+                "Distinct Count": rng.integers(900, 1000, size=len(COLUMNS)).astype(float),
+                "Max Length": 20.0,
+            }, index=COLUMNS).T
+            summary.to_parquet(f"{metrics_dir}/processed/people_{index}_processed_{stamp}.parquet")
+
+
+def glob_series(metrics_dir: str, metric: str, file: str) -> pd.DataFrame:
+    """Builds a time series by loading every summary of a file."""
+    rows = []
+    for path in sorted(glob.glob(f"{metrics_dir}/processed/{file}_processed_*.parquet")):
+        stamp = re.search(r"_(\d{8}_\d{6})\.parquet$", path).group(1)
+        values = pd.read_parquet(path).loc[metric]
+        rows.append(pd.DataFrame({"run_time": datetime.strptime(stamp, "%Y%m%d_%H%M%S"),
+                                  "column": values.index, "value": values.to_numpy()}))
+    return pd.concat(rows, ignore_index=True)
+
+
+def glob_drift(metrics_dir: str) -> pd.DataFrame:
+    """Finds the drifted runs by loading every summary of every file."""
+    rows = []
+    for path in sorted(glob.glob(f"{metrics_dir}/processed/*_processed_*.parquet")):
+        file, stamp = re.search(r"([^/]+)_processed_(\d{8}_\d{6})\.parquet$", path).groups()
+        summary = pd.read_parquet(path)
+        for metric in DRIFT_THRESHOLDS:
+            rows.append(pd.DataFrame({"metric": metric, "file": file, "column": summary.columns,
+                                      "run_time": datetime.strptime(stamp, "%Y%m%d_%H%M%S"),
+                                      "value": summary.loc[metric].to_numpy()}))
+    rows = pd.concat(rows, ignore_index=True).sort_values(["metric", "file", "column", "run_time"])
+    rows["previous"] = rows.groupby(["metric", "file", "column"])["value"].shift()
+    change = rows["value"] - rows["previous"]
+    relative = rows["metric"] != "Null Percentage (%)"
+    change[relative] = change[relative] / rows.loc[relative, "previous"].abs()
+    return rows[change.abs() > rows["metric"].map(DRIFT_THRESHOLDS)]
+
+
+def timed(func, repeat: int):
+    """Returns the result of a call and the best of `repeat` timings, in seconds."""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return result, best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--runs", type=int, default=1000)
+    parser.add_argument("--files", type=int, default=5)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        metrics_dir = f"{workdir}/quality_metrics"
+        write_summaries(metrics_dir, args.runs, args.files)
+        metric = "Null Percentage (%)"
+
+        series, glob_series_seconds = timed(lambda: glob_series(metrics_dir, metric, "people_0"), args.repeat)
+        drifted, glob_drift_seconds = timed(lambda: glob_drift(metrics_dir), args.repeat)
+
+        store = MetricsStore(f"{metrics_dir}/history")
+        _, backfill_seconds = timed(lambda: store.backfill(metrics_dir), 1)
+        store_series, store_series_seconds = timed(lambda: store.series(metric, file="people_0"), args.repeat)
+        store_drifted, store_drift_seconds = timed(lambda: store.drift(), args.repeat)
+        assert len(store_series) == len(series) and len(store_drifted) == len(drifted)
+
+    print(f"{args.runs * args.files} summaries; backfill into the store took {backfill_seconds:.2f} s once")
+    print(f"{'mode':<8}{'series ms':>12}{'drift ms':>12}")
+    print(f"{'glob':<8}{glob_series_seconds * 1000:>12.1f}{glob_drift_seconds * 1000:>12.1f}")
+    print(f"{'store':<8}{store_series_seconds * 1000:>12.1f}{store_drift_seconds * 1000:>12.1f}")
+    print(f"{len(drifted)} drifted runs found")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+"""
+Scaling benchmark for byte-range parallel processing of a single CSV.
+
+Runs the extract, clean and process chain on one synthetic CSV with 1, 2, 4, ... up to `--max-workers` worker processes and reports wall time and speedup over the single-worker run. Ranges are forced down to 1 MB so that every worker gets work.
+
+Usage:
+    python -m benchmarks.bench_parallel --rows 2000000 --max-workers 8
+"""
+
+import argparse
+import os
+import tempfile
+import time
+
+from benchmarks.common import bench_config, write_people_csv
+from utils.engine import PipelineRunner, load_stages
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--max-workers", type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+
+    worker_counts = [1]
+    while worker_counts[-1] * 2 <= args.max_workers:
+        worker_counts.append(worker_counts[-1] * 2)
+    if worker_counts[-1] != args.max_workers:
+        worker_counts.append(args.max_workers)
+
+    with tempfile.TemporaryDirectory() as workdir:
+        config = bench_config(workdir, ["bench"])
+        write_people_csv(f"{config['inputs']}/bench.csv", args.rows)
+        stages = [s for s in load_stages() if s.name in ("extract", "clean", "process")]
+
+        print(f"{'workers':>8}{'seconds':>10}{'speedup':>10}")
+        baseline = None
+        for workers in worker_counts:
+            config["parallel"] = {"enabled": True, "workers": workers, "min_range_bytes": 1 << 20}
+            start = time.perf_counter()
+            PipelineRunner(config, stages).run()
+            elapsed = time.perf_counter() - start
+            baseline = baseline or elapsed
+            print(f"{workers:>8}{elapsed:>10.2f}{baseline / elapsed:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
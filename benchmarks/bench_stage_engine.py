@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark of the in-process stage engine against the previous Parquet round-trips.
+
+The previous pipeline ran each stage with `exec()` and read and wrote `data/temp/{file}.parquet` around every stage. The `legacy` mode reproduces that by checkpointing after each stage and dropping the in-memory table so the next stage reads it back. The `engine` mode keeps the table in memory from extract to process. Both modes report wall time and bytes read/written.
+
+Usage:
+    python -m benchmarks.bench_stage_engine --rows 1000000
+"""
+
+import argparse
+import tempfile
+import time
+
+from benchmarks.common import bench_config, io_counters, write_people_csv
+from utils.engine import PipelineRunner, load_stages
+
+
+class LegacyRunner(PipelineRunner):
+    """Runner reproducing the exec() pipeline: every stage reads and writes its temp Parquet."""
+
+    def run_stage(self, stage):
+        super().run_stage(stage)
+        self.context.tables.clear()
+
+
+def measure(runner_cls, config, stages, **kwargs) -> dict:
+    """Runs the stages with a runner class and returns wall time and I/O bytes."""
+    io_before = io_counters()
+    start = time.perf_counter()
+    runner_cls(config, stages, **kwargs).run()
+    elapsed = time.perf_counter() - start
+    io_after = io_counters()
+    return {
+        "seconds": elapsed,
+        "bytes_read": io_after["read"] - io_before["read"],
+        "bytes_written": io_after["written"] - io_before["written"],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        config = bench_config(workdir, ["bench"])
+        write_people_csv(f"{config['inputs']}/bench.csv", args.rows)
+
+        # Only the per-file chain is compared; metrics and output are unchanged by the engine
+        stages = [s for s in load_stages() if s.name in ("extract", "clean", "process")]
+
+        results = {
+            "legacy": measure(LegacyRunner, config, stages, checkpoint=True),
+            "engine": measure(PipelineRunner, config, stages, checkpoint=False),
+        }
+
+    print(f"{'mode':<8}{'seconds':>10}{'MB read':>12}{'MB written':>12}")
+    for mode, result in results.items():
+        print(f"{mode:<8}{result['seconds']:>10.2f}"
+              f"{result['bytes_read'] / 1e6:>12.1f}{result['bytes_written'] / 1e6:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
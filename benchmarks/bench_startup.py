@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark of the startup time of `main.py`, measured with `python -X importtime`.
+
+Runs `main.py --stages extract --no-charts` on one small generated CSV in a fresh interpreter, and parses the import times it reports. The `lazy` mode is the command line as it is. The `eager` mode first imports the plotting and AWS libraries (matplotlib.pyplot, seaborn and boto3) that every stage used to import at startup, whether it drew a chart or not, which reproduces the earlier startup. Each mode reports the best of `--repeat` runs: the wall time of the whole command, the time spent importing modules, and the slowest top-level imports.
+
+Usage:
+    python -m benchmarks.bench_startup --rows 1000
+"""
+
+import argparse
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import time
+
+import yaml
+
+from benchmarks.common import bench_config, write_people_csv
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+EAGER_IMPORTS = ("matplotlib.pyplot", "seaborn", "boto3")
+IMPORT_LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)")
+
+
+def import_times(stderr: str) -> dict:
+    """Returns the cumulative import time in seconds of each top-level module in the `-X importtime` output."""
+    times = {}
+    for match in IMPORT_LINE.finditer(stderr):
+        _, cumulative, indent, module = match.groups()
+        if len(indent) == 1:
+            times[module] = times.get(module, 0) + int(cumulative) / 1e6
+    return times
+
+
+def run_startup(workdir: str, preload: tuple) -> dict:
+    """Runs `main.py --stages extract --no-charts` in a new interpreter and returns its wall time and import times."""
+    code = "; ".join([f"import {module}" for module in preload] +
+                     ["import sys, main", "main.main(sys.argv[1:])"])
+    command = [sys.executable, "-X", "importtime", "-c", code, "--config", "config.yaml",
+               "--stages", "extract", "--no-charts"]
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [REPO_DIR, os.environ.get("PYTHONPATH")])))
+    start = time.perf_counter()
+    result = subprocess.run(command, cwd=workdir, env=env, capture_output=True, text=True)
+    seconds = time.perf_counter() - start
+    if result.returncode != 0:
+        raise RuntimeError(f"main.py failed:\n{result.stderr[-2000:]}")
+    imports = import_times(result.stderr)
+    return {"seconds": seconds, "import_seconds": sum(imports.values()), "imports": imports}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--top", type=int, default=5, help="the slowest top-level imports to list")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        config = bench_config(workdir, ["bench"])
+        config["salt"] = os.path.abspath(config["salt"])
+        config["scheduler"] = {"workers": 0}
+        write_people_csv(f"{config['inputs']}/bench.csv", args.rows)
+        with open(os.path.join(workdir, "config.yaml"), "w") as f:
+            yaml.safe_dump(config, f, sort_keys=False)
+
+        results = {}
+        for mode, preload in (("eager", EAGER_IMPORTS), ("lazy", ())):
+            results[mode] = min((run_startup(workdir, preload) for _ in range(args.repeat)),
+                                key=lambda result: result["seconds"])
+
+    print(f"{'mode':<8}{'wall s':>10}{'imports s':>12}  slowest imports")
+    for mode, result in results.items():
+        slowest = sorted(result["imports"].items(), key=lambda item: item[1], reverse=True)[:args.top]
+        print(f"{mode:<8}{result['seconds']:>10.3f}{result['import_seconds']:>12.3f}  "
+              + ", ".join(f"{module} {seconds:.3f}" for module, seconds in slowest))
+    print(f"lazy startup takes {results['lazy']['seconds'] / results['eager']['seconds']:.0%} of the eager one")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+"""
+Shared helpers for the benchmark scripts.
+
+Functions included in the module:
+- **write_people_csv(path, rows, seed)**: Writes a synthetic CSV with the `config.yaml` people schema.
+- **io_counters()**: Returns the bytes read and written by the current process so far, from `utils.instrumentation`.
+- **bench_config(workdir, files)**: Returns a copy of `config.yaml` pointing its directories at a scratch location.
+"""
+
+import os
+import yaml
+
+from benchmarks import generator
+from utils.instrumentation import io_counters  # noqa: F401 (re-exported for the benchmarks)
+
+
+def write_people_csv(path: str, rows: int, seed: int = 0) -> None:
+    """Writes a synthetic CSV with the same columns as the example inputs, using `benchmarks.generator`."""
+    generator.write_people_csv(path, rows, seed)
+
+
+def bench_config(workdir: str, files: list) -> dict:
+    """Returns `config.yaml` with inputs, temp, outputs, the chart cache and the run manifest redirected under `workdir`."""
+    with open("config.yaml") as f:
+        config = yaml.safe_load(f)
+    for key in ("inputs", "temp", "outputs"):
+        config[key] = os.path.join(workdir, key)
+        os.makedirs(config[key], exist_ok=True)
+    config["csv_files"] = files
+    # Keep the chart cache and the run manifest out of the repository's data directory
+    config["charts"] = dict(config.get("charts") or {}, cache_dir=os.path.join(workdir, "chart_cache"))
+    config["incremental"] = dict(config.get("incremental") or {}, manifest=os.path.join(workdir, "manifest.json"))
+    return config
@@ -0,0 +1,198 @@
+# -*- coding: utf-8 -*-
+"""
+Deterministic synthetic data generator for the benchmarks.
+
+Generates people data with the columns and order of the `variables` in `config.yaml`, at any size from a few rows to 1e8 rows. Rows are generated and written in fixed chunks of `CHUNK_ROWS`, each drawn from its own seeded random generator, so a given seed and row count always produce the same file and memory stays bounded by one chunk.
+
+The generated data can be tuned with:
+- **cardinality**: the number of distinct values of the name and job title columns (an int for all of them, or a mapping of column to int).
+- **null_rate**: the fraction of missing values in every column except the `Index` and `User Id` keys.
+- **whitespace_rate**: the fraction of text values padded or split with stray spaces, as removed by the clean stage.
+
+Functions included in the module:
+- **generate_chunk(start, rows, seed, ...)**: Returns the rows `start` to `start + rows` of a dataset as a DataFrame.
+- **generate_frame(rows, seed, ...)**: Returns a whole dataset as a DataFrame.
+- **write_people_csv(path, rows, seed, ...)**: Writes a dataset to a CSV chunk by chunk.
+
+Usage:
+    python -m benchmarks.generator data/bench/people.csv --rows 10000000 --cardinality 5000 --null-rate 0.01 --whitespace-rate 0.05
+"""
+
+import argparse
+from functools import lru_cache
+from typing import Optional, Union
+
+import numpy as np
+import pandas as pd
+import yaml
+
+CHUNK_ROWS = 100_000
+
+SYLLABLES = ["ka", "lo", "mi", "ne", "ra", "so", "ti", "va", "ze", "bu", "da", "fe", "gi", "ho", "ju", "py"]
+ROLES = ["engineer", "officer", "analyst", "manager", "teacher", "therapist", "designer", "surveyor"]
+
+# Columns drawn from a pool of `cardinality` distinct values
+POOLED_COLUMNS = ("First Name", "Last Name", "Job Title")
+KEY_COLUMNS = ("Index", "User Id")
+DEFAULT_CARDINALITY = 1000
+
+# Odd multiplier: multiplication modulo 2**60 is a bijection, so row numbers map to unique ids
+_ID_MULTIPLIER = np.uint64(0x9E3779B97F4A7C15)
+_ID_MASK = np.uint64((1 << 60) - 1)
+
+
+def load_variables(config_path: str = "config.yaml") -> dict:
+    """Returns the `variables` of a config file, in order."""
+    with open(config_path) as f:
+        return yaml.safe_load(f)["variables"]
+
+
+def _words(codes: np.ndarray) -> np.ndarray:
+    """Returns a capitalised pronounceable word for each code, distinct for distinct codes."""
+    words = []
+    for code in codes.tolist():
+        # Bijective base-16 numeration, offset so that every word has at least two syllables
+        code += len(SYLLABLES)
+        syllables = []
+        while True:
+            code, digit = divmod(code, len(SYLLABLES))
+            syllables.append(SYLLABLES[digit])
+            if code == 0:
+                break
+            code -= 1
+        words.append("".join(reversed(syllables)).capitalize())
+    return np.array(words, dtype=object)
+
+
+@lru_cache(maxsize=None)
+def _pool(column: str, cardinality: int) -> np.ndarray:
+    """Returns the `cardinality` distinct values a pooled column is drawn from."""
+    codes = np.arange(cardinality)
+    if column == "Job Title":
+        return np.array([f"{word} {ROLES[code % len(ROLES)]}"
+                         for word, code in zip(_words(codes // len(ROLES)), codes.tolist())], dtype=object)
+    return _words(codes)
+
+
+def _column(name: str, dtype: str, rows: np.ndarray, rng: np.random.Generator, cardinality: int) -> np.ndarray:
+    """Generates one column for the given row numbers."""
+    n = len(rows)
+    if name == "Index":
+        return rows + 1
+    if name == "User Id":
+        ids = (rows.astype(np.uint64) * _ID_MULTIPLIER) & _ID_MASK
+        return np.array([f"{x:015x}" for x in ids.tolist()], dtype=object)
+    if name in POOLED_COLUMNS:
+        return _pool(name, cardinality)[rng.integers(0, cardinality, n)]
+    if name == "Sex":
+        return rng.choice(np.array(["Male", "Female"], dtype=object), n)
+    if name == "Email":
+        return np.array([f"user{row}@example.org" for row in rows.tolist()], dtype=object)
+    if name == "Phone":
+        parts = rng.integers(0, [1000, 1000, 10000], (n, 3))
+        return np.array([f"{a:03d}.{b:03d}.{c:04d}" for a, b, c in parts.tolist()], dtype=object)
+    if dtype == "datetime" or name == "Date of birth":
+        days = rng.integers(0, 42000, n)
+        return (pd.Timestamp("1905-01-01") + pd.to_timedelta(days, unit="D")).strftime("%Y-%m-%d").to_numpy(dtype=object)
+    if dtype.startswith(("int", "float")):
+        return rng.integers(0, cardinality, n)
+    return _pool(name, cardinality)[rng.integers(0, cardinality, n)]
+
+
+def _add_whitespace(values: np.ndarray, mask: np.ndarray, rng: np.random.Generator) -> np.ndarray:
+    """Pads or splits the masked text values with stray spaces."""
+    values = values.copy()
+    kinds = rng.integers(0, 3, int(mask.sum()))
+    for i, kind in zip(np.flatnonzero(mask).tolist(), kinds.tolist()):
+        value = values[i]
+        if kind == 0:
+            values[i] = f"  {value}"
+        elif kind == 1:
+            values[i] = f"{value}   "
+        else:
+            middle = len(value) // 2
+            values[i] = f"{value[:middle]} {value[middle:]}"
+    return values
+
+
+def generate_chunk(start: int, rows: int, seed: int = 0, cardinality: Union[int, dict] = DEFAULT_CARDINALITY,
+                   null_rate: float = 0.0, whitespace_rate: float = 0.0,
+                   variables: Optional[dict] = None) -> pd.DataFrame:
+    """
+    Generates the rows `start` to `start + rows` of a dataset.
+
+    `start` must be a multiple of `CHUNK_ROWS` and `rows` at most `CHUNK_ROWS`, so that every chunk is drawn from the same seeded generator whatever the total size.
+
+    Parameters:
+        start (int): Row number of the first row.
+        rows (int): Number of rows.
+        seed (int): Seed of the dataset.
+        cardinality (int or dict): Distinct values of the pooled columns, for all of them or per column.
+        null_rate (float): Fraction of missing values in the non-key columns.
+        whitespace_rate (float): Fraction of text values with stray spaces.
+        variables (dict): Column names and types. Defaults to the `variables` of `config.yaml`.
+
+    Returns:
+        pd.DataFrame: The generated rows.
+    """
+    if start % CHUNK_ROWS or rows > CHUNK_ROWS:
+        raise ValueError(f"Chunks must start on a multiple of {CHUNK_ROWS} rows and hold at most {CHUNK_ROWS} rows")
+    variables = load_variables() if variables is None else variables
+    rng = np.random.default_rng([seed, start // CHUNK_ROWS])
+    row_numbers = np.arange(start, start + rows, dtype=np.int64)
+
+    data = {}
+    for name, dtype in variables.items():
+        column_cardinality = cardinality.get(name, DEFAULT_CARDINALITY) if isinstance(cardinality, dict) else cardinality
+        values = _column(name, str(dtype), row_numbers, rng, max(int(column_cardinality), 1))
+        if name not in KEY_COLUMNS:
+            if whitespace_rate and values.dtype == object and name != "Date of birth":
+                values = _add_whitespace(values, rng.random(rows) < whitespace_rate, rng)
+            if null_rate:
+                values = pd.Series(values).mask(rng.random(rows) < null_rate).to_numpy()
+        data[name] = values
+    return pd.DataFrame(data)
+
+
+def _chunks(rows: int, **kwargs):
+    """Yields the chunks of a dataset in order."""
+    for start in range(0, rows, CHUNK_ROWS):
+        yield generate_chunk(start, min(CHUNK_ROWS, rows - start), **kwargs)
+
+
+def generate_frame(rows: int, seed: int = 0, **kwargs) -> pd.DataFrame:
+    """Returns a whole generated dataset as one DataFrame; see `generate_chunk` for the parameters."""
+    return pd.concat(list(_chunks(rows, seed=seed, **kwargs)), ignore_index=True)
+
+
+def write_people_csv(path: str, rows: int, seed: int = 0, **kwargs) -> None:
+    """
+    Writes a generated dataset to a CSV, one chunk at a time.
+
+    Parameters:
+        path (str): The CSV file to write.
+        rows (int): Number of rows.
+        seed (int): Seed of the dataset.
+        kwargs: `cardinality`, `null_rate`, `whitespace_rate` and `variables`, as for `generate_chunk`.
+    """
+    with open(path, "w", newline="") as f:
+        for i, chunk in enumerate(_chunks(rows, seed=seed, **kwargs)):
+            chunk.to_csv(f, index=False, header=i == 0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("path")
+    parser.add_argument("--rows", type=float, default=100_000, help="number of rows, e.g. 1e7")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--cardinality", type=int, default=DEFAULT_CARDINALITY)
+    parser.add_argument("--null-rate", type=float, default=0.0)
+    parser.add_argument("--whitespace-rate", type=float, default=0.0)
+    args = parser.parse_args()
+
+    write_people_csv(args.path, int(args.rows), args.seed, cardinality=args.cardinality,
+                     null_rate=args.null_rate, whitespace_rate=args.whitespace_rate)
+
+
+if __name__ == "__main__":
+    main()
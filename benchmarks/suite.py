@@ -0,0 +1,223 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark suite timing every `utils` function and every pipeline stage on generated data, with a regression check against a JSON history.
+
+The input is produced by `benchmarks.generator` with the requested size, cardinality, null rate and whitespace noise. The cleaning functions are timed with both cleaning engines (the `.arrow` cases use the Arrow kernels). Each function case is timed as the best of `--repeat` runs on a fresh copy of the data, and each stage as the best of `--repeat` end-to-end pipeline runs. Every case reports rows per second and the peak RSS of the process while it ran.
+
+Results are appended to the history file together with the host, the row count and the git commit. A case regresses when its rows per second drop, or its peak RSS grows, by more than `--threshold` relative to the median of the last `--window` runs on the same host at the same row count; the suite then exits with status 1.
+
+Usage:
+    python -m benchmarks.suite --rows 100000
+    python -m benchmarks.suite --rows 1e6 --threshold 0.1 --only processing
+"""
+
+import argparse
+import gc
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+from datetime import datetime
+
+import pandas as pd
+
+from benchmarks.common import bench_config
+from benchmarks.generator import write_people_csv
+from utils import utils
+from utils.engine import PipelineRunner, load_stages
+from utils.instrumentation import Measurement
+from utils.quality import QualityAccumulator
+
+SALT = "benchmark-salt"
+
+def text_columns(df: pd.DataFrame) -> list:
+    """Returns the columns the clean stage removes whitespace from (all but the parsed dates)."""
+    return [column for column in df.columns if not pd.api.types.is_datetime64_any_dtype(df[column])]
+
+
+FUNCTION_CASES = {
+    "validation.variable_names": lambda df, config: utils.DataFrameValidation.variable_names(df, config),
+    "validation.variable_types": lambda df, config: utils.DataFrameValidation.variable_types(df, config),
+    "validation.variable_count": lambda df, config: utils.DataFrameValidation.variable_count(df, config),
+    "validation.validate_header": lambda df, config: utils.DataFrameValidation.validate_header(
+        f"{config['inputs']}/bench.csv", config, (config.get("validation") or {}).get("sample_rows", 0)),
+    "cleaning.remove_special_characters": lambda df, config: utils.Cleaning.remove_special_characters(df, "Job Title"),
+    "cleaning.remove_whitespaces": lambda df, config: utils.Cleaning.remove_whitespaces(df, columns=text_columns(df)),
+    "cleaning.convert_columns_uppercase": lambda df, config: utils.Cleaning.convert_columns_uppercase(df, config["uppercase"]),
+    "cleaning.remove_special_characters.arrow": lambda df, config: utils.Cleaning.remove_special_characters(df, "Job Title", engine="arrow"),
+    "cleaning.remove_whitespaces.arrow": lambda df, config: utils.Cleaning.remove_whitespaces(df, engine="arrow", columns=text_columns(df)),
+    "cleaning.convert_columns_uppercase.arrow": lambda df, config: utils.Cleaning.convert_columns_uppercase(df, config["uppercase"], engine="arrow"),
+    "processing.add_year_column": lambda df, config: utils.Processing.add_year_column(df, "Date of birth"),
+    "processing.remove_pii_columns": lambda df, config: utils.Processing.remove_pii_columns(df, config["remove_columns"]),
+    "processing.hash_columns_sha256_salt": lambda df, config: utils.Processing.hash_columns_sha256_salt(df, config["cols_to_hash"], SALT),
+    "processing.add_sourcefile_variable": lambda df, config: utils.Processing.add_sourcefile_variable(df, "bench"),
+    "quality.calculate_data_quality": lambda df, config: utils.QualityMetrics.calculate_data_quality(df),
+    "quality.accumulator": lambda df, config: QualityAccumulator.from_config(config).update(df).to_frame(),
+}
+
+
+def measure(func, rows: int) -> dict:
+    """Runs a callable once and returns its wall time, rows per second and peak RSS."""
+    gc.collect()
+    with Measurement("case") as measurement:
+        func()
+    seconds = measurement.result["wall_seconds"]
+    return {"seconds": seconds, "rows_per_sec": rows / seconds if seconds else float("inf"),
+            "peak_rss_mb": measurement.result["peak_rss_bytes"] / 1e6}
+
+
+def best(results: list) -> dict:
+    """Returns the fastest of several measurements of a case, with the highest peak RSS seen."""
+    fastest = min(results, key=lambda result: result["seconds"])
+    return dict(fastest, peak_rss_mb=max(result["peak_rss_mb"] for result in results))
+
+
+def run_function_cases(df: pd.DataFrame, config: dict, repeat: int, only: str) -> dict:
+    """Times every selected `utils` function on copies of a DataFrame."""
+    results = {}
+    for name, func in FUNCTION_CASES.items():
+        if only and only not in name:
+            continue
+        runs = []
+        for _ in range(repeat):
+            data = df.copy()
+            runs.append(measure(lambda: func(data, config), len(df)))
+        results[name] = best(runs)
+    return results
+
+
+def run_stage_cases(config: dict, rows: int, repeat: int, only: str) -> dict:
+    """Times every pipeline stage in end-to-end runs, and the whole pipeline."""
+    stages = load_stages()
+    runs = {}
+    for _ in range(repeat):
+        # Charts must be drawn in every run rather than copied from the previous run's render cache
+        shutil.rmtree(config["charts"]["cache_dir"], ignore_errors=True)
+        runner = PipelineRunner(config, stages)
+        total = 0.0
+        for stage in stages:
+            result = measure(lambda: runner.run_stage(stage), rows)
+            runs.setdefault(f"stage.{stage.name}", []).append(result)
+            total += result["seconds"]
+        runner.context.close()
+        runs.setdefault("pipeline.total", []).append(
+            {"seconds": total, "rows_per_sec": rows / total,
+             "peak_rss_mb": max(runs[f"stage.{stage.name}"][-1]["peak_rss_mb"] for stage in stages)})
+    return {name: best(results) for name, results in runs.items() if not only or only in name}
+
+
+def load_history(path: str) -> list:
+    """Returns the runs recorded in a history file."""
+    if not os.path.exists(path):
+        return []
+    with open(path) as f:
+        return json.load(f).get("runs", [])
+
+
+def save_history(path: str, runs: list) -> None:
+    """Writes the runs to a history file."""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w") as f:
+        json.dump({"runs": runs}, f, indent=2)
+
+
+def find_regressions(results: dict, baseline_runs: list, threshold: float) -> dict:
+    """
+    Compares results with the median of earlier runs.
+
+    Parameters:
+        results (dict): The results of the current run, keyed by case.
+        baseline_runs (list): Earlier runs to compare with.
+        threshold (float): Allowed relative drop in rows per second and growth in peak RSS, e.g. 0.2 for 20%.
+
+    Returns:
+        dict: For each case with a baseline, the relative change in rows per second and peak RSS and whether it regressed.
+    """
+    comparison = {}
+    for name, result in results.items():
+        earlier = [run["results"][name] for run in baseline_runs if name in run["results"]]
+        if not earlier:
+            continue
+        base_speed = statistics.median(r["rows_per_sec"] for r in earlier)
+        base_rss = statistics.median(r["peak_rss_mb"] for r in earlier)
+        speed_change = result["rows_per_sec"] / base_speed - 1
+        rss_change = result["peak_rss_mb"] / base_rss - 1
+        comparison[name] = {
+            "speed_change": speed_change,
+            "rss_change": rss_change,
+            "regressed": speed_change < -threshold or rss_change > threshold,
+        }
+    return comparison
+
+
+def git_commit() -> str:
+    """Returns the current git commit, or None outside a git checkout."""
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", type=float, default=100_000, help="rows of generated data, e.g. 1e6")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--cardinality", type=int, default=1000)
+    parser.add_argument("--null-rate", type=float, default=0.01)
+    parser.add_argument("--whitespace-rate", type=float, default=0.05)
+    parser.add_argument("--only", default="", help="run only the cases whose name contains this text")
+    parser.add_argument("--history", default="benchmarks/history.json")
+    parser.add_argument("--threshold", type=float, default=0.2,
+                        help="relative slowdown or memory growth that counts as a regression")
+    parser.add_argument("--window", type=int, default=5, help="earlier runs the baseline is the median of")
+    parser.add_argument("--no-record", action="store_true", help="do not append this run to the history")
+    args = parser.parse_args()
+    rows = int(args.rows)
+
+    with tempfile.TemporaryDirectory() as workdir:
+        config = bench_config(workdir, ["bench"])
+        config["charts"]["workers"] = 0
+        write_people_csv(f"{config['inputs']}/bench.csv", rows, args.seed, cardinality=args.cardinality,
+                         null_rate=args.null_rate, whitespace_rate=args.whitespace_rate)
+
+        df = pd.read_csv(f"{config['inputs']}/bench.csv", **utils.Schema.read_options(config))
+        results = run_function_cases(df, config, args.repeat, args.only)
+        del df
+        results.update(run_stage_cases(config, rows, args.repeat, args.only))
+
+    host = platform.node()
+    history = load_history(args.history)
+    baseline_runs = [run for run in history if run["host"] == host and run["rows"] == rows][-args.window:]
+    comparison = find_regressions(results, baseline_runs, args.threshold)
+
+    print(f"{'case':<40}{'rows/s':>14}{'peak MB':>10}{'speed':>9}{'memory':>9}")
+    for name, result in results.items():
+        change = comparison.get(name)
+        deltas = f"{change['speed_change']:>+9.1%}{change['rss_change']:>+9.1%}" if change else f"{'-':>9}{'-':>9}"
+        flag = "  REGRESSED" if change and change["regressed"] else ""
+        print(f"{name:<40}{result['rows_per_sec']:>14,.0f}{result['peak_rss_mb']:>10.1f}{deltas}{flag}")
+
+    if not args.no_record:
+        history.append({
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "host": host,
+            "commit": git_commit(),
+            "rows": rows,
+            "results": results,
+        })
+        save_history(args.history, history)
+
+    regressed = [name for name, change in comparison.items() if change["regressed"]]
+    if regressed:
+        print(f"{len(regressed)} cases regressed by more than {args.threshold:.0%}: {', '.join(regressed)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -3,23 +3,30 @@
 """
 Main script for running the ETL (Extract, Transform, Load) pipeline.
 
-This script orchestrates the execution of a sequence of tasks (scripts) defined in a configuration file. It sets the working directory, loads the configuration, configures logging, and runs the ETL pipeline scripts in order. 
+This script orchestrates the execution of a sequence of stages registered by the modules in the `pipeline` package. It loads the configuration once, configures logging, and runs the ETL pipeline stages in order, keeping each file's data in memory between stages. The command line can limit a run to some of the stages (`--stages`) and input files (`--files`), and skip the quality charts (`--no-charts`). The pipeline modules, and the libraries they depend on, are only imported once the arguments are parsed, and the plotting libraries only when a chart is drawn.
 
 Functions included in the module:
 - **load_config(config_path: str)**: Loads the configuration from a YAML file to retrieve necessary settings for the pipeline.
 - **setup_logging(config: dict)**: Sets up the logging configuration, including logging to both the console and a log file.
-- **execute_script(script_path: str, task_name: str)**: Executes a given script and logs its success or failure.
-- **run_pipeline(scripts: list)**: Executes the entire ETL pipeline by running each task/script in the specified order.
-- **main()**: The main function that loads the configuration, sets the working directory, and runs the pipeline.
+- **run_pipeline(config: dict, stages: list, force: bool, report_path: str, files: list, selected: bool)**: Executes the ETL pipeline by running each stage in order, skipping unchanged files when incremental runs are enabled, and saves the JSON run report with the measurements of every stage.
+- **watch_inputs(config: dict, stages: list, report_prefix: str)**: Keeps the pipeline running, processing the CSV files as they land in the inputs directory until SIGTERM or SIGINT.
+- **parse_args(argv: list)**: Parses the command line.
+- **main(argv: list)**: The main function that parses the command line, loads the configuration, sets the working directory, and runs the pipeline once (exiting with status 1 when files were left out after an error) or in watch mode.
 
 Created on: Fri Jan 3 09:23:38 2025
 @author: DanielCheung
 """
 import os
+import sys
+import signal
 import logging
+import argparse
 import yaml
 from datetime import datetime
 
+# The pipeline modules import pandas and pyarrow; they are imported by the functions that run the pipeline,
+# so that `--help` and argument errors return at once
+
 def load_config(config_path: str):
     """Load configuration from a YAML file."""
     try:
@@ -34,7 +41,7 @@ def load_config(config_path: str):
 
 
 def setup_logging(config: dict):
-    """Set up logging configuration."""
+    """Set up logging configuration and return the path of the log file."""
     current_datetime = datetime.now().strftime("%Y%m%d_%H%M%S")
     log_file = os.path.join(
         os.getcwd(),
@@ -52,48 +59,88 @@ def setup_logging(config: dict):
             logging.FileHandler(log_file),  # Log to file
         ],
     )
+    return log_file
     
 
-def execute_script(script_path: str, task_name: str):
-    """Execute a script and logs its success or failure."""
-    logging.info(f"{task_name} started...")
-    try:
-        with open(script_path) as script_file:
-            exec(script_file.read())
-        logging.info(f"{task_name} completed successfully.")
-    except Exception as e:
-        logging.error(f"Error in {task_name}: {e}")
-        raise
-
-
-def run_pipeline(scripts: list):
-    """Run the ETL pipeline by executing each script."""
-    logging.info("Pipeline started...")
-
-    for script_path, task_name in scripts:
-        execute_script(script_path, task_name)
-
-    logging.info("Pipeline completed.")
-
-
-def main():
+def run_pipeline(config: dict, stages: list, force: bool = False, report_path: str = None, files: list = None,
+                 selected: bool = False):
+    """
+    Run the ETL pipeline by executing each stage in process, skipping unchanged files in incremental runs and writing the run report to `report_path`.
+
+    A run of `selected` stages writes a checkpoint of every file after each stage, so that a later run of the following stages picks the files up from there. It does not use the run manifest: every file is processed, and the manifest is left for the complete runs.
+    """
+    from utils.engine import PipelineRunner
+    from utils.manifest import RunManifest
+
+    manifest = None
+    if (config.get("incremental") or {}).get("enabled", False) and not selected:
+        manifest = RunManifest.from_config(config)
+    return PipelineRunner(config, stages, checkpoint=True if selected else None, manifest=manifest, force=force,
+                          report_path=report_path, files=files).run()
+
+
+def watch_inputs(config: dict, stages: list, report_prefix: str = None):
+    """Run the pipeline on the input files as they land until SIGTERM or SIGINT, writing a run report per batch to `{report_prefix}.batch-{n}.report.json`."""
+    from utils.watch import WatchDaemon
+
+    daemon = WatchDaemon(config, stages, report_prefix)
+    signal.signal(signal.SIGTERM, daemon.stop)
+    signal.signal(signal.SIGINT, daemon.stop)
+    daemon.run()
+
+
+def _names(value: str) -> list:
+    """Splits a comma-separated list of names."""
+    return [name.strip() for name in value.split(",") if name.strip()]
+
+
+def parse_args(argv: list = None):
+    """Parse the command line."""
+    parser = argparse.ArgumentParser(description="Run the CSV ETL pipeline.")
+    parser.add_argument("--config", default="config.yaml", help="the configuration file (default: %(default)s)")
+    parser.add_argument("--stages", type=_names, metavar="NAMES",
+                        help="comma-separated stages to run (e.g. extract,clean); a stage whose predecessor is left "
+                             "out reads the files from their last checkpoint")
+    parser.add_argument("--files", type=_names, metavar="NAMES",
+                        help="comma-separated input files to run, out of the config's csv_files (e.g. people_1)")
+    parser.add_argument("--no-charts", action="store_true",
+                        help="save the quality metrics without drawing their charts")
+    parser.add_argument("--force", action="store_true",
+                        help="reprocess every input file, even if it is unchanged since the last run")
+    parser.add_argument("--watch", action="store_true",
+                        help="keep running and process the CSV files as they land in the inputs directory")
+    args = parser.parse_args(argv)
+    if args.watch and args.files:
+        parser.error("--files cannot be used with --watch, which runs the files as they land")
+    return args
+
+
+def main(argv: list = None):
     """Load config, set the working directory, and run the pipeline."""
-    config = load_config("config.yaml")
-
-    # Set up logging
-    setup_logging(config)
-
-    # Define the scripts and their tasks
-    scripts = [
-        ("pipeline/01_extract.py", "Extract Data"),
-        ("pipeline/02_clean.py", "Clean Data"),
-        ("pipeline/03_process.py", "Process Data"),
-        ("pipeline/04_metrics.py", "Data Metrics"),
-        ("pipeline/05_output.py", "Output Results"),
-    ]
-
-    # Run the pipeline
-    run_pipeline(scripts)
+    args = parse_args(argv)
+    config = load_config(args.config)
+    if args.no_charts:
+        config["charts"] = dict(config.get("charts") or {}, enabled=False)
+
+    # Set up logging; the run report is saved next to the log file
+    log_file = setup_logging(config)
+    report_path = f"{os.path.splitext(log_file)[0]}.report.json"
+
+    # Register the stages defined in the pipeline package, in file order
+    from utils.engine import load_stages, select_stages
+    stages = load_stages("pipeline")
+    if args.stages:
+        stages = select_stages(stages, args.stages)
+
+    # Run the pipeline, or keep it running on the files landing in the inputs directory
+    if args.watch:
+        watch_inputs(config, stages, report_prefix=os.path.splitext(log_file)[0])
+    else:
+        context = run_pipeline(config, stages, force=args.force, report_path=report_path, files=args.files,
+                               selected=bool(args.stages))
+        # Files left out after an error are reported by a non-zero exit status
+        if context.failed:
+            sys.exit(1)
 
 if __name__ == "__main__":
     main()
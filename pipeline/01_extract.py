@@ -1,46 +1,53 @@
 # -*: utf-8 -*-
 """
-Extract and Prevalidate Script for ETL Pipeline.
+Extract and Prevalidate Stage for ETL Pipeline.
 
-This script is responsible for extracting CSV files from the source database, performing validation checks on the DataFrame according to the configuration, and saving the validated data to a temporary location in Parquet format.
+This stage is responsible for extracting CSV files from the source database and performing validation checks according to the configuration. Each file is validated from its header, and a sample of its rows, before it is loaded, so a file with the wrong columns is rejected without being parsed. The file is then read with the `variables` schema as explicit types and the `date_formats` as fixed date formats, instead of inferring the types. The DataFrame is handed to the next stage in memory, or, when streaming is enabled, yielded in batches of `streaming.batch_size` rows.
 
-The script does the following:
-- Loads the configuration from a YAML file to retrieve the list of CSV files and paths.
-- Reads each CSV file from the source directory.
-- Validates the extracted DataFrame based on the configuration using methods from the `utils` module.
-- Saves the validated DataFrame to a temporary directory in Parquet format.
+The stage does the following:
+- Validates the header and a sample of `validation.sample_rows` rows of each CSV file against the configuration (`PipelineContext.validate_input`), once per file and run.
+- Reads each CSV file from the source directory with the schema types, whole or in batches.
+- Accumulates the raw data quality metrics of each batch, for the metrics stage.
 
 Key functionalities:
-- **Validation**: Ensures the DataFrame’s column names, data types, and column count match the configuration.
-- **File Management**: Reads input files, processes them, and stores them in a specified output format (Parquet).
+- **Validation**: Ensures the file's column names, data types, and column count match the configuration before it is loaded.
+- **File Management**: Reads input files and passes them on to the cleaning stage.
 
 Dependencies:
-- pandas
-- yaml
-- logging
 - utils (custom utility module)
 """
 
-import yaml
-import pandas as pd
-import logging
 from utils import utils
+from utils.engine import register_stage
 
-# Retrieve config file
-with open(f"config.yaml") as f:
-    config = yaml.safe_load(f)
 
-# Read in the csv files
-for file in config["csv_files"]:
+def accumulated_batches(reader, quality):
+    """Yields the batches of a chunked CSV reader, accumulating their raw metrics."""
+    for batch in reader:
+        quality.update(batch)
+        yield batch
 
-    # Read in csv from source database
-    df = pd.read_csv(f"{config['inputs']}/{file}.csv")
 
-    # Perform all validations
-    logging.info(f"Validating {file}")
-    utils.DataFrameValidation.variable_names(df, config)
-    utils.DataFrameValidation.variable_types(df, config)
-    utils.DataFrameValidation.variable_count(df, config)
+@register_stage("extract", "Extract Data", scope="source", streamable=True)
+def extract(context, file):
+    """Validates the source CSV of a file, then reads it whole or as an iterator of batches when streaming."""
+    config = context.config
+
+    # Reject a malformed file before it is parsed (byte-range workers rely on the parent's validation)
+    context.validate_input(file)
+    read_options = utils.Schema.read_options(config)
+
+    # Raw quality metrics are collected while the file is read, so it is never read twice
+    context.reset_quality(file)
+    quality = context.quality_accumulator(file, "raw")
+
+    # Stream the csv from source database in bounded batches
+    if context.batch_size:
+        return accumulated_batches(
+            context.read_input(file, chunksize=context.batch_size, **read_options), quality)
+
+    # Read in csv from source database
+    df = context.read_input(file, **read_options)
+    quality.update(df)
 
-    # Save it to temp location
-    df.to_parquet(f"{config['temp']}/{file}.parquet")
+    return df
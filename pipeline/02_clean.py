@@ -1,42 +1,36 @@
 # -*- coding: utf-8 -*-
 """
-Data Cleaning Script for ETL Pipeline.
+Data Cleaning Stage for ETL Pipeline.
 
-This script is responsible for performing data cleaning tasks on the extracted and prevalidated data. It reads Parquet files from the temporary storage, applies various cleaning methods, and then saves the cleaned data back to the same location in Parquet format.
+This stage is responsible for performing data cleaning tasks on the extracted and prevalidated data. It receives each file's DataFrame from the extract stage and applies various cleaning methods.
 
-The script performs the following tasks:
-- Loads the configuration from a YAML file to retrieve the list of CSV files and paths.
-- Reads Parquet files from the temporary storage.
-- Applies cleaning operations such as converting specified columns to uppercase and removing whitespaces from all columns.
-- Saves the cleaned DataFrame to the same temporary location.
+The stage performs the following tasks:
+- Applies cleaning operations such as converting specified columns to uppercase and removing whitespaces from all columns except the parsed dates.
+- Runs them with the engine set in `cleaning.engine` of the config (`python` or vectorised `arrow` kernels).
 
 Key functionalities:
 - **Data Cleaning**: Converts specified columns to uppercase and removes whitespaces from all columns.
-- **File Management**: Reads data from temporary storage, processes it, and saves the cleaned data.
 
 Dependencies:
 - pandas
-- yaml
 - utils (custom utility module)
 """
 
-import yaml
 import pandas as pd
 from utils import utils
+from utils.engine import register_stage
 
-# Retrieve config file
-with open(f"config.yaml") as f:
-    config = yaml.safe_load(f)
 
-# Read in the csv files
-for file in config["csv_files"]:
-
-    # Read in csv from temp database
-    df = pd.read_parquet(f"{config['temp']}/{file}.parquet")
+@register_stage("clean", "Clean Data", streamable=True)
+def clean(context, file, df):
+    """Applies the cleaning methods to a file's DataFrame."""
+    config = context.config
+    engine = (config.get("cleaning") or {}).get("engine", "python")
 
     # Perform all cleaning methods
-    df = utils.Cleaning.convert_columns_uppercase(df, config["uppercase"])
-    df = utils.Cleaning.remove_whitespaces(df)
+    df = utils.Cleaning.convert_columns_uppercase(df, config["uppercase"], engine=engine)
+    # Dates are parsed on read, so only the other columns hold text to clean
+    text_columns = [column for column in df.columns if not pd.api.types.is_datetime64_any_dtype(df[column])]
+    df = utils.Cleaning.remove_whitespaces(df, engine=engine, columns=text_columns)
 
-    # Save it to the temp location
-    df.to_parquet(f"{config['temp']}/{file}.parquet")
+    return df
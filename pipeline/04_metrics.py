@@ -1,73 +1,95 @@
 # -*- coding: utf-8 -*-
 """
-Metrics and Monitoring Script for ETL Pipeline.
+Metrics and Monitoring Stage for ETL Pipeline.
 
-This script calculates and visualizes data quality metrics for both raw and processed datasets in the ETL pipeline. It reads CSV files from the source database and Parquet files from temporary storage, then computes various data quality metrics, generates visualizations (charts), and saves the results to designated output locations.
+These stages report and visualize data quality metrics for both raw and processed datasets in the ETL pipeline. The metrics are accumulated batch by batch while the extract and process stages handle each file, so the raw CSV files are not read a second time; the stages then generate visualizations (charts) and save the results to designated output locations. The raw metrics of a file only depend on its extraction, so with the stage scheduler they are reported while the file is cleaned and processed.
 
-The script performs the following tasks:
-- Loads the configuration from a YAML file to retrieve the list of CSV files.
-- Reads raw CSV files and processed Parquet files.
-- Calculates data quality metrics such as null counts, distinct values, and character lengths using the QualityMetrics utility.
-- Generates visualizations (charts) for both raw and processed data quality metrics.
-- Saves both the data quality metrics and visualizations to appropriate directories for future analysis.
+The stages perform the following tasks:
+- Takes the raw and processed quality metrics accumulated by the earlier stages (`utils.quality.QualityAccumulator`). When those stages did not run in this process (e.g. when resuming), the metrics are accumulated in a single batched pass over the raw CSV and the processed checkpoint (Parquet or memory-mapped Arrow IPC).
+- Reports data quality metrics such as null counts, distinct values (exact or approximate), and minimum, maximum and mean character lengths.
+- Queues visualizations (charts) for both raw and processed data quality metrics with the background chart renderer (`utils.render.ChartRenderer`), which reuses the charts of metrics unchanged since an earlier run. Charts are skipped with `charts.enabled: false` (`main.py --no-charts`).
+- Saves both the data quality metrics and visualizations to appropriate directories for future analysis, and appends the metrics to the history of every run (`utils.metrics_store.MetricsStore`) when `metrics_history` is enabled. When the outputs are on S3 they are written to local staging copies and uploaded by the storage backend of the run: the metrics at once and the charts when the run closes, once they are drawn.
 
 Key functionalities:
-- **Data Quality Calculation**: Computes various metrics like null percentage, distinct count, and character lengths for both raw and processed datasets.
-- **Visualization**: Generates charts for raw and processed data quality metrics and saves them for reporting and analysis.
-- **File Management**: Reads data from both source and temporary storage, processes it, and saves the quality metrics and visualizations to the designated output locations.
+- **Data Quality Calculation**: Reports various metrics like null percentage, distinct count, and character lengths for both raw and processed datasets.
+- **Visualization**: Generates charts for raw and processed data quality metrics off the critical path and saves them for reporting and analysis.
+- **File Management**: Saves the quality metrics and visualizations to the designated output locations.
+- **History**: Records the metrics of every run in a compacted store, for time series and drift queries.
 
 Dependencies:
 - pandas
-- yaml
+- pyarrow
+- os
 - logging
 - datetime
 - utils (custom utility module)
 """
 
-import yaml
-import pandas as pd
+import os
 import logging
 from datetime import datetime
 from utils import utils
+from utils.engine import register_stage
+from utils.streaming import find_intermediate, iter_intermediate_batches
 
 
-# Retrieve config file
-with open(f"config.yaml") as f:
-    config = yaml.safe_load(f)
-
-# Read in the csv files
-for file in config["csv_files"]:
-
-    # Read in csv from database
-    df_source = pd.read_csv(f"{config['inputs']}/{file}.csv")
-    df_processed = pd.read_parquet(f"{config['temp']}/{file}.parquet")
-
-    # Perform all metrics methods
-    quality_df_input = utils.QualityMetrics.calculate_data_quality(df_source)
-    quality_df_processed = utils.QualityMetrics.calculate_data_quality(
-        df_processed
-    )
-
-    # Perform all visualisation methods (e.g. charts)
-    logging.info(f"Generating charts for {file}")
-    utils.QualityMetrics.plot_quality_metrics(
-        quality_df_input,
-        save_directory=f"{config['outputs']
-                          }/quality_metrics/raw/charts/{file}_raw",
-    )
-    utils.QualityMetrics.plot_quality_metrics(
-        quality_df_processed,
-        save_directory=f"{
-            config['outputs']}/quality_metrics/processed/charts/{file}_processed",
-    )
-
-    # Save it to temp location
-    current_datetime = datetime.now().strftime("%Y%m%d_%H%M%S")
-    quality_df_input.to_parquet(
-        f"{config['outputs']
-           }/quality_metrics/raw/{file}_raw_{current_datetime}.parquet"
-    )
-    quality_df_processed.to_parquet(
-        f"{config['outputs']}/quality_metrics/processed/{
-            file}_processed_{current_datetime}.parquet"
-    )
+def save_metrics(context, file, kind, quality_df):
+    """Queues the chart of a file's raw or processed quality metrics and saves the metrics."""
+    config = context.config
+    metrics_dir = f"{config['outputs']}/quality_metrics"
+    local_dir = context.storage.local_path(metrics_dir)
+
+    # Queue the visualisation (e.g. chart); it is drawn in the background and reused when unchanged
+    if (config.get("charts") or {}).get("enabled", True):
+        logging.info(f"Queueing {kind} chart for {file}")
+        chart = context.chart_renderer.submit(
+            quality_df,
+            save_directory=f"{local_dir}/{kind}/charts/{file}_{kind}",
+        )
+        # Charts are stored once drawn, when the run closes
+        context.uploads.append(f"{metrics_dir}/{kind}/charts/{file}_{kind}/{os.path.basename(chart)}")
+
+    # Save it to the metrics location
+    run_time = datetime.now().replace(microsecond=0)
+    current_datetime = run_time.strftime("%Y%m%d_%H%M%S")
+    os.makedirs(f"{local_dir}/{kind}", exist_ok=True)
+    metrics_path = f"{metrics_dir}/{kind}/{file}_{kind}_{current_datetime}.parquet"
+    quality_df.to_parquet(context.storage.local_path(metrics_path))
+    context.storage.publish([metrics_path])
+
+    # Append it to the metrics history, queried across runs without loading every summary
+    if context.metrics_store is not None:
+        context.metrics_store.record(file, kind, quality_df, run_time)
+
+
+@register_stage("raw_metrics", "Raw Data Metrics", depends_on=("extract",))
+def raw_metrics(context, file, df):
+    """Calculates, charts and saves the raw quality metrics of a file, alongside the cleaning of the file."""
+    # Metrics accumulated by the extract stage, or a single pass when it did not run
+    if (file, "raw") not in context.quality:
+        logging.info(f"Accumulating raw metrics for {file}")
+        quality = context.quality_accumulator(file, "raw")
+        read_options = utils.Schema.read_options(context.config)
+        for batch in context.read_input(file, chunksize=context.batch_size or 100000, **read_options):
+            quality.update(batch)
+
+    save_metrics(context, file, "raw", context.quality_accumulator(file, "raw").to_frame())
+    # The table is left as it is for the stages running alongside
+    return None
+
+
+@register_stage("metrics", "Data Metrics", depends_on=("process",))
+def metrics(context, file, df):
+    """Calculates, charts and saves the processed quality metrics of a file."""
+    # Metrics accumulated by the process stage, or a single pass when it did not run
+    if (file, "processed") not in context.quality:
+        quality = context.quality_accumulator(file, "processed")
+        if df is not None:
+            quality.update(df)
+        else:
+            for batch in iter_intermediate_batches(find_intermediate(context.config, file)):
+                quality.update(batch.to_pandas())
+
+    save_metrics(context, file, "processed", context.quality_accumulator(file, "processed").to_frame())
+    # The table is left as it is for the output stage running alongside
+    return None
@@ -1,28 +1,44 @@
 # -*- coding: utf-8 -*-
 """
-Outputting Script for ETL Pipeline.
+Outputting Stage for ETL Pipeline.
 
-This script is responsible for formatting and saving the processed data into a final Parquet file after all necessary transformations have been applied in the ETL pipeline. It reads configuration details from a YAML file and then invokes the appropriate methods to handle the output process.
+This stage is responsible for formatting and saving the processed data into a final Parquet file after all necessary transformations have been applied in the ETL pipeline. It takes the processed DataFrames of every file from the run context and invokes the appropriate methods to handle the output process.
 
-The script performs the following tasks:
-- Loads the configuration from a YAML file to retrieve paths for CSV files, output directories, and partition columns.
-- Invokes the `format_and_save_parquet` method from the `utils.Output` utility to process and save the data.
+The stage performs the following tasks:
+- Invokes the `format_and_save_parquet` method from the `utils.Output` utility with the in-memory DataFrames, or with the temp Parquet files when the files were streamed.
+- In incremental runs, replaces only the output fragments of the changed files (and deletes those of files no longer in the inputs), recording the fragments written for the run manifest.
+- Writes to local directories or to S3 through the storage backend of the run (`context.storage`).
 
 Key functionalities:
-- **Format and Save Parquet**: This method processes multiple Parquet files, combines them into one, and saves the output to the final location with partitioning if specified in the configuration.
+- **Format and Save Parquet**: This method streams the processed DataFrames, batch by batch, to the final location with partitioning if specified in the configuration, as a new snapshot, by appending or by overwriting the affected partitions.
 
 Dependencies:
-- yaml
 - utils (custom utility module)
 """
 
 
-import yaml
 from utils import utils
-
-# Retrieve config file
-with open(f"config.yaml") as f:
-    config = yaml.safe_load(f)
-
-# Perform all formatting / saving methods
-utils.Output.format_and_save_parquet(config)
+from utils.engine import register_stage
+
+
+@register_stage("output", "Output Results", scope="run", depends_on=("process",))
+def output(context):
+    """Writes the processed DataFrames to the final asset."""
+    # Streamed files stay in temp and are written from there batch by batch
+    if all(context.in_memory(file) for file in context.files):
+        dataframes = [context.table(file) for file in context.files]
+    else:
+        dataframes = None
+
+    if context.manifest is None:
+        # Perform all formatting / saving methods
+        utils.Output.format_and_save_parquet(context.config, dataframes, context.files, storage=context.storage)
+        return
+
+    # Incremental runs update the output in place: drop the files no longer in the inputs, then rewrite the changed ones
+    for file in context.manifest.removed_files(context.config["csv_files"]):
+        utils.Output.remove_fragments(context.config, file, context.storage)
+    fragments = utils.Output.format_and_save_parquet(context.config, dataframes, context.files, incremental=True,
+                                                     storage=context.storage)
+    for file, paths in fragments.items():
+        context.artifacts.setdefault(file, {})["output"] = paths
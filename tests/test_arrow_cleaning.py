@@ -0,0 +1,69 @@
+"""
+Unit Tests for the Arrow Cleaning Engine (utils.arrow_cleaning).
+
+The tests check that the `arrow` cleaning engine gives the same results as the `python` engine, including on missing values, integers, floats, bytes and non-ASCII text, and that clean columns are returned unchanged.
+
+Dependencies:
+- utils (custom utility module)
+- pytest
+- pandas
+"""
+
+import numpy as np
+from utils import utils
+from utils import arrow_cleaning
+import pytest
+import pandas as pd
+
+
+@pytest.fixture
+def messy_dataframe():
+    return pd.DataFrame({
+        "ascii": [" A l i c e  ", "bo\tb\n", None, "Char-lie!", "\x1cx\x0by\x1f", ""],
+        "unicode": ["Zoë ", "straße", "a b", np.nan, "　日本 ", "naïve café"],
+        "number": [1, -20, 300, 4, 5, 6],
+        "real": [1.0, 2.5, np.nan, 1e16, -0.0, 3.0],
+        "mixed": ["a b", 1, b"x y", None, 2.5, True],
+    })
+
+
+def test_arrow_engine_matches_python_engine(messy_dataframe):
+    for column in messy_dataframe.columns:
+        python = utils.Cleaning.remove_special_characters(messy_dataframe.copy(), column)[column]
+        arrow = utils.Cleaning.remove_special_characters(messy_dataframe.copy(), column, engine="arrow")[column]
+        assert arrow.tolist() == python.tolist(), column
+
+    columns = list(messy_dataframe.columns)
+    python = utils.Cleaning.convert_columns_uppercase(messy_dataframe.copy(), columns)
+    arrow = utils.Cleaning.convert_columns_uppercase(messy_dataframe.copy(), columns, engine="arrow")
+    assert arrow.astype(object).equals(python)
+
+    python = utils.Cleaning.remove_whitespaces(messy_dataframe.copy())
+    arrow = utils.Cleaning.remove_whitespaces(messy_dataframe.copy(), engine="arrow")
+    assert arrow.astype(object).equals(python)
+
+    with pytest.raises(ValueError):
+        utils.Cleaning.remove_whitespaces(messy_dataframe, engine="rust")
+
+
+def test_existing_cleaning_cases_with_arrow_engine():
+    df = pd.DataFrame({"col1": [" A l i c e  "], "col2": [" B o b "]})
+    assert utils.Cleaning.remove_whitespaces(df, engine="arrow").iloc[0].tolist() == ["Alice", "Bob"]
+
+    df = pd.DataFrame({"name": ["A!lice", "Bo@b", "Charl#ie"]})
+    assert utils.Cleaning.remove_special_characters(df, "name", engine="arrow")["name"].tolist() == ["Alice", "Bob", "Charlie"]
+
+    df = pd.DataFrame({"name": ["alice", "bob", "charlie"]})
+    assert utils.Cleaning.convert_columns_uppercase(df, ["name"], engine="arrow")["name"].tolist() == ["ALICE", "BOB", "CHARLIE"]
+
+
+def test_unchanged_values_are_kept():
+    clean = pd.Series(["ALICE", "BOB", "CAROL"])
+    assert arrow_cleaning.remove_whitespaces(clean) is clean
+    assert arrow_cleaning.convert_uppercase(clean) is clean
+    assert arrow_cleaning.remove_special_characters(clean) is clean
+
+    dirty = pd.Series(["ALICE", "B OB", None])
+    cleaned = arrow_cleaning.remove_whitespaces(dirty)
+    assert cleaned.dtype == object and cleaned.tolist() == ["ALICE", "BOB", "None"]
+    assert cleaned[0] is dirty[0]
@@ -0,0 +1,50 @@
+"""
+Unit Tests for the Benchmark Data Generator and Regression Check (benchmarks).
+
+The tests cover the determinism and the tuning knobs of the synthetic data generator, and the detection of regressions against the benchmark history.
+
+Dependencies:
+- benchmarks (benchmark scripts)
+- pytest
+- pandas
+"""
+
+from benchmarks import generator, suite
+import pandas as pd
+import yaml
+
+
+def test_generator_is_deterministic_and_follows_config(tmp_path):
+    with open("config.yaml") as f:
+        variables = yaml.safe_load(f)["variables"]
+    rows = generator.CHUNK_ROWS + 500
+    kwargs = dict(cardinality={"Job Title": 40}, null_rate=0.1, whitespace_rate=0.2)
+
+    path = tmp_path / "people.csv"
+    generator.write_people_csv(str(path), rows, seed=3, **kwargs)
+    df = pd.read_csv(path)
+
+    assert list(df.columns) == list(variables)
+    assert len(df) == rows
+    assert df["User Id"].is_unique and df["User Id"].notna().all()
+    assert 0.08 < df["Sex"].isna().mean() < 0.12
+    assert df["Job Title"].str.strip().str.replace(" ", "").nunique() == 40
+    assert (df["First Name"].str.strip() != df["First Name"]).any()
+
+    pd.testing.assert_frame_equal(generator.generate_frame(rows, seed=3, **kwargs).iloc[-500:].reset_index(drop=True),
+                                  generator.generate_chunk(generator.CHUNK_ROWS, 500, seed=3, **kwargs))
+    assert not generator.generate_frame(100, seed=4).equals(generator.generate_frame(100, seed=3))
+
+
+def test_find_regressions_uses_median_baseline():
+    baseline = [{"results": {"case": {"rows_per_sec": speed, "peak_rss_mb": 100.0}}} for speed in (90, 100, 1000)]
+
+    steady = suite.find_regressions({"case": {"rows_per_sec": 85, "peak_rss_mb": 110.0}}, baseline, 0.2)
+    assert not steady["case"]["regressed"]
+
+    slower = suite.find_regressions({"case": {"rows_per_sec": 75, "peak_rss_mb": 100.0}}, baseline, 0.2)
+    assert slower["case"]["regressed"]
+
+    larger = suite.find_regressions({"case": {"rows_per_sec": 100, "peak_rss_mb": 130.0}}, baseline, 0.2)
+    assert larger["case"]["regressed"]
+    assert suite.find_regressions({"new_case": {"rows_per_sec": 1, "peak_rss_mb": 1.0}}, baseline, 0.2) == {}
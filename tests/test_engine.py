@@ -0,0 +1,142 @@
+"""
+Unit Tests for the Stage Engine (utils.engine).
+
+The tests cover stage registration, the metrics stages leaving the tables to the output stage, in-memory hand-off of DataFrames between stages, opt-in checkpoints in either intermediate format, resuming a run from a later stage and running selected stages and files.
+
+Dependencies:
+- utils (custom utility module)
+- pytest
+- pandas
+"""
+
+import os
+from utils import engine
+import pytest
+import pandas as pd
+
+
+@pytest.fixture
+def run_config(tmp_path):
+    salt_dir = tmp_path / "salt"
+    salt_dir.mkdir()
+    (salt_dir / "salt.txt").write_text("12345")
+    return {
+        "csv_files": ["people_a", "people_b"],
+        "temp": str(tmp_path / "temp"),
+        "salt": str(salt_dir),
+    }
+
+
+@pytest.fixture
+def stages():
+    def source(context, file):
+        return pd.DataFrame({"value": [1, 2, 3], "file": file})
+
+    def double(context, file, df):
+        df["value"] = df["value"] * 2
+        return df
+
+    collected = {}
+
+    def collect(context):
+        collected.update({file: context.table(file) for file in context.files})
+
+    return collected, [
+        engine.Stage("extract", "Extract Data", source, scope="source"),
+        engine.Stage("double", "Double Data", double),
+        engine.Stage("collect", "Collect Results", collect, scope="run"),
+    ]
+
+
+def test_register_stage_keeps_order_and_replaces():
+    before = engine.registered_stages()
+    try:
+        engine.register_stage("test_a", "Test A")(lambda context, file, df: df)
+        engine.register_stage("test_b", "Test B", scope="run")(lambda context: None)
+        engine.register_stage("test_a", "Test A again")(lambda context, file, df: df)
+
+        names = [stage.name for stage in engine.registered_stages()]
+        assert names[-2:] == ["test_a", "test_b"]
+        assert engine.registered_stages()[-2].task_name == "Test A again"
+    finally:
+        engine._REGISTRY[:] = before
+
+    with pytest.raises(ValueError):
+        engine.register_stage("test_c", "Test C", scope="batch")
+
+
+def test_load_stages_follows_module_order():
+    names = [stage.name for stage in engine.load_stages("pipeline")]
+    assert names == ["extract", "clean", "process", "raw_metrics", "metrics", "output"]
+
+
+def test_stages_alongside_the_output_leave_the_table(run_config, tmp_path):
+    # The metrics stages run while the output stage reads the tables and checkpoints, so they must not replace them
+    stages = {stage.name: stage for stage in engine.load_stages("pipeline")}
+    context = engine.PipelineContext(dict(run_config, outputs=str(tmp_path / "outputs"), charts={"enabled": False}))
+    df = pd.DataFrame({"value": [1, 2, 3]})
+    context.quality_accumulator("people_a", "processed").update(df)
+    assert stages["metrics"].func(context, "people_a", df) is None
+    assert len(os.listdir(tmp_path / "outputs" / "quality_metrics" / "processed")) == 1
+
+
+def test_runner_keeps_tables_in_memory(run_config, stages):
+    collected, stage_list = stages
+    engine.PipelineRunner(run_config, stage_list).run()
+
+    assert collected["people_b"]["value"].tolist() == [2, 4, 6]
+    assert not os.path.exists(run_config["temp"])
+
+
+def test_runner_checkpoints_and_resumes(run_config, stages):
+    collected, stage_list = stages
+    engine.PipelineRunner(run_config, stage_list, checkpoint=True).run()
+    assert os.path.exists(f"{run_config['temp']}/people_a.parquet")
+
+    engine.PipelineRunner(run_config, stage_list, resume_from="double").run()
+    assert collected["people_a"]["value"].tolist() == [4, 8, 12]
+
+    with pytest.raises(ValueError):
+        engine.PipelineRunner(run_config, stage_list, resume_from="missing")
+
+
+def test_checkpoints_switch_intermediate_format(run_config, stages):
+    collected, stage_list = stages
+    engine.PipelineRunner(run_config, stage_list, checkpoint=True).run()
+
+    # A checkpoint of the other format is still resumed from, and replaced by the next checkpoint
+    arrow_config = dict(run_config, intermediate={"format": "arrow"})
+    context = engine.PipelineRunner(arrow_config, stage_list, resume_from="double").run()
+    assert collected["people_a"]["value"].tolist() == [4, 8, 12]
+    assert context.read_checkpoint("people_a", ["value"]).column_names == ["value"]
+
+    engine.PipelineRunner(arrow_config, stage_list, checkpoint=True).run()
+    assert sorted(os.listdir(run_config["temp"])) == ["people_a.arrow", "people_b.arrow"]
+
+    with pytest.raises(ValueError):
+        engine.PipelineContext(dict(run_config, intermediate={"format": "csv"})).checkpoint_path("people_a")
+
+
+def test_runner_selects_stages_and_files(run_config, stages):
+    collected, stage_list = stages
+    engine.PipelineRunner(run_config, engine.select_stages(stage_list, ["extract"]), checkpoint=True,
+                          files=["people_b"]).run()
+    assert os.listdir(run_config["temp"]) == ["people_b.parquet"]
+
+    # The selected stages after the left-out ones pick the files up from their checkpoints
+    context = engine.PipelineRunner(run_config, engine.select_stages(stage_list, ["collect", "double"]),
+                                    files=["people_b"]).run()
+    assert context.files == ["people_b"]
+    assert list(collected) == ["people_b"] and collected["people_b"]["value"].tolist() == [2, 4, 6]
+
+    with pytest.raises(ValueError):
+        engine.select_stages(stage_list, ["extract", "missing"])
+    with pytest.raises(ValueError):
+        engine.PipelineRunner(run_config, stage_list, files=["people_c"])
+
+
+def test_context_reads_salt_once(run_config):
+    context = engine.PipelineContext(run_config)
+    assert context.salt == "12345"
+    os.remove(f"{run_config['salt']}/salt.txt")
+    assert context.salt == "12345"
@@ -0,0 +1,123 @@
+"""
+Unit Tests for the Run Instrumentation (utils.instrumentation).
+
+The tests cover the JSON run report with a step per stage and per file, the report of a failed run, and the opt-in stage profiling, including fused stage names and profiled steps running side by side.
+
+Dependencies:
+- utils (custom utility module)
+- pytest
+- pandas
+"""
+
+import os
+import json
+import pstats
+import threading
+from utils import engine
+from utils.instrumentation import StageProfiler
+import pytest
+import pandas as pd
+
+
+@pytest.fixture
+def run_config(tmp_path):
+    salt_dir = tmp_path / "salt"
+    salt_dir.mkdir()
+    (salt_dir / "salt.txt").write_text("12345")
+    return {
+        "csv_files": ["people_a", "people_b"],
+        "temp": str(tmp_path / "temp"),
+        "salt": str(salt_dir),
+    }
+
+
+def source(context, file):
+    return pd.DataFrame({"value": range(10)})
+
+
+def drop_odd(context, file, df):
+    return df[df["value"] % 2 == 0]
+
+
+def test_run_report_has_a_step_per_stage_and_file(run_config, tmp_path):
+    stages = [
+        engine.Stage("extract", "Extract Data", source, scope="source"),
+        engine.Stage("filter", "Filter Data", drop_odd),
+    ]
+    report_path = str(tmp_path / "run.report.json")
+    engine.PipelineRunner(run_config, stages, report_path=report_path).run()
+
+    with open(report_path) as f:
+        report = json.load(f)
+    assert report["status"] == "completed"
+    assert report["files"] == ["people_a", "people_b"]
+
+    steps = {(step["stage"], step["file"]): step for step in report["steps"]}
+    assert steps[("filter", "people_a")]["rows_in"] == 10
+    assert steps[("filter", "people_a")]["rows_out"] == 5
+    assert steps[("filter", None)]["rows_out"] == 10
+    assert steps[("extract", "people_b")]["rows_out"] == 10
+    for step in report["steps"]:
+        assert step["status"] == "completed"
+        assert step["wall_seconds"] >= 0 and step["peak_rss_bytes"] > 0
+
+
+def test_failed_run_is_reported(run_config, tmp_path):
+    def fail(context, file, df):
+        raise RuntimeError("broken input")
+
+    stages = [
+        engine.Stage("extract", "Extract Data", source, scope="source"),
+        engine.Stage("fail", "Fail", fail),
+    ]
+    report_path = str(tmp_path / "run.report.json")
+    with pytest.raises(RuntimeError):
+        engine.PipelineRunner(run_config, stages, report_path=report_path).run()
+
+    with open(report_path) as f:
+        report = json.load(f)
+    assert report["status"] == "failed"
+    assert "broken input" in report["error"]
+    assert [step["status"] for step in report["steps"] if step["stage"] == "fail"] == ["failed", "failed"]
+
+
+def test_stage_profiler(tmp_path):
+    directory = str(tmp_path / "profiles")
+    disabled = StageProfiler({"profiling": {"mode": "none"}})
+    with disabled.profile("process"):
+        pass
+    assert not os.path.exists(directory)
+
+    profiler = StageProfiler({"profiling": {"mode": "cprofile", "stages": ["process"], "directory": directory}}, "run")
+    with profiler.profile("process"):
+        sum(range(1000))
+    with profiler.profile("output"):
+        pass
+    assert os.listdir(directory) == ["run_process.prof"]
+    assert pstats.Stats(f"{directory}/run_process.prof").total_calls > 0
+
+    # A fused streamed task is profiled when one of its stages is selected
+    with profiler.profile("extract+clean+process"):
+        pass
+    assert os.path.exists(f"{directory}/run_extract+clean+process.prof")
+
+    with pytest.raises(ValueError):
+        StageProfiler({"profiling": {"mode": "perf"}})
+
+
+def test_profiled_steps_run_side_by_side(tmp_path):
+    directory = str(tmp_path / "profiles")
+    profiler = StageProfiler({"profiling": {"mode": "cprofile", "directory": directory}}, "run")
+    both_running = threading.Barrier(2, timeout=5)
+
+    def step(file):
+        with profiler.profile("process", file):
+            both_running.wait()
+
+    threads = [threading.Thread(target=step, args=(file,)) for file in ("people_a", "people_b")]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert not both_running.broken
+    assert sorted(os.listdir(directory)) == ["run_process_people_a.prof", "run_process_people_b.prof"]
@@ -0,0 +1,147 @@
+"""
+Unit Tests for the Key Index (utils.key_index).
+
+The tests cover deduplication within a file and across the files of a snapshot, upserts of keys written again by later incremental runs, dropping the keys of removed files, writing back the rows a changed or removed file had replaced, and rebuilding a missing index from the output dataset, locally and on S3.
+
+Dependencies:
+- utils (custom utility module)
+- pytest
+- pandas
+- moto (optional)
+"""
+
+import os
+from utils import utils
+from utils.key_index import KeyIndex
+from utils.storage import S3Storage
+import pytest
+import pandas as pd
+
+BUCKET = "etl-bucket"
+
+
+@pytest.fixture
+def output_config(tmp_path):
+    return {
+        "csv_files": ["people_a", "people_b"],
+        "outputs": str(tmp_path / "outputs"),
+        "temp": str(tmp_path / "temp"),
+        "partition_columns": ["Year of birth"],
+        "output_asset_name": "patients",
+        "dedup": {"key": "User Id"},
+    }
+
+
+def people(ids, year, job):
+    return pd.DataFrame({"User Id": ids, "Year of birth": year, "Job Title": job})
+
+
+def read_output(path):
+    df = pd.read_parquet(path)
+    return {row["User Id"]: row["Job Title"] for _, row in df.iterrows()}, len(df)
+
+
+def test_snapshot_keeps_last_row_of_each_key(output_config):
+    dataframes = [
+        people(["A", "B", "A", None, None], [1990, 1990, 1991, 1990, 1990], ["a1", "b1", "a2", "n1", "n2"]),
+        people(["B", "C"], 1992, ["b2", "c1"]),
+    ]
+    utils.Output.format_and_save_parquet(output_config, dataframes)
+    [snapshot] = [name for name in os.listdir(output_config["outputs"]) if name.endswith(".parquet")]
+
+    rows, count = read_output(f"{output_config['outputs']}/{snapshot}")
+    assert count == 5
+    assert {key: job for key, job in rows.items() if key is not None} == {"A": "a2", "B": "b2", "C": "c1"}
+    # Snapshots are deduplicated on their own, without a persistent index
+    assert not os.path.exists(f"{output_config['outputs']}/patients.keys.sqlite")
+
+    with pytest.raises(ValueError):
+        utils.Output.format_and_save_parquet(dict(output_config, output={"mode": "overwrite_partition"}), dataframes)
+
+
+def test_incremental_upserts_and_rebuild(output_config):
+    output_path = utils.Output.incremental_output_path(output_config)
+    utils.Output.format_and_save_parquet(
+        output_config, [people(["A", "B"], 1990, ["a1", "b1"]), people(["C", "D"], 1991, ["c1", "d1"])],
+        incremental=True)
+    utils.Output.format_and_save_parquet(
+        output_config, [people(["B", "C", "E"], [1990, 1992, 1992], ["b2", "c2", "e1"])], ["people_c"],
+        incremental=True)
+
+    rows, count = read_output(output_path)
+    assert count == 5 and rows == {"A": "a1", "B": "b2", "C": "c2", "D": "d1", "E": "e1"}
+    index = KeyIndex.from_config(output_config, output_path)
+    assert len(index) == 5
+    assert index.locate(["C", "Z"]) == {"C": ("Year of birth=1992/people_c-0.parquet", 0)}
+    index.close()
+
+    # A missing index is rebuilt from the output, then keeps deduplicating
+    os.remove(f"{output_config['outputs']}/patients.keys.sqlite")
+    utils.Output.format_and_save_parquet(output_config, [people(["A"], 1990, ["a2"])], ["people_d"], incremental=True)
+    rows, count = read_output(output_path)
+    assert count == 5 and rows["A"] == "a2"
+
+    # The keys of removed files are dropped, so they are written again as new keys
+    utils.Output.remove_fragments(output_config, "people_c")
+    index = KeyIndex.from_config(output_config, output_path)
+    assert sorted(index.locate(["A", "B", "C", "D", "E"])) == ["A", "D"]
+    index.close()
+
+
+def test_rows_replaced_by_a_changed_or_removed_file_are_restored(output_config):
+    output_path = utils.Output.incremental_output_path(output_config)
+    utils.Output.format_and_save_parquet(
+        output_config, [people(["K1", "K2"], 1990, ["a1", "a2"]), people(["K1", "K3"], [1990, 1991], ["b1", "b3"])],
+        incremental=True)
+    rows, count = read_output(output_path)
+    assert count == 3 and rows == {"K1": "b1", "K2": "a2", "K3": "b3"}
+
+    # The changed file no longer holds K1: the row of people_a is back
+    utils.Output.format_and_save_parquet(output_config, [people(["K3"], 1991, ["b3"])], ["people_b"], incremental=True)
+    rows, count = read_output(output_path)
+    assert count == 3 and rows == {"K1": "a1", "K2": "a2", "K3": "b3"}
+
+    # A chain of replaced rows is unwound file by file
+    for file, job in (("people_c", "c1"), ("people_d", "d1")):
+        utils.Output.format_and_save_parquet(output_config, [people(["K1"], 1992, [job])], [file], incremental=True)
+    utils.Output.remove_fragments(output_config, "people_c")
+    assert read_output(output_path) == ({"K1": "d1", "K2": "a2", "K3": "b3"}, 3)
+    utils.Output.remove_fragments(output_config, "people_d")
+    assert read_output(output_path) == ({"K1": "a1", "K2": "a2", "K3": "b3"}, 3)
+
+    # The restored row belongs to its file again, and goes with it
+    utils.Output.remove_fragments(output_config, "people_a")
+    assert read_output(output_path) == ({"K3": "b3"}, 1)
+    index = KeyIndex.from_config(output_config, output_path)
+    assert list(index.locate(["K1", "K2", "K3"])) == ["K3"]
+    assert index.connection.execute("SELECT COUNT(*) FROM replaced_batches").fetchone()[0] == 0
+    index.close()
+
+
+def test_upserts_on_s3(output_config, monkeypatch, tmp_path):
+    moto = pytest.importorskip("moto")
+    for name, value in (("AWS_ACCESS_KEY_ID", "testing"), ("AWS_SECRET_ACCESS_KEY", "testing"),
+                        ("AWS_DEFAULT_REGION", "us-east-1")):
+        monkeypatch.setenv(name, value)
+    with moto.mock_aws():
+        import boto3
+        boto3.client("s3").create_bucket(Bucket=BUCKET)
+        config = dict(output_config, outputs=f"s3://{BUCKET}/outputs")
+        storage = S3Storage(str(tmp_path / "cache"))
+        for batch, (ids, jobs) in enumerate(((["A", "B"], ["a1", "b1"]), (["B"], ["b2"]), (["A", "B"], ["a3", "b3"]))):
+            utils.Output.format_and_save_parquet(config, [people(ids, 1990, jobs)], [f"people_{batch}"],
+                                                 incremental=True, storage=storage)
+        index = KeyIndex.from_config(config, utils.Output.incremental_output_path(config), storage)
+        assert {fragment for fragment, _ in index.locate(["A", "B"]).values()} == {"Year of birth=1990/people_2-0.parquet"}
+        index.close()
+        # Removing the last file writes back the rows it replaced
+        utils.Output.remove_fragments(config, "people_2", storage)
+
+        local = tmp_path / "download"
+        for location in storage.list(f"s3://{BUCKET}/outputs"):
+            path = local / location[len(f"s3://{BUCKET}/outputs/"):]
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_bytes(open(storage.fetch(location), "rb").read())
+        assert (local / "patients.keys.sqlite").exists()
+        rows, count = read_output(local / "patients.parquet")
+        assert count == 2 and rows == {"A": "a1", "B": "b2"}
@@ -0,0 +1,92 @@
+"""
+Unit Tests for Incremental Runs (utils.manifest and the incremental output).
+
+The tests cover skipping input files whose content, config and salt are unchanged, reprocessing files that changed or when forced, and rewriting only the output fragments of the changed files.
+
+Dependencies:
+- utils (custom utility module)
+- pytest
+- pandas
+"""
+
+import os
+from utils import engine, utils
+from utils.manifest import RunManifest
+import pytest
+import pandas as pd
+
+
+@pytest.fixture
+def run_config(tmp_path):
+    salt_dir = tmp_path / "salt"
+    salt_dir.mkdir()
+    (salt_dir / "salt.txt").write_text("12345")
+    inputs = tmp_path / "inputs"
+    inputs.mkdir()
+    for file, years in (("people_a", [1990, 1991]), ("people_b", [1991, 1992])):
+        pd.DataFrame({"Year of birth": years, "value": [1, 2]}).to_csv(inputs / f"{file}.csv", index=False)
+    return {
+        "csv_files": ["people_a", "people_b"],
+        "inputs": str(inputs),
+        "outputs": str(tmp_path / "outputs"),
+        "temp": str(tmp_path / "temp"),
+        "salt": str(salt_dir),
+        "cols_to_hash": ["value"],
+        "partition_columns": ["Year of birth"],
+        "output_asset_name": "patients",
+    }
+
+
+def run(config, force=False):
+    processed = []
+
+    def extract(context, file):
+        processed.append(file)
+        return context.read_input(file)
+
+    def output(context):
+        fragments = utils.Output.format_and_save_parquet(
+            context.config, [context.table(file) for file in context.files], context.files, incremental=True)
+        for file, paths in fragments.items():
+            context.artifacts[file] = {"output": paths}
+
+    stages = [
+        engine.Stage("extract", "Extract Data", extract, scope="source"),
+        engine.Stage("output", "Output Results", output, scope="run"),
+    ]
+    manifest = RunManifest.from_config(config)
+    engine.PipelineRunner(config, stages, manifest=manifest, force=force).run()
+    return processed
+
+
+def test_unchanged_files_are_skipped(run_config):
+    assert run(run_config) == ["people_a", "people_b"]
+    assert run(run_config) == []
+
+    # Touching a file without changing it keeps it skipped
+    os.utime(f"{run_config['inputs']}/people_a.csv", ns=(0, 0))
+    assert run(run_config) == []
+
+    assert run(run_config, force=True) == ["people_a", "people_b"]
+
+    run_config["cols_to_hash"] = []
+    assert run(run_config) == ["people_a", "people_b"]
+
+    manifest = RunManifest.from_config(run_config)
+    assert manifest.last_run["processed"] == ["people_a", "people_b"]
+    assert "12345" not in open(manifest.path).read()
+
+
+def test_only_changed_fragments_are_rewritten(run_config):
+    run(run_config)
+    output_path = utils.Output.incremental_output_path(run_config)
+    untouched = f"{output_path}/Year of birth=1992/people_b-0.parquet"
+    before = os.stat(untouched).st_mtime_ns
+
+    pd.DataFrame({"Year of birth": [1990], "value": [3]}).to_csv(
+        f"{run_config['inputs']}/people_a.csv", index=False)
+    assert run(run_config) == ["people_a"]
+
+    assert os.stat(untouched).st_mtime_ns == before
+    assert not os.path.exists(f"{output_path}/Year of birth=1991/people_a-0.parquet")
+    assert sorted(pd.read_parquet(output_path)["value"]) == [1, 2, 3]
@@ -0,0 +1,87 @@
+"""
+Unit Tests for the Quality Metrics History (utils.metrics_store).
+
+The tests cover recording summaries as deltas and compacting them, time series across the compacted table and newer deltas, drift in percentage points and in relative change, and backfilling the summaries written by earlier runs.
+
+Dependencies:
+- utils (custom utility module)
+- pytest
+- pandas
+"""
+
+import os
+from datetime import datetime, timedelta
+from utils import engine
+from utils.metrics_store import MetricsStore
+import pytest
+import pandas as pd
+
+START = datetime(2026, 1, 1)
+
+
+def summary(nulls, distinct):
+    return pd.DataFrame({"User Id": [100.0, nulls, distinct], "Sex": [100.0, 0.0, 2.0]},
+                        index=["Total Count", "Null Percentage (%)", "Distinct Count"])
+
+
+@pytest.fixture
+def history_config(tmp_path):
+    return {"outputs": str(tmp_path / "outputs"), "metrics_history": {"enabled": True, "compact_every": 3}}
+
+
+def test_records_are_compacted_and_queried(history_config):
+    assert MetricsStore.from_config(dict(history_config, metrics_history={})) is None
+    context = engine.PipelineContext(history_config)
+    store = context.metrics_store
+    for run in range(4):
+        store.record("people_a", "processed", summary(run, 90.0), START + timedelta(days=run))
+        if run == 1:
+            context.close()
+    assert len(store.deltas()) == 4
+
+    # Closing the run compacts the deltas once enough are waiting; deltas recorded later are still read
+    context.close()
+    assert store.deltas() == [] and os.path.exists(store.table_path)
+    store.record("people_a", "processed", summary(4.0, 90.0), START + timedelta(days=4))
+    store.record("people_b", "raw", summary(50.0, 90.0), START)
+
+    series = store.series("Null Percentage (%)", file="people_a", column="User Id")
+    assert series["value"].tolist() == [0.0, 1.0, 2.0, 3.0, 4.0]
+    assert series["run_time"].tolist() == [START + timedelta(days=run) for run in range(5)]
+    assert len(store.read(kind="raw")) == 6
+    assert len(store.read(since=START + timedelta(days=3))) == 12
+
+
+def test_drift_compares_each_run_with_the_previous(tmp_path):
+    store = MetricsStore(str(tmp_path / "history"))
+    for run, (nulls, distinct) in enumerate([(1.0, 100.0), (4.0, 105.0), (12.0, 105.0), (12.0, 80.0), (12.0, 0.0)]):
+        store.record("people_a", "processed", summary(nulls, distinct), START + timedelta(days=run))
+
+    drifted = store.drift()
+    assert [(row.metric, row.run_time.day) for row in drifted.itertuples()] == [
+        ("Null Percentage (%)", 3), ("Distinct Count", 4), ("Distinct Count", 5)]
+    assert drifted["change"].iloc[0] == pytest.approx(8.0)
+    assert drifted["change"].iloc[1] == pytest.approx(-0.238, abs=1e-3)
+
+    # Thresholds can be given per query, and runs are reported from `since` on
+    drifted = store.drift({"Null Percentage (%)": 2.0}, since=START + timedelta(days=1))
+    assert drifted["run_time"].tolist() == [START + timedelta(days=1), START + timedelta(days=2)]
+    assert store.drift(kind="raw").empty
+
+
+def test_backfill_loads_earlier_summaries_once(tmp_path):
+    metrics_dir = tmp_path / "quality_metrics"
+    for kind in ("raw", "processed"):
+        (metrics_dir / kind / "charts").mkdir(parents=True)
+        (metrics_dir / kind / "charts" / "chart.png").write_bytes(b"")
+        for run in range(3):
+            stamp = (START + timedelta(hours=run)).strftime("%Y%m%d_%H%M%S")
+            summary(float(run), 90.0).to_parquet(metrics_dir / kind / f"people_a_b_{kind}_{stamp}.parquet")
+
+    store = MetricsStore(str(metrics_dir / "history"))
+    assert store.backfill(str(metrics_dir)) == 6
+    assert store.backfill(str(metrics_dir)) == 6
+    assert store.deltas() == []
+    series = store.series("Null Percentage (%)", kind="raw", column="User Id")
+    assert series["file"].unique().tolist() == ["people_a_b"]
+    assert series["value"].tolist() == [0.0, 1.0, 2.0]
@@ -0,0 +1,112 @@
+"""
+Unit Tests for Byte-Range Parallel Processing (utils.parallel).
+
+The tests cover splitting a CSV into record-aligned byte ranges when quoted fields contain newlines, reading a range with the shared header, checking that the parallel stage chain produces the same table as the in-memory pipeline, processing a CSV without data records, and removing the parts of the other ranges when a range fails.
+
+Dependencies:
+- utils (custom utility module)
+- pytest
+- pandas
+"""
+
+import io
+from utils import parallel
+from utils.engine import PipelineRunner, load_stages
+import pytest
+import pandas as pd
+import yaml
+
+
+@pytest.fixture
+def quoted_csv(tmp_path):
+    df = pd.DataFrame({
+        "id": range(200),
+        "note": [f'line {i}\nstill "{i}" in the field' if i % 3 == 0 else f"plain {i}"
+                 for i in range(200)],
+        "city": ["Leeds, UK", "York"] * 100,
+    })
+    path = tmp_path / "quoted.csv"
+    df.to_csv(path, index=False)
+    return str(path), df
+
+
+@pytest.mark.parametrize("parts", [1, 3, 16])
+def test_split_byte_ranges_respects_quoted_newlines(quoted_csv, parts):
+    path, df = quoted_csv
+    header, ranges = parallel.split_byte_ranges(path, parts, block_size=64)
+
+    assert header == b"id,note,city\n"
+    assert 1 <= len(ranges) <= parts
+    assert all(end == start for (_, end), (start, _) in zip(ranges, ranges[1:]))
+
+    with open(path, "rb") as f:
+        data = f.read()
+    frames = [pd.read_csv(io.BytesIO(header + data[start:end])) for start, end in ranges]
+    pd.testing.assert_frame_equal(pd.concat(frames, ignore_index=True), df)
+
+
+def test_byte_range_context_reads_range_with_header(quoted_csv, tmp_path):
+    path, df = quoted_csv
+    header, ranges = parallel.split_byte_ranges(path, 4)
+    config = {"inputs": str(tmp_path)}
+
+    chunks = parallel.ByteRangeContext(config, None, path, header, ranges[-1]).read_input(
+        "quoted", chunksize=10)
+    last = pd.concat(list(chunks), ignore_index=True)
+
+    assert list(last.columns) == ["id", "note", "city"]
+    assert last["id"].iloc[-1] == 199
+
+
+def test_parallel_chain_matches_in_memory(tmp_path):
+    with open("config.yaml") as f:
+        config = yaml.safe_load(f)
+    config.update(temp=str(tmp_path / "temp"), csv_files=["people_2"])
+    stages = [stage for stage in load_stages("pipeline")
+              if stage.name in ("extract", "clean", "process")]
+
+    in_memory = PipelineRunner(config, stages).run().table("people_2")
+
+    config["parallel"] = {"enabled": True, "workers": 2, "min_range_bytes": 1024}
+    context = PipelineRunner(config, stages).run()
+
+    assert not list((tmp_path / "temp").glob("*.part-*"))
+    pd.testing.assert_frame_equal(context.table("people_2"), in_memory)
+
+
+def test_parallel_chain_handles_header_only_csv(tmp_path):
+    with open("config.yaml") as f:
+        config = yaml.safe_load(f)
+    inputs = tmp_path / "inputs"
+    inputs.mkdir()
+    with open("data/inputs/people_2.csv") as f:
+        (inputs / "empty.csv").write_text(f.readline())
+    config.update(temp=str(tmp_path / "temp"), inputs=str(inputs), csv_files=["empty"],
+                  parallel={"enabled": True, "workers": 2, "min_range_bytes": 1024})
+    stages = [stage for stage in load_stages("pipeline")
+              if stage.name in ("extract", "clean", "process")]
+
+    # No byte ranges: the chain runs on the header alone and writes an empty checkpoint
+    table = PipelineRunner(config, stages).run().table("empty")
+    assert len(table) == 0
+    assert "Job Title_hashed" in table.columns and "Year of birth" in table.columns
+
+
+def test_failed_range_removes_the_parts(tmp_path):
+    with open("config.yaml") as f:
+        config = yaml.safe_load(f)
+    inputs = tmp_path / "inputs"
+    inputs.mkdir()
+    with open("data/inputs/people_2.csv") as f:
+        lines = f.read().splitlines()
+    # A date past the validated sample breaks the last range only
+    lines[-1] = lines[-1].replace("1947-01-24", "24/01/1947")
+    (inputs / "broken.csv").write_text("\n".join(lines) + "\n")
+    config.update(temp=str(tmp_path / "temp"), inputs=str(inputs), csv_files=["broken"],
+                  validation={"sample_rows": 10}, parallel={"enabled": True, "workers": 2, "min_range_bytes": 1024})
+    stages = [stage for stage in load_stages("pipeline")
+              if stage.name in ("extract", "clean", "process")]
+
+    context = PipelineRunner(config, stages).run()
+    assert "doesn't match format" in context.failed["broken"]
+    assert not list((tmp_path / "temp").glob("*.part-*"))
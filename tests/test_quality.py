@@ -0,0 +1,94 @@
+"""
+Unit Tests for the Incremental Quality Metrics (utils.quality).
+
+The tests cover agreement of the exact accumulator with `QualityMetrics.calculate_data_quality`, merging of partial accumulators built on separate batches, the lengths of dates formatted with their format, and the documented error bound of the approximate (HyperLogLog) distinct counts.
+
+Dependencies:
+- utils (custom utility module)
+- pytest
+- pandas
+- numpy
+"""
+
+import pickle
+from utils import utils
+from utils.quality import HyperLogLog, QualityAccumulator
+import pytest
+import numpy as np
+import pandas as pd
+
+
+@pytest.fixture
+def people():
+    df = pd.read_csv("data/inputs/people_2.csv")
+    df.loc[[3, 7], "Sex"] = None
+    df["Score"] = np.random.default_rng(0).normal(size=len(df))
+    # Dates are parsed on read; their lengths are those of the formatted dates
+    df["Date of birth"] = pd.to_datetime(df["Date of birth"], format="%Y-%m-%d")
+    df.loc[5, "Date of birth"] = None
+    df["Seen at"] = df["Date of birth"] + pd.Timedelta(seconds=90)
+    # Midnight but for the last row, which a batch of its own formats differently with `astype(str)`
+    df["Visited"] = df["Date of birth"]
+    df.loc[len(df) - 1, "Visited"] += pd.Timedelta(seconds=90)
+    return df
+
+
+# The text forms of the dates in `calculate_data_quality`
+DATE_FORMATS = {"Date of birth": "%Y-%m-%d", "Seen at": "%Y-%m-%d %H:%M:%S", "Visited": "%Y-%m-%d %H:%M:%S"}
+
+
+def test_exact_accumulator_matches_calculate_data_quality(people):
+    expected = utils.QualityMetrics.calculate_data_quality(people)
+    summary = QualityAccumulator("exact", date_formats=DATE_FORMATS).update(people).to_frame()
+
+    assert summary.loc["Mean Length", "Email"] == people["Email"].str.len().mean()
+    pd.testing.assert_frame_equal(
+        summary.drop(index="Mean Length"), expected, check_dtype=False)
+
+
+def test_partial_accumulators_merge(people):
+    whole = QualityAccumulator("exact").update(people).to_frame()
+
+    # Partials travel between worker processes, so they must survive pickling
+    partials = [pickle.loads(pickle.dumps(QualityAccumulator("exact").update(people.iloc[i:i + 128])))
+                for i in range(0, len(people), 128)]
+    merged = QualityAccumulator("exact")
+    for partial in partials:
+        merged.merge(partial)
+
+    pd.testing.assert_frame_equal(merged.to_frame(), whole)
+    # Dates have the length of their format, whatever the batch
+    assert whole.loc["Mean Length", "Visited"] == pytest.approx((19 * 999 + 3) / 1000)
+
+
+def test_date_lengths_follow_the_format(people):
+    dates = people[["Date of birth"]]
+    summary = QualityAccumulator(date_formats={"Date of birth": "%d %B %Y"}).update(dates).to_frame()
+    formatted = dates["Date of birth"].dt.strftime("%d %B %Y").dropna().str.len()
+    assert summary.loc["Max Length", "Date of birth"] == formatted.max()
+    assert summary.loc["Min Length", "Date of birth"] == 3
+
+
+@pytest.mark.parametrize("precision", [10, 14])
+def test_approximate_distinct_counts_within_error_bound(precision):
+    values = pd.Series([f"user-{i}" for i in range(50000)])
+    sketch = HyperLogLog(precision)
+    for start in range(0, len(values), 10000):
+        part = HyperLogLog(precision)
+        part.update(values.iloc[start:start + 10000])
+        sketch.merge(part)
+
+    standard_error = 1.04 / np.sqrt(2 ** precision)
+    assert abs(sketch.count() - len(values)) / len(values) < 3 * standard_error
+
+
+def test_approximate_accumulator_reports_close_counts(people):
+    summary = QualityAccumulator("approximate", precision=12).update(people).to_frame()
+    distinct = people.nunique()
+
+    assert summary.loc["Null Count", "Sex"] == 2
+    for column in people.columns:
+        assert abs(summary.loc["Distinct Count", column] - distinct[column]) <= 0.05 * distinct[column] + 1
+
+    with pytest.raises(ValueError):
+        QualityAccumulator("roughly")
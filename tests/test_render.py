@@ -0,0 +1,61 @@
+"""
+Unit Tests for Background Chart Rendering (utils.render).
+
+The tests cover the content hash used as the render cache key, drawing charts in a background process pool, and reusing a cached chart instead of drawing it again when the metrics are unchanged.
+
+Dependencies:
+- utils (custom utility module)
+- pytest
+- pandas
+"""
+
+import os
+from utils import render, utils
+import pytest
+import pandas as pd
+
+
+@pytest.fixture
+def quality_df():
+    df = pd.DataFrame({"name": ["Alice", "Bob", None], "age": [25, 30, 35]})
+    return utils.QualityMetrics.calculate_data_quality(df)
+
+
+@pytest.fixture
+def chart_config(tmp_path):
+    return {"outputs": str(tmp_path / "outputs"), "charts": {"workers": 0}}
+
+
+def test_chart_digest_follows_content(quality_df):
+    assert render.chart_digest(quality_df) == render.chart_digest(quality_df.copy())
+
+    changed = quality_df.copy()
+    changed.loc["Null Count", "name"] = 2
+    assert render.chart_digest(changed) != render.chart_digest(quality_df)
+
+
+def test_renderer_draws_in_background_pool(quality_df, chart_config, tmp_path):
+    chart_config["charts"] = {"workers": 1}
+    renderer = render.ChartRenderer(chart_config)
+    path = renderer.submit(quality_df, str(tmp_path / "charts"))
+    renderer.close()
+
+    assert os.path.getsize(path) > 0
+    assert os.listdir(renderer.cache_dir) == [f"{render.chart_digest(quality_df)}.png"]
+
+
+def test_renderer_reuses_cached_chart(quality_df, chart_config, tmp_path, monkeypatch):
+    first = render.ChartRenderer(chart_config)
+    drawn = first.submit(quality_df, str(tmp_path / "first"))
+
+    def fail(*args, **kwargs):
+        raise AssertionError("chart drawn again")
+
+    monkeypatch.setattr(utils.QualityMetrics, "plot_quality_metrics", fail)
+    second = render.ChartRenderer(chart_config)
+    reused = second.submit(quality_df, str(tmp_path / "second"))
+    second.close()
+
+    assert second.cache_hits == 1
+    with open(drawn, "rb") as a, open(reused, "rb") as b:
+        assert a.read() == b.read()
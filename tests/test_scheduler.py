@@ -0,0 +1,130 @@
+"""
+Unit Tests for the Stage Scheduler (utils.scheduler).
+
+The tests cover resolving the stage dependencies into tasks, overlapping the stages of different files and of independent stages, and isolating the files whose stages fail.
+
+Dependencies:
+- utils (custom utility module)
+- pytest
+- pandas
+"""
+
+import threading
+from utils import engine, scheduler
+import pytest
+import pandas as pd
+
+
+@pytest.fixture
+def run_config(tmp_path):
+    salt_dir = tmp_path / "salt"
+    salt_dir.mkdir()
+    (salt_dir / "salt.txt").write_text("12345")
+    return {
+        "csv_files": ["people_a", "people_b", "people_c"],
+        "temp": str(tmp_path / "temp"),
+        "salt": str(salt_dir),
+        "scheduler": {"workers": 3},
+    }
+
+
+def test_build_tasks_resolves_dependencies():
+    stages = [
+        engine.Stage("extract", "Extract Data", None, scope="source", streamable=True),
+        engine.Stage("clean", "Clean Data", None, streamable=True),
+        engine.Stage("raw_metrics", "Raw Data Metrics", None, depends_on=("extract",)),
+        engine.Stage("output", "Output Results", None, scope="run", depends_on=("clean", "resumed")),
+    ]
+    tasks = scheduler.build_tasks(stages, lambda remaining: [])
+    assert [(task.name, task.scope, task.depends_on) for task in tasks] == [
+        ("extract", "file", set()), ("clean", "file", {"extract"}),
+        ("raw_metrics", "file", {"extract"}), ("output", "run", {"clean"}),
+    ]
+
+    # A streamed chain is a single task, which the stages depending on its members wait for
+    tasks = scheduler.build_tasks(stages, lambda remaining: remaining[:2] if remaining[0].name == "extract" else [])
+    assert [(task.name, task.streamed, task.depends_on) for task in tasks] == [
+        ("extract+clean", True, set()), ("raw_metrics", False, {"extract+clean"}),
+        ("output", False, {"extract+clean"}),
+    ]
+
+    with pytest.raises(ValueError):
+        scheduler.build_tasks([engine.Stage("early", "Early", None, depends_on=("late",)),
+                               engine.Stage("late", "Late", None)], lambda remaining: [])
+
+
+def test_stages_of_files_overlap(run_config):
+    extracted_b = threading.Event()
+    raw_done_a = threading.Event()
+    order = []
+
+    def extract(context, file):
+        order.append(("extract", file))
+        if file == "people_b":
+            extracted_b.set()
+        return pd.DataFrame({"value": [1, 2, 3]})
+
+    def clean(context, file, df):
+        # The next file is extracted and the raw metrics are saved while this file is cleaned
+        if file == "people_a":
+            assert extracted_b.wait(10) and raw_done_a.wait(10)
+        order.append(("clean", file))
+        return df * 2
+
+    def raw_metrics(context, file, df):
+        order.append(("raw_metrics", file))
+        if file == "people_a":
+            raw_done_a.set()
+
+    collected = {}
+
+    def output(context):
+        collected.update({file: context.table(file)["value"].tolist() for file in context.files})
+
+    stages = [
+        engine.Stage("extract", "Extract Data", extract, scope="source"),
+        engine.Stage("clean", "Clean Data", clean),
+        engine.Stage("raw_metrics", "Raw Data Metrics", raw_metrics, depends_on=("extract",)),
+        engine.Stage("output", "Output Results", output, scope="run", depends_on=("clean",)),
+    ]
+    runner = engine.PipelineRunner(run_config, stages)
+    runner.run()
+
+    assert order.index(("extract", "people_b")) < order.index(("clean", "people_a"))
+    assert order.index(("raw_metrics", "people_a")) < order.index(("clean", "people_a"))
+    assert collected == {file: [2, 4, 6] for file in run_config["csv_files"]}
+    assert {(step["stage"], step["file"]) for step in runner.report.steps} >= {
+        ("clean", "people_c"), ("raw_metrics", "people_c"), ("output", None)}
+
+
+def test_failed_file_is_left_out(run_config):
+    cleaned = []
+
+    def clean(context, file, df):
+        if file == "people_b":
+            raise ValueError("bad row")
+        cleaned.append(file)
+        return df
+
+    collected = []
+    stages = [
+        engine.Stage("extract", "Extract Data", lambda context, file: pd.DataFrame({"value": [1]}), scope="source"),
+        engine.Stage("clean", "Clean Data", clean),
+        engine.Stage("process", "Process Data", lambda context, file, df: df),
+        engine.Stage("output", "Output Results", lambda context: collected.extend(context.files), scope="run"),
+    ]
+    runner = engine.PipelineRunner(run_config, stages)
+    context = runner.run()
+
+    assert sorted(cleaned) == ["people_a", "people_c"]
+    assert collected == ["people_a", "people_c"]
+    assert context.failed == {"people_b": "bad row"} and "people_b" not in context.tables
+    assert not any(step["stage"] == "process" and step["file"] == "people_b" for step in runner.report.steps)
+
+    # A failed run-wide stage fails the run
+    def fail(context):
+        raise RuntimeError("output failed")
+
+    stages[-1] = engine.Stage("output", "Output Results", fail, scope="run")
+    with pytest.raises(RuntimeError):
+        engine.PipelineRunner(run_config, stages).run()
@@ -0,0 +1,148 @@
+"""
+Unit Tests for the Storage Backends (utils.storage).
+
+The tests cover the choice of backend from the config, concurrent multipart transfers and prefetching against S3, checking which objects are missing, and an incremental run whose inputs and outputs are on S3. The S3 tests run offline against moto's in-memory S3 and are skipped when moto is not installed.
+
+Dependencies:
+- utils (custom utility module)
+- pytest
+- pandas
+- moto (optional)
+"""
+
+import os
+from utils import engine, storage, utils
+from utils.manifest import RunManifest
+import pytest
+import pandas as pd
+
+BUCKET = "etl-bucket"
+
+
+@pytest.fixture
+def s3(monkeypatch):
+    moto = pytest.importorskip("moto")
+    for name, value in (("AWS_ACCESS_KEY_ID", "testing"), ("AWS_SECRET_ACCESS_KEY", "testing"),
+                        ("AWS_DEFAULT_REGION", "us-east-1")):
+        monkeypatch.setenv(name, value)
+    with moto.mock_aws():
+        import boto3
+        client = boto3.client("s3")
+        client.create_bucket(Bucket=BUCKET)
+        yield client
+
+
+def test_open_storage_follows_locations(tmp_path):
+    config = {"inputs": str(tmp_path), "outputs": str(tmp_path), "temp": str(tmp_path), "salt": str(tmp_path)}
+    assert type(storage.open_storage(config)) is storage.LocalStorage
+
+    remote = storage.open_storage(dict(config, outputs=f"s3://{BUCKET}/outputs", storage={"max_concurrency": 3}))
+    assert isinstance(remote, storage.S3Storage) and remote.max_concurrency == 3
+    assert remote.local_path(f"s3://{BUCKET}/outputs/a.parquet") == os.path.join(
+        str(tmp_path), "storage_cache", BUCKET, "outputs", "a.parquet")
+    assert remote.local_path(str(tmp_path)) == str(tmp_path)
+
+    with pytest.raises(ValueError):
+        storage.open_storage(dict(config, temp=f"s3://{BUCKET}/temp"))
+
+
+def test_multipart_transfers_and_prefetch(s3, tmp_path):
+    part_size = 5 * 1024 * 1024
+    store = storage.S3Storage(str(tmp_path / "cache"), max_concurrency=4, part_size=part_size)
+    data = os.urandom(2 * part_size + 1000)
+
+    large = f"s3://{BUCKET}/outputs/large.bin"
+    os.makedirs(os.path.dirname(store.local_path(large)))
+    with open(store.local_path(large), "wb") as f:
+        f.write(data)
+    store.publish([large])
+    assert not os.path.exists(store.local_path(large))
+    head = s3.head_object(Bucket=BUCKET, Key="outputs/large.bin")
+    assert head["ContentLength"] == len(data) and head["ETag"].endswith('-3"')
+
+    # Ranged download into the staging copy, which is reused while the object is unchanged
+    with open(store.fetch(large), "rb") as f:
+        assert f.read() == data
+    assert storage.S3Storage(str(tmp_path / "cache")).fetch(large) == store.local_path(large)
+
+    s3.put_object(Bucket=BUCKET, Key="inputs/next.csv", Body=b"value\n1\n")
+    store.prefetch([f"s3://{BUCKET}/inputs/next.csv"])
+    with open(store.fetch(f"s3://{BUCKET}/inputs/next.csv")) as f:
+        assert f.read() == "value\n1\n"
+    store.close()
+
+    assert store.missing([large, f"s3://{BUCKET}/outputs/other.bin"]) == [f"s3://{BUCKET}/outputs/other.bin"]
+    assert store.list(f"s3://{BUCKET}/outputs") == [large]
+    store.remove([large])
+    assert not store.exists(large)
+
+
+def test_missing_lists_each_parent_prefix(s3, tmp_path):
+    store = storage.S3Storage(str(tmp_path / "cache"))
+    for key in ("top.csv", "outputs/a.parquet", "outputs/nested/b.parquet", "inputs/c.csv"):
+        s3.put_object(Bucket=BUCKET, Key=key, Body=b"1")
+    prefixes = []
+    store.client.meta.events.register("before-parameter-build.s3.ListObjectsV2",
+                                      lambda params, **kwargs: prefixes.append(params["Prefix"]))
+
+    paths = [f"s3://{BUCKET}/{key}" for key in (
+        "top.csv", "other.csv", "outputs/a.parquet", "outputs/b.parquet", "outputs/nested/b.parquet", "inputs/c.csv")]
+    assert store.missing(paths) == [f"s3://{BUCKET}/other.csv", f"s3://{BUCKET}/outputs/b.parquet"]
+    # Only the prefix holding several of the paths is listed; the bucket is never listed whole
+    assert prefixes == ["outputs/"]
+
+
+def test_incremental_run_on_s3(s3, tmp_path):
+    salt_dir = tmp_path / "salt"
+    salt_dir.mkdir()
+    (salt_dir / "salt.txt").write_text("12345")
+    for file, years in (("people_a", [1990, 1991]), ("people_b", [1991, 1992])):
+        s3.put_object(Bucket=BUCKET, Key=f"inputs/{file}.csv",
+                      Body=pd.DataFrame({"Year of birth": years, "value": [1, 2]}).to_csv(index=False))
+    config = {
+        "csv_files": ["people_a", "people_b"],
+        "inputs": f"s3://{BUCKET}/inputs",
+        "outputs": f"s3://{BUCKET}/outputs",
+        "temp": str(tmp_path / "temp"),
+        "salt": str(salt_dir),
+        "partition_columns": ["Year of birth"],
+        "output_asset_name": "patients",
+    }
+    processed = []
+
+    def extract(context, file):
+        processed.append(file)
+        return context.read_input(file)
+
+    def output(context):
+        fragments = utils.Output.format_and_save_parquet(
+            context.config, [context.table(file) for file in context.files], context.files,
+            incremental=True, storage=context.storage)
+        for file, paths in fragments.items():
+            context.artifacts[file] = {"output": paths}
+
+    stages = [
+        engine.Stage("extract", "Extract Data", extract, scope="source"),
+        engine.Stage("output", "Output Results", output, scope="run"),
+    ]
+
+    def run():
+        processed.clear()
+        engine.PipelineRunner(config, stages, manifest=RunManifest.from_config(config)).run()
+        return list(processed)
+
+    def output_keys():
+        listing = s3.list_objects_v2(Bucket=BUCKET, Prefix="outputs/patients.parquet/")
+        return sorted(item["Key"][len("outputs/patients.parquet/"):] for item in listing.get("Contents", []))
+
+    assert run() == ["people_a", "people_b"]
+    assert output_keys() == ["Year of birth=1990/people_a-0.parquet", "Year of birth=1991/people_a-0.parquet",
+                             "Year of birth=1991/people_b-0.parquet", "Year of birth=1992/people_b-0.parquet"]
+    assert run() == []
+
+    s3.put_object(Bucket=BUCKET, Key="inputs/people_a.csv",
+                  Body=pd.DataFrame({"Year of birth": [1993], "value": [3]}).to_csv(index=False))
+    assert run() == ["people_a"]
+    assert output_keys() == ["Year of birth=1991/people_b-0.parquet", "Year of birth=1992/people_b-0.parquet",
+                             "Year of birth=1993/people_a-0.parquet"]
+    assert "people_a" in RunManifest.from_config(config).entries
@@ -0,0 +1,136 @@
+"""
+Unit Tests for Streaming Mode (utils.streaming and the streamed stage chain).
+
+The tests cover the incremental Parquet and Arrow IPC writers and readers of the intermediates, the partitioned dataset writer and its write modes, and the bounded-memory streaming of an input that is many times larger than a configured memory cap through the extract, clean and process stages.
+
+Dependencies:
+- utils (custom utility module)
+- pytest
+- pandas
+- pyarrow
+"""
+
+import tracemalloc
+from utils.engine import PipelineRunner, load_stages
+from utils.streaming import (ArrowBatchWriter, ParquetBatchWriter, PartitionedDatasetWriter, is_arrow_file,
+                             iter_intermediate_batches, merge_parts, read_intermediate)
+import pytest
+import pandas as pd
+import pyarrow.parquet as pq
+import yaml
+
+# Python heap allowed while streaming; the test input loads to many times this size
+MEMORY_CAP_BYTES = 3 * 1024 * 1024
+
+
+@pytest.fixture
+def stream_config(tmp_path):
+    with open("config.yaml") as f:
+        config = yaml.safe_load(f)
+    inputs = tmp_path / "inputs"
+    inputs.mkdir()
+    config.update(inputs=str(inputs), temp=str(tmp_path / "temp"))
+    return config
+
+
+@pytest.fixture
+def chain_stages():
+    return [stage for stage in load_stages("pipeline")
+            if stage.name in ("extract", "clean", "process")]
+
+
+def test_parquet_batch_writer_unifies_batches(tmp_path):
+    path = str(tmp_path / "out.parquet")
+    with ParquetBatchWriter(path) as writer:
+        writer.write(pd.DataFrame({"year": [1990.0, None], "name": ["a", "b"]}))
+        writer.write(pd.DataFrame({"year": [1991, 1992], "name": ["c", "d"]}))
+
+    assert writer.rows == 4
+    assert pq.ParquetFile(path).metadata.num_row_groups == 2
+    assert pd.read_parquet(path)["year"].tolist()[2:] == [1991.0, 1992.0]
+
+
+def test_arrow_intermediates_are_mapped_and_written_atomically(tmp_path):
+    path = str(tmp_path / "out.arrow")
+    with ArrowBatchWriter(path) as writer:
+        writer.write(pd.DataFrame({"year": [1990.0, None], "name": ["a", "b"]}))
+        writer.write(pd.DataFrame({"year": [1991, 1992], "name": ["c", "d"]}))
+    assert writer.rows == 4 and is_arrow_file(path)
+
+    # The unread columns of a mapped file are not loaded
+    table = read_intermediate(path, ["year"])
+    assert table.column_names == ["year"] and table.column(0).to_pylist()[2:] == [1991.0, 1992.0]
+    assert [batch.num_rows for batch in iter_intermediate_batches(path, batch_size=1, columns=["name"])] == [1] * 4
+
+    # A failed write leaves the earlier file in place and no partial file behind
+    with pytest.raises(RuntimeError):
+        with ArrowBatchWriter(path, "lz4") as writer:
+            writer.write(pd.DataFrame({"year": [2000.0], "name": ["e"]}))
+            raise RuntimeError("stage failed")
+    assert read_intermediate(path).num_rows == 4
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["out.arrow"]
+
+    # Parts of either format merge into either format
+    part = str(tmp_path / "part.parquet")
+    with ParquetBatchWriter(part) as writer:
+        writer.write(pd.DataFrame({"year": [2001.0], "name": ["f"]}))
+    merged = str(tmp_path / "merged.arrow")
+    assert merge_parts([path, part], merged, "arrow", "zstd") == 5
+    assert read_intermediate(merged).column("name").to_pylist() == ["a", "b", "c", "d", "f"]
+
+
+def test_partitioned_dataset_writer_modes(tmp_path):
+    path = str(tmp_path / "asset.parquet")
+    first = pd.DataFrame({"year": [1990, 1991, 1991], "sex": ["F", "M", "F"], "id": [1, 2, 3]})
+    first.to_parquet(tmp_path / "first.parquet")
+
+    writer = PartitionedDatasetWriter(path, ["year"], mode="overwrite", row_group_size=1,
+                                      dictionary_columns=["sex"])
+    writer.write([str(tmp_path / "first.parquet")])
+    fragment = pq.ParquetFile(f"{path}/year=1991/part-0.parquet").metadata
+    assert fragment.num_row_groups == 2
+    assert "RLE_DICTIONARY" in fragment.row_group(0).column(0).encodings
+    assert "RLE_DICTIONARY" not in fragment.row_group(0).column(1).encodings
+
+    second = pd.DataFrame({"year": [1991, 1992], "sex": ["M", "F"], "id": [4.0, 5.0]})
+    PartitionedDatasetWriter(path, ["year"], mode="append").write([second])
+    assert sorted(pd.read_parquet(path)["id"]) == [1, 2, 3, 4, 5]
+
+    PartitionedDatasetWriter(path, ["year"], mode="overwrite_partition").write([second.assign(id=[6, 7])])
+    assert sorted(pd.read_parquet(path)["id"]) == [1, 6, 7]
+
+
+def test_streaming_matches_in_memory(stream_config, chain_stages):
+    pd.read_csv("data/inputs/people_2.csv").to_csv(
+        f"{stream_config['inputs']}/people.csv", index=False)
+    stream_config["csv_files"] = ["people"]
+
+    in_memory = PipelineRunner(stream_config, chain_stages).run().table("people")
+
+    stream_config["streaming"] = {"enabled": True, "batch_size": 128}
+    context = PipelineRunner(stream_config, chain_stages).run()
+
+    assert not context.in_memory("people")
+    pd.testing.assert_frame_equal(context.table("people"), in_memory)
+
+
+def test_streaming_stays_under_memory_cap(stream_config, chain_stages):
+    source = pd.read_csv("data/inputs/people_3.csv")
+    pd.concat([source] * 6).to_csv(f"{stream_config['inputs']}/big.csv", index=False)
+    loaded_bytes = 6 * source.memory_usage(deep=True).sum()
+    assert loaded_bytes > 10 * MEMORY_CAP_BYTES
+
+    stream_config["csv_files"] = ["big"]
+    stream_config["streaming"] = {"enabled": True, "batch_size": 500}
+    # Exact distinct counts keep every distinct value; bounded memory needs the sketches
+    stream_config["quality_metrics"] = {"distinct": "approximate", "precision": 10}
+
+    tracemalloc.start()
+    try:
+        context = PipelineRunner(stream_config, chain_stages).run()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    assert peak < MEMORY_CAP_BYTES
+    assert context.read_checkpoint("big").num_rows == 6 * len(source)
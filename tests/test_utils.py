@@ -22,8 +22,10 @@ Dependencies:
 """
 
 from utils import utils
+import hashlib
 import pytest
 import pandas as pd
+import yaml
 
 
 @pytest.fixture
@@ -82,6 +84,57 @@ def test_variable_count(sample_dataframe, sample_config):
         utils.DataFrameValidation.variable_count(
             invalid_dataframe, sample_config)
 
+def test_validate_header_rejects_before_loading(tmp_path, sample_config):
+    path = tmp_path / "people.csv"
+    path.write_text("name,age,date_of_birth\nAlice,25,1997-01-01\n")
+    utils.DataFrameValidation.validate_header(str(path), sample_config, sample_rows=10)
+
+    # The body is never parsed when the header is wrong
+    path.write_text("name,age\n" + "\"unterminated\n" * 3)
+    with pytest.raises(ValueError):
+        utils.DataFrameValidation.validate_header(str(path), sample_config)
+
+
+def test_validate_header_checks_the_sample(tmp_path):
+    config = {"variables": {"name": "string", "age": "int64", "born": "datetime"},
+              "date_formats": {"born": "%Y-%m-%d"}}
+    path = tmp_path / "people.csv"
+
+    # A header-only file has nothing to check
+    path.write_text("name,age,born\n")
+    utils.DataFrameValidation.validate_header(str(path), config, sample_rows=10)
+
+    path.write_text("name,age,born\nAlice,25,1997-01-01\nBob,30,01/02/1992\n")
+    with pytest.raises(ValueError, match="born"):
+        utils.DataFrameValidation.validate_header(str(path), config, sample_rows=10)
+    # The bad date is past the sample
+    utils.DataFrameValidation.validate_header(str(path), config, sample_rows=1)
+
+
+def test_shipped_schema_accepts_rows_without_index(tmp_path):
+    # `Index` is dropped by the pipeline, so its values are read as text and never rejected
+    with open("config.yaml") as f:
+        config = yaml.safe_load(f)
+    path = tmp_path / "people.csv"
+    path.write_text("Index,User Id,First Name,Last Name,Sex,Email,Phone,Date of birth,Job Title\n"
+                    ",8b756f6231DDC6e,Lee,Tran,Female,lee@example.org,0797525424,1947-01-24,Nurse\n")
+    utils.DataFrameValidation.validate_header(str(path), config, sample_rows=10)
+
+
+def test_schema_read_options(tmp_path):
+    config = {
+        "variables": {"id": "int64", "name": "string", "born": "datetime"},
+        "date_formats": {"born": "%d/%m/%Y"},
+    }
+    path = tmp_path / "people.csv"
+    path.write_text("id,name,born\n1,007,24/03/1910\n2,,26/10/1945\n")
+    df = pd.read_csv(path, **utils.Schema.read_options(config))
+
+    assert utils.DataFrameValidation.variable_types(df, config) is True
+    assert df["name"].tolist()[0] == "007"
+    assert utils.Processing.add_year_column(df, "born")["Year of birth"].tolist() == [1910, 1945]
+    assert utils.Schema.read_options({}) == {}
+
 # Tests for utils.Cleaning
 
 
@@ -129,6 +182,41 @@ def test_hash_columns_sha256_salt(sample_dataframe):
     assert "name" not in updated_df.columns
 
 
+def test_hash_columns_sha256_salt_matches_per_row_hashing():
+    salt = "12345"
+    df = pd.DataFrame({
+        "title": ["Homeopath", "Games developer", None, "Homeopath", float("nan")],
+        "mixed": [1, 1.0, True, "1", None],
+        "score": [0.0, -0.0, float("nan"), 1.5, 1.5],
+        "count": pd.array([1, None, 2, 1, None], dtype="Int64"),
+        "ratio": pd.array([0.5, None, 2.0, 0.5, 1.0], dtype="Float64"),
+        "flag": pd.array([True, None, False, True, True], dtype="boolean"),
+    })
+    expected = {
+        column: df[column].apply(
+            lambda x: hashlib.sha256(f'{x}{salt}'.encode('utf-8')).hexdigest()).tolist()
+        for column in df.columns
+    }
+
+    updated_df = utils.Processing.hash_columns_sha256_salt(
+        df.copy(), list(df.columns), salt, cache=utils.DigestCache(maxsize=2))
+    for column in df.columns:
+        assert updated_df[f"{column}_hashed"].tolist() == expected[column]
+
+
+def test_digest_cache_is_bounded_and_keyed_by_salt():
+    cache = utils.DigestCache(maxsize=2)
+    first = cache.digests(["a", "b", "a"], "salt1")
+    assert first[0] == first[2]
+    assert (cache.hits, cache.misses) == (1, 2)
+
+    assert cache.digests(["a"], "salt2") != first[:1]
+    assert len(cache) == 2
+    assert cache.digests(["c"], "salt1") == [
+        hashlib.sha256("csalt1".encode("utf-8")).hexdigest()]
+    assert len(cache) == 2
+
+
 def test_add_sourcefile_variable(sample_dataframe):
     updated_df = utils.Processing.add_sourcefile_variable(
         sample_dataframe, default_value="file1.csv")
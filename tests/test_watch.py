@@ -0,0 +1,173 @@
+"""
+Unit Tests for the Watch Mode (utils.watch).
+
+The tests cover picking up input files only once they are settled, the bounded queue and micro-batches, retrying the files of a failed batch, and processing the files landing in the inputs directory until the daemon is stopped.
+
+Dependencies:
+- utils (custom utility module)
+- pytest
+- pandas
+"""
+
+import os
+import time
+import threading
+from utils import engine, watch
+from utils.manifest import RunManifest
+import pytest
+import pandas as pd
+
+
+@pytest.fixture
+def run_config(tmp_path):
+    salt_dir = tmp_path / "salt"
+    salt_dir.mkdir()
+    (salt_dir / "salt.txt").write_text("12345")
+    inputs = tmp_path / "inputs"
+    inputs.mkdir()
+    return {
+        "csv_files": [],
+        "inputs": str(inputs),
+        "outputs": str(tmp_path / "outputs"),
+        "temp": str(tmp_path / "temp"),
+        "salt": str(salt_dir),
+        "charts": {"workers": 0},
+        "watch": {"poll_seconds": 0.05, "settle_seconds": 0, "queue_size": 2, "batch_size": 3, "batch_wait_seconds": 0.05},
+    }
+
+
+def write_csv(config, file, values, age=10):
+    path = f"{config['inputs']}/{file}.csv"
+    pd.DataFrame({"value": values}).to_csv(path, index=False)
+    modified = time.time() - age
+    os.utime(path, (modified, modified))
+
+
+def test_watcher_waits_for_settled_files(run_config):
+    watcher = watch.InputWatcher(run_config["inputs"], settle_seconds=5)
+    write_csv(run_config, "old", [1])
+    write_csv(run_config, "copying", [1], age=0)
+    (open(f"{run_config['inputs']}/other.txt", "w")).close()
+
+    assert watcher.scan() == ["old"]
+    assert watcher.scan() == []
+
+    # A rewritten file is picked up again once it settled; a removed one is forgotten
+    write_csv(run_config, "old", [1, 2], age=0)
+    assert watcher.scan() == []
+    assert watcher.settled_files() == []
+    write_csv(run_config, "old", [1, 2])
+    write_csv(run_config, "copying", [1, 2])
+    assert sorted(watcher.scan()) == ["copying", "old"]
+    os.remove(f"{run_config['inputs']}/old.csv")
+    assert watcher.scan() == []
+    assert watcher.settled_files() == ["copying"]
+    assert watcher.path("copying") == os.path.join(run_config["inputs"], "copying.csv")
+    assert watcher.path("old") is None
+
+
+def test_failed_files_are_retried_after_a_delay(run_config):
+    watcher = watch.InputWatcher(run_config["inputs"], settle_seconds=0)
+    write_csv(run_config, "people_a", [1])
+    write_csv(run_config, "people_b", [1])
+    assert watcher.scan() == ["people_a", "people_b"]
+
+    watcher.retry(["people_a", "people_b"], delay=0.1)
+    assert watcher.scan() == []
+    time.sleep(0.1)
+    # A file rewritten in the meantime was picked up anew and is not retried
+    write_csv(run_config, "people_b", [1, 2])
+    assert watcher.scan() == ["people_a", "people_b"]
+    watcher.retry(["people_b"], delay=0)
+    write_csv(run_config, "people_b", [1, 2, 3], age=20)
+    assert watcher.scan() == ["people_b"]
+    assert watcher.scan() == []
+
+
+@pytest.mark.parametrize("workers", [0, 2])
+def test_daemon_retries_a_failed_batch(run_config, workers):
+    # Without workers the run raises; with them the file is left out of the run (`context.failed`)
+    run_config["scheduler"] = {"workers": workers}
+    attempts = []
+
+    def extract(context, file):
+        attempts.append(file)
+        if len(attempts) == 1:
+            raise OSError("input not reachable")
+        return context.read_input(file)
+
+    run_config["watch"]["retry_seconds"] = 0.05
+    daemon = watch.WatchDaemon(run_config, [engine.Stage("extract", "Extract Data", extract, scope="source")])
+    thread = threading.Thread(target=daemon.run)
+    thread.start()
+    try:
+        write_csv(run_config, "people_a", [1])
+        deadline = time.time() + 10
+        while "people_a" not in RunManifest.from_config(run_config).entries and time.time() < deadline:
+            time.sleep(0.02)
+    finally:
+        daemon.stop()
+        thread.join(10)
+
+    # The file was run again without being rewritten or another file landing
+    assert daemon.failed_batches == 1
+    assert attempts == ["people_a", "people_a"]
+
+
+def test_queue_is_bounded_and_batches_are_distinct(run_config):
+    daemon = watch.WatchDaemon(run_config, stages=[])
+    assert daemon._put("a") and daemon._put("b")
+    assert daemon.queue.full()
+
+    # A full queue makes the watcher wait until the daemon stops
+    threading.Timer(0.1, daemon.stop).start()
+    assert not daemon._put("c")
+
+    daemon.queue.get()
+    daemon._put("b")
+    assert daemon.next_batch() == ["b"]
+    assert daemon.next_batch(timeout=0) == []
+
+
+def test_daemon_processes_landing_files_until_stopped(run_config):
+    processed = []
+
+    def extract(context, file):
+        processed.append(file)
+        return context.read_input(file)
+
+    def check(context, file, df):
+        if (df["value"] < 0).any():
+            raise ValueError("negative values")
+        return df
+
+    stages = [
+        engine.Stage("extract", "Extract Data", extract, scope="source"),
+        engine.Stage("check", "Check Data", check),
+    ]
+    daemon = watch.WatchDaemon(run_config, stages)
+    thread = threading.Thread(target=daemon.run)
+    thread.start()
+    deadline = time.time() + 10
+
+    def wait_for(condition):
+        while not condition() and time.time() < deadline:
+            time.sleep(0.02)
+        assert condition()
+
+    try:
+        write_csv(run_config, "people_a", [1])
+        write_csv(run_config, "people_b", [2])
+        wait_for(lambda: sorted(processed) == ["people_a", "people_b"])
+
+        # A failed batch is logged and the daemon carries on; the file is run again once fixed
+        write_csv(run_config, "people_c", [-1])
+        wait_for(lambda: daemon.failed_batches == 1)
+        write_csv(run_config, "people_c", [3], age=5)
+        wait_for(lambda: "people_c" in RunManifest.from_config(run_config).entries)
+    finally:
+        daemon.stop()
+        thread.join(10)
+
+    assert not thread.is_alive()
+    assert processed == ["people_a", "people_b", "people_c", "people_c"]
@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+"""
+Arrow-native string cleaning for the clean stage.
+
+The `arrow` cleaning engine runs the `utils.Cleaning` string operations as vectorised kernels on Arrow string arrays instead of calling Python string methods value by value. The results equal those of the `python` engine: every value is converted with `str()` first (missing values become `'nan'` or `'None'`), whitespace is what `str.split()` splits on, and special characters are what `re.sub(r'[^a-zA-Z0-9\\s]', '', ...)` removes. Cleaned columns are returned as object columns of Python strings, as with the `python` engine, in which only the values that changed are new strings; columns that are already clean are returned unchanged.
+
+Whitespace and special characters are removed by dropping bytes from the UTF-8 data buffer of the Arrow array with numpy, which is exact because ASCII bytes never occur inside multi-byte UTF-8 characters. Text with non-ASCII whitespace (e.g. a no-break space), which spans several bytes, goes through `pyarrow.compute` regex kernels instead. Uppercasing uses `pyarrow.compute.ascii_upper` on ASCII text.
+
+Columns the kernels cannot reproduce exactly fall back on the Python operation: columns that are not text or integers (e.g. floats, whose `str()` differs from Arrow's casts) and, for uppercasing, columns with non-ASCII text (Python's `str.upper()` applies special cases such as 'ß' to 'SS').
+
+Functions included in the module:
+- **to_arrow_strings(series)**: Returns a column as an Arrow string array equal to `series.astype(str)`, or None when it cannot be converted exactly.
+- **remove_whitespaces(series)**: Removes all whitespace from a column.
+- **convert_uppercase(series)**: Converts a column to uppercase.
+- **remove_special_characters(series)**: Removes all characters other than ASCII letters, digits and whitespace from a column.
+"""
+
+import re
+from typing import Callable, Optional
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+CLEANING_ENGINES = ("python", "arrow")
+
+# The characters `str.split()` and the regex `\s` treat as whitespace; none lies above U+3000
+WHITESPACE = "".join(c for c in map(chr, range(0x3001)) if c.isspace())
+_WHITESPACE_CLASS = "".join(f"\\x{{{ord(c):x}}}" for c in WHITESPACE)
+WHITESPACE_PATTERN = f"[{_WHITESPACE_CLASS}]+"
+SPECIAL_CHARACTER_PATTERN = f"[^a-zA-Z0-9{_WHITESPACE_CLASS}]+"
+NON_ASCII_WHITESPACE_PATTERN = "[" + "".join(f"\\x{{{ord(c):x}}}" for c in WHITESPACE if ord(c) > 127) + "]"
+
+# Bytes dropped from the UTF-8 data: ASCII whitespace, and for special characters everything but letters,
+# digits and ASCII whitespace (which includes every byte of a non-ASCII character)
+_WHITESPACE_BYTES = np.zeros(256, dtype=bool)
+_WHITESPACE_BYTES[[ord(c) for c in WHITESPACE if ord(c) < 128]] = True
+_SPECIAL_BYTES = ~_WHITESPACE_BYTES
+_SPECIAL_BYTES[[ord(c) for c in "abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789"]] = False
+
+
+def _strings(series: pd.Series) -> tuple:
+    """
+    Returns a column's values as an Arrow string array, or None, with a mask of the values of an object column that are not already those strings (its missing values).
+
+    The mask is False for an object column without missing values, and None for other columns, whose values are not Python strings.
+    """
+    if isinstance(series.array, pd.arrays.ArrowStringArray) and not series.hasnans:
+        return series.array.__arrow_array__(), None
+    if isinstance(series.dtype, np.dtype) and series.dtype.kind in "iu":
+        return pa.chunked_array([pc.cast(pa.array(series.to_numpy()), pa.string())]), None
+    if series.dtype != object or pd.api.types.infer_dtype(series, skipna=True) not in ("string", "empty"):
+        return None, None
+    values = series.to_numpy()
+    try:
+        strings = pa.array(values, type=pa.string(), from_pandas=True)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        return None, None
+    if not strings.null_count:
+        return pa.chunked_array([strings]), False
+    # Missing values are converted as `str()` converts them, so that they are cleaned like any other text
+    missing = strings.is_null()
+    missing_mask = missing.to_numpy(zero_copy_only=False)
+    fills = pa.array([str(value) for value in values[missing_mask]], type=pa.string())
+    return pa.chunked_array([pc.replace_with_mask(strings, missing, fills)]), missing_mask
+
+
+def to_arrow_strings(series: pd.Series) -> Optional[pa.ChunkedArray]:
+    """
+    Converts a column to an Arrow string array equal to `series.astype(str)`.
+
+    Parameters:
+        series (pd.Series): A text, Arrow string or integer column.
+
+    Returns:
+        pa.ChunkedArray: The values as strings, or None for columns that cannot be converted exactly.
+    """
+    return _strings(series)[0]
+
+
+def _drop_bytes(chunk: pa.StringArray, table: np.ndarray) -> pa.StringArray:
+    """Drops the bytes flagged in a 256-entry lookup table from every string of a null-free string array."""
+    if chunk.buffers()[2] is None:
+        return chunk
+    width = np.int64 if pa.types.is_large_string(chunk.type) else np.int32
+    offsets = np.frombuffer(chunk.buffers()[1], dtype=width)[chunk.offset:chunk.offset + len(chunk) + 1]
+    start = int(offsets[0])
+    data = np.frombuffer(chunk.buffers()[2], dtype=np.uint8)[start:int(offsets[-1])]
+    limit = int(np.flatnonzero(table).max())
+    if limit < 255:
+        # Compare first and look up only the bytes that can be dropped, e.g. the control bytes and spaces
+        candidates = np.flatnonzero(data <= limit)
+        dropped = candidates[table[data[candidates]]]
+    else:
+        dropped = np.flatnonzero(table[data])
+    if not len(dropped):
+        return chunk
+    # Each offset moves back by the number of bytes dropped before it
+    relative = offsets - start
+    new_offsets = (relative - np.searchsorted(dropped, relative)).astype(width)
+    keep = np.ones(len(data), dtype=bool)
+    keep[dropped] = False
+    kept = data[keep]
+    return pa.Array.from_buffers(chunk.type, len(chunk), [None, pa.py_buffer(new_offsets), pa.py_buffer(kept)])
+
+
+def _remove(table: np.ndarray, pattern: str) -> Callable:
+    """Returns a kernel dropping the bytes of a lookup table, or the matches of a pattern from text with non-ASCII whitespace."""
+    def kernel(strings):
+        if (not pc.all(pc.string_is_ascii(strings)).as_py()
+                and pc.any(pc.match_substring_regex(strings, NON_ASCII_WHITESPACE_PATTERN)).as_py()):
+            return pc.replace_substring_regex(strings, pattern, "")
+        chunks = strings.chunks
+        cleaned = [_drop_bytes(chunk, table) for chunk in chunks]
+        if all(new is old for new, old in zip(cleaned, chunks)):
+            return strings
+        return pa.chunked_array(cleaned, type=strings.type)
+    return kernel
+
+
+def _ascii_upper(strings: pa.ChunkedArray) -> Optional[pa.ChunkedArray]:
+    """Uppercases ASCII strings; returns None for non-ASCII text, which needs Python's case mapping."""
+    if not pc.all(pc.string_is_ascii(strings)).as_py():
+        return None
+    upper = pc.ascii_upper(strings)
+    return strings if upper.equals(strings) else upper
+
+
+def _clean(series: pd.Series, kernel: Callable, fallback: Callable) -> pd.Series:
+    """Applies a kernel to a column's strings, or the Python fallback to each value when the kernel cannot."""
+    strings, missing = _strings(series)
+    result = None if strings is None else kernel(strings)
+    if result is None:
+        return series.apply(fallback)
+    if missing is None:
+        return pd.Series(result.to_numpy(), index=series.index, name=series.name, dtype=object)
+    if result is strings and missing is False:
+        # Already clean text: keep the column as it is
+        return series
+    # Only the changed values become new Python strings; the others are kept from the column
+    changed = np.flatnonzero(pc.not_equal(result, strings).to_numpy() | missing)
+    values = series.to_numpy(copy=True)
+    values[changed] = result.take(pa.array(changed)).to_numpy()
+    return pd.Series(values, index=series.index, name=series.name, dtype=object)
+
+
+def remove_whitespaces(series: pd.Series) -> pd.Series:
+    """Removes all whitespace from the values of a column, as `''.join(str(x).split())` does."""
+    return _clean(series, _remove(_WHITESPACE_BYTES, WHITESPACE_PATTERN), lambda x: ''.join(str(x).split()))
+
+
+def convert_uppercase(series: pd.Series) -> pd.Series:
+    """Converts the values of a column to uppercase, as `str(x).upper()` does."""
+    return _clean(series, _ascii_upper, lambda x: str(x).upper())
+
+
+def remove_special_characters(series: pd.Series) -> pd.Series:
+    """Removes characters other than ASCII letters, digits and whitespace, as `re.sub(r'[^a-zA-Z0-9\\s]', '', str(x))` does."""
+    return _clean(series, _remove(_SPECIAL_BYTES, SPECIAL_CHARACTER_PATTERN), lambda x: re.sub(r'[^a-zA-Z0-9\s]', '', str(x)))
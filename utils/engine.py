@@ -0,0 +1,631 @@
+# -*- coding: utf-8 -*-
+"""
+In-process stage engine for the ETL pipeline.
+
+Pipeline stages are importable callables registered in order with the `register_stage` decorator. The `PipelineRunner` keeps each file's DataFrame in memory while it moves through the per-file stages, so extract, clean and process no longer serialise the same table to `config['temp']` between every step. Checkpoints are opt-in (`checkpoint` in `config.yaml`) and are used for debugging or for resuming a run from a later stage. Checkpoints and streamed files are written in the intermediate format of the `intermediate` section (`utils.streaming`): Parquet, or Arrow IPC files that later stages read memory-mapped.
+
+A run can be limited to some of the stages (`select_stages`) and to some of the input files; a selected stage whose predecessor is left out reads each file from its last checkpoint.
+
+With a run manifest (`incremental` in `config.yaml`), input files unchanged since they were last processed are skipped by every stage, and the processed files are recorded in the manifest when the run completes.
+
+With `scheduler.workers` set, the stages run as a dependency graph instead of one stage after another: every stage declares the stages it depends on, and each file moves through its stages on a thread pool as soon as their dependencies are done for that file (`utils.scheduler`). A file whose stage fails is left out of the rest of the run while the other files carry on. Per-step CPU time and peak RSS then cover the whole process, as the steps overlap.
+
+With `streaming` enabled, the source stage yields batches instead of a whole DataFrame and each batch is pushed through the streamable stages that follow it before being appended to the file's checkpoint, so peak memory depends on the batch size rather than on the file size.
+
+Key functionality Classes include:
+1. **Stage**:
+   - A registered pipeline step: a per-file source (`scope="source"`), a per-file transform (`scope="file"`) or a run-wide step (`scope="run"`).
+2. **PipelineContext**:
+   - Shared state for a run: the parsed config, the salt, the digest cache, the in-memory tables, the quality metrics accumulators of each file, the background chart renderer, the history of the quality metrics and the storage backend of the inputs and outputs.
+3. **PipelineRunner**:
+   - Runs the registered stages in order, or file by file along their dependencies with the stage scheduler, logging and measuring each one and writing checkpoints when enabled, streams batches through the row-wise stages when streaming is enabled, and skips unchanged files in incremental runs.
+"""
+
+import os
+import glob
+import logging
+import importlib
+import threading
+from dataclasses import dataclass
+from typing import Callable, Optional
+
+import pandas as pd
+import pyarrow as pa
+
+from utils.instrumentation import RunReport, StageProfiler
+from utils.quality import QualityAccumulator
+from utils.scheduler import StageScheduler, build_tasks
+from utils.storage import open_storage
+from utils.streaming import (INTERMEDIATE_FORMATS, find_intermediate, intermediate_format, intermediate_path,
+                             open_batch_writer, read_intermediate)
+
+
+@dataclass
+class Stage:
+    """
+    A single registered pipeline stage.
+
+    Attributes:
+        name (str): Short identifier used to select or resume from the stage (e.g. 'extract').
+        task_name (str): Human readable name used in the logs (e.g. 'Extract Data').
+        func (Callable): The stage callable. Source stages are called as `func(context, file)` and per-file stages as `func(context, file, df)`; both return the file's DataFrame. Run-wide stages are called as `func(context)`.
+        scope (str): 'source' for stages producing each file's table, 'file' for stages applied to each file's table, 'run' for stages applied once per run.
+        streamable (bool): Whether the stage works row by row and can therefore be applied to each batch of a streamed file independently.
+        depends_on (tuple): Names of the stages that must be done first, for the same file or (for run-wide stages) for every file. None depends on the stage registered before it. A stage running alongside another stage of the same file must not replace the file's table, i.e. it returns None.
+    """
+    name: str
+    task_name: str
+    func: Callable
+    scope: str = "file"
+    streamable: bool = False
+    depends_on: Optional[tuple] = None
+
+
+_REGISTRY: list = []
+
+
+def register_stage(name: str, task_name: str, scope: str = "file", streamable: bool = False,
+                   depends_on: Optional[tuple] = None) -> Callable:
+    """
+    Decorator registering a function as a pipeline stage.
+
+    Stages run in registration order, which follows the `pipeline/0N_*.py` module order when loaded with `load_stages`. Registering a name twice replaces the earlier stage in place.
+
+    Parameters:
+        name (str): Short identifier of the stage.
+        task_name (str): Name used in the log messages.
+        scope (str): 'source', 'file' or 'run'.
+        streamable (bool): Whether the stage can be applied batch by batch.
+        depends_on (tuple): Names of the stages it depends on. Defaults to the stage registered before it.
+
+    Returns:
+        Callable: The decorator, which returns the function unchanged.
+    """
+    if scope not in ("source", "file", "run"):
+        raise ValueError(f"Unknown stage scope: {scope}")
+
+    def decorator(func: Callable) -> Callable:
+        stage = Stage(name=name, task_name=task_name, func=func, scope=scope, streamable=streamable,
+                      depends_on=None if depends_on is None else tuple(depends_on))
+        for i, registered in enumerate(_REGISTRY):
+            if registered.name == name:
+                _REGISTRY[i] = stage
+                break
+        else:
+            _REGISTRY.append(stage)
+        return func
+
+    return decorator
+
+
+def registered_stages() -> list:
+    """Returns the registered stages in run order."""
+    return list(_REGISTRY)
+
+
+def load_stages(package: str = "pipeline") -> list:
+    """
+    Imports the `0N_*.py` stage modules of a package in file order so that their stages register.
+
+    Parameters:
+        package (str): The package holding the stage modules.
+
+    Returns:
+        list: The registered stages in run order.
+    """
+    package_dir = os.path.dirname(importlib.import_module(package).__file__)
+    for path in sorted(glob.glob(os.path.join(package_dir, "[0-9][0-9]_*.py"))):
+        module_name = os.path.splitext(os.path.basename(path))[0]
+        importlib.import_module(f"{package}.{module_name}")
+    return registered_stages()
+
+
+def select_stages(stages: list, names: list) -> list:
+    """
+    Selects stages by name, keeping their run order.
+
+    The first selected per-file stage reads each file's table from its last checkpoint when the stage before it is left out, as when resuming a run.
+
+    Parameters:
+        stages (list): The stages in run order.
+        names (list): The names of the stages to keep.
+
+    Returns:
+        list: The selected stages in run order.
+
+    Raises:
+        ValueError: When a name is not one of the stages.
+    """
+    unknown = [name for name in names if name not in {stage.name for stage in stages}]
+    if unknown:
+        raise ValueError(f"Unknown stages: {', '.join(unknown)}")
+    return [stage for stage in stages if stage.name in names]
+
+
+class PipelineContext:
+    """
+    Shared state passed to every stage of a run.
+
+    Attributes:
+        config (dict): The parsed `config.yaml`, loaded once per run.
+        tables (dict): The current DataFrame for each file, keyed by file name.
+        quality (dict): The quality metrics accumulators, keyed by `(file, kind)` where kind is 'raw' or 'processed'.
+        manifest (RunManifest): The run manifest of an incremental run, otherwise None.
+        skipped (list): Input files left out of the run because they are unchanged since an earlier one.
+        artifacts (dict): The artifacts written for each file (e.g. its output fragments), recorded in the manifest.
+        uploads (list): Output paths published to the storage when the run closes, once their background work (e.g. a chart) is done.
+        failed (dict): The error of each file left out of the run after one of its stages failed.
+        selected (list): The input files the run is limited to, or None for every file of `config['csv_files']`.
+        validated (set): The input files whose source CSV was validated in this run.
+    """
+
+    def __init__(self, config: dict, chart_renderer=None):
+        self.config = config
+        self.tables = {}
+        self._salt = None
+        self._digest_cache = None
+        self._chart_renderer = chart_renderer
+        self._shared_renderer = chart_renderer is not None
+        self._storage = None
+        self._metrics_store = None
+        self._lock = threading.Lock()
+        self.uploads = []
+        self.failed = {}
+        self.quality = {}
+        self.manifest = None
+        self.skipped = []
+        self.artifacts = {}
+        self.selected = None
+        self.validated = set()
+
+    @property
+    def files(self) -> list:
+        """The input files of the run (the selected ones, if any), without the unchanged files skipped by an incremental run and the files that failed."""
+        files = self.config["csv_files"] if self.selected is None else self.selected
+        return [file for file in files if file not in self.skipped and file not in self.failed]
+
+    @property
+    def batch_size(self) -> Optional[int]:
+        """Rows per batch when streaming is enabled in the config, otherwise None."""
+        streaming = self.config.get("streaming") or {}
+        if not streaming.get("enabled", False):
+            return None
+        return int(streaming.get("batch_size", 100000))
+
+    @property
+    def parallel_workers(self) -> Optional[int]:
+        """Worker processes for byte-range parallel processing when enabled in the config, otherwise None."""
+        parallel = self.config.get("parallel") or {}
+        if not parallel.get("enabled", False):
+            return None
+        return int(parallel.get("workers") or os.cpu_count() or 1)
+
+    @property
+    def streams(self) -> bool:
+        """Whether files are streamed to their checkpoints instead of being held in memory."""
+        return self.batch_size is not None or self.parallel_workers is not None
+
+    @property
+    def salt(self) -> str:
+        """The hashing salt, read from `config['salt']` on first use."""
+        if self._salt is None:
+            with open(f"{self.config['salt']}/salt.txt", "r") as text:
+                self._salt = text.read()
+        return self._salt
+
+    @property
+    def digest_cache(self):
+        """
+        The LRU cache of salted digests shared by the files of the run, or None when `hash_cache_size` is 0.
+        """
+        size = int(self.config.get("hash_cache_size", 0) or 0)
+        if self._digest_cache is None and size > 0:
+            from utils.utils import DigestCache
+            self._digest_cache = DigestCache(size)
+        return self._digest_cache
+
+    @property
+    def chart_renderer(self):
+        """The background renderer of the quality metrics charts, created on first use."""
+        with self._lock:
+            if self._chart_renderer is None:
+                from utils.render import ChartRenderer
+                self._chart_renderer = ChartRenderer(self.config)
+            return self._chart_renderer
+
+    @property
+    def storage(self):
+        """The storage backend of the inputs and outputs, created on first use."""
+        with self._lock:
+            if self._storage is None:
+                self._storage = open_storage(self.config)
+            return self._storage
+
+    @property
+    def metrics_store(self):
+        """The history of the quality metrics (`metrics_history` in the config), opened on first use, or None when it is not enabled."""
+        storage = self.storage
+        with self._lock:
+            if self._metrics_store is None:
+                from utils.metrics_store import MetricsStore
+                self._metrics_store = MetricsStore.from_config(self.config, storage) or False
+        return self._metrics_store or None
+
+    def close(self) -> None:
+        """Finishes the background work of the run: the charts still being rendered (a shared renderer is kept running), the deferred uploads, the compaction of the metrics history and the prefetches."""
+        try:
+            if self._chart_renderer is not None:
+                self._chart_renderer.flush(shutdown=not self._shared_renderer)
+            if self._metrics_store:
+                self._metrics_store.close()
+            if self.uploads:
+                self.storage.publish(self.uploads)
+                self.uploads = []
+        finally:
+            if self._storage is not None:
+                self._storage.close()
+
+    def quality_accumulator(self, file: str, kind: str) -> QualityAccumulator:
+        """Returns the raw or processed quality metrics accumulator of a file, creating it on first use."""
+        if (file, kind) not in self.quality:
+            self.quality[(file, kind)] = QualityAccumulator.from_config(self.config)
+        return self.quality[(file, kind)]
+
+    def reset_quality(self, file: str) -> None:
+        """Discards the quality metrics accumulated for a file, before it is read again."""
+        for kind in ("raw", "processed"):
+            self.quality.pop((file, kind), None)
+
+    def input_location(self, file: str) -> str:
+        """Returns the location of the source CSV of a file, a local path or an S3 location."""
+        return f"{self.config['inputs']}/{file}.csv"
+
+    def input_path(self, file: str) -> str:
+        """Returns a local path to read the source CSV of a file from, fetching it from the storage and prefetching the files after it."""
+        files = self.files
+        if file in files:
+            self.storage.prefetch([self.input_location(later) for later in files[files.index(file) + 1:]])
+        return self.storage.fetch(self.input_location(file))
+
+    def validate_input(self, file: str) -> None:
+        """
+        Validates the header and a sample of `validation.sample_rows` rows of a file's source CSV against the `variables` of the config, once per run.
+
+        Raises:
+            ValueError: When the file does not match the configuration.
+        """
+        if file in self.validated:
+            return
+        from utils.utils import DataFrameValidation
+        logging.info(f"Validating {file}")
+        sample_rows = int((self.config.get("validation") or {}).get("sample_rows", 0) or 0)
+        DataFrameValidation.validate_header(self.input_path(file), self.config, sample_rows)
+        self.validated.add(file)
+
+    def read_input(self, file: str, chunksize: Optional[int] = None, **options):
+        """Reads the source CSV of a file, whole or as a reader yielding chunks of `chunksize` rows; `options` (e.g. `dtype`) are passed to `pd.read_csv`."""
+        return pd.read_csv(self.input_path(file), chunksize=chunksize, **options)
+
+    def checkpoint_path(self, file: str) -> str:
+        """Returns the temp checkpoint path of a file, in the intermediate format."""
+        return intermediate_path(self.config, file)
+
+    def batch_writer(self, path: str):
+        """Returns a batch writer of the intermediate format for a temp file."""
+        return open_batch_writer(path, *intermediate_format(self.config))
+
+    def clear_checkpoint(self, file: str) -> None:
+        """Deletes the checkpoints of a file left in the other intermediate formats, so they are not read instead of the new one."""
+        current = self.checkpoint_path(file)
+        for fmt in INTERMEDIATE_FORMATS:
+            path = intermediate_path(self.config, file, fmt)
+            if path != current and os.path.exists(path):
+                os.remove(path)
+
+    def read_checkpoint(self, file: str, columns: Optional[list] = None) -> pa.Table:
+        """
+        Reads the last checkpoint of a file as an Arrow table, in whichever intermediate format it was written.
+
+        Arrow IPC checkpoints are memory-mapped, so reading a few columns only pages in those columns.
+
+        Parameters:
+            file (str): The file.
+            columns (list): The columns to read. Defaults to every column.
+        """
+        return read_intermediate(find_intermediate(self.config, file), columns)
+
+    def table(self, file: str) -> pd.DataFrame:
+        """
+        Returns the current DataFrame of a file.
+
+        Tables are served from memory; when a file is not held in memory (e.g. when resuming from a later stage, or after it was streamed) its last checkpoint is read from `config['temp']`.
+        """
+        if file not in self.tables:
+            self.tables[file] = self.read_checkpoint(file).to_pandas()
+        return self.tables[file]
+
+    def in_memory(self, file: str) -> bool:
+        """Returns whether the current table of a file is held in memory."""
+        return self.tables.get(file) is not None
+
+    def save_checkpoint(self, file: str) -> None:
+        """Writes the current DataFrame of a file to its temp checkpoint."""
+        with self.batch_writer(self.checkpoint_path(file)) as writer:
+            writer.write_table(pa.Table.from_pandas(self.tables[file]))
+        self.clear_checkpoint(file)
+
+
+def stream_chain(context: PipelineContext, chain: list, file: str, path: str) -> int:
+    """
+    Pushes the batches produced by a streamable source through the following stages and appends them to an intermediate file.
+
+    Parameters:
+        context (PipelineContext): The run context; its `read_input` decides which rows the source reads.
+        chain (list): A streamable source followed by streamable per-file stages.
+        file (str): The file being processed.
+        path (str): The intermediate file to write, in the format of the context's config.
+
+    Returns:
+        int: The number of rows written.
+    """
+    source, *transforms = chain
+    batches = source.func(context, file)
+    if isinstance(batches, pd.DataFrame):
+        batches = [batches]
+
+    with context.batch_writer(path) as writer:
+        for batch in batches:
+            for stage in transforms:
+                batch = stage.func(context, file, batch)
+            writer.write(batch)
+    return writer.rows
+
+
+def _rows(df) -> Optional[int]:
+    """Returns the number of rows of a DataFrame, or None for anything else (e.g. a streamed file)."""
+    return len(df) if isinstance(df, pd.DataFrame) else None
+
+
+class PipelineRunner:
+    """
+    Runs registered stages in order, keeping each file's table in memory across the per-file stages. With scheduler workers, the stages run file by file along their dependencies and a file whose stage fails is left out of the rest of the run (see `context.failed`).
+
+    Parameters:
+        config (dict): The parsed configuration.
+        stages (list): The stages to run. Defaults to the stages registered from the `pipeline` package.
+        checkpoint (bool): Whether to write a temp Parquet checkpoint after each per-file stage. Defaults to `config['checkpoint']`.
+        resume_from (str): Name of the stage to start from. Earlier stages are skipped and each file's table is read from its last checkpoint.
+        manifest (RunManifest): Run manifest enabling an incremental run: files unchanged since they were last processed are skipped by every stage, and the processed files are recorded when the run completes.
+        force (bool): Process every file of an incremental run, whether it changed or not.
+        report_path (str): JSON file the run report (the measurements of every stage and file) is written to. The report is kept in `self.report` either way.
+        chart_renderer (ChartRenderer): A chart renderer shared across runs, e.g. by the watch daemon. Its charts are waited for at the end of the run but its render pool is kept running. Defaults to a renderer of the run's own.
+        workers (int): Stage tasks run at once by the stage scheduler, or 0 to run the stages one after another. Defaults to `config['scheduler']['workers']`.
+        files (list): The input files to run, a subset of `config['csv_files']`. Defaults to every file. Files left out are neither processed nor removed from the manifest or the output.
+    """
+
+    def __init__(self, config: dict, stages: Optional[list] = None,
+                 checkpoint: Optional[bool] = None, resume_from: Optional[str] = None,
+                 manifest=None, force: bool = False, report_path: Optional[str] = None,
+                 chart_renderer=None, workers: Optional[int] = None, files: Optional[list] = None):
+        self.context = PipelineContext(config, chart_renderer)
+        self.context.manifest = manifest
+        if files is not None:
+            unknown = [file for file in files if file not in config["csv_files"]]
+            if unknown:
+                raise ValueError(f"Unknown input files: {', '.join(unknown)}")
+            self.context.selected = [file for file in config["csv_files"] if file in files]
+        self.stages = stages if stages is not None else load_stages()
+        self.checkpoint = config.get("checkpoint", False) if checkpoint is None else checkpoint
+        self.force = force
+        if workers is None:
+            workers = (config.get("scheduler") or {}).get("workers", 0)
+        self.workers = int(workers or 0)
+        self._states = {}
+        self.report = RunReport(report_path)
+        run_id = os.path.basename(report_path).split(".")[0] if report_path else None
+        self.profiler = StageProfiler(config, run_id)
+
+        if resume_from is not None:
+            names = [stage.name for stage in self.stages]
+            if resume_from not in names:
+                raise ValueError(f"Unknown stage to resume from: {resume_from}")
+            self.stages = self.stages[names.index(resume_from):]
+
+    def run_file_stage(self, stage: Stage, file: str, measurement=None) -> None:
+        """Runs a per-file or source stage for one file, measuring it, and keeps the table it returns."""
+        with self.report.measure(stage.name, file) as step:
+            if stage.scope == "source":
+                df_in = None
+                df = stage.func(self.context, file)
+            elif not self.context.streams or stage.streamable:
+                # Row-wise stages take a DataFrame, read from the checkpoint when the file is not in memory
+                df_in = self.context.table(file)
+                df = stage.func(self.context, file, df_in)
+            else:
+                # Streamed files stay on disk; the stage receives None and reads its checkpoint
+                df_in = self.context.tables.get(file)
+                df = stage.func(self.context, file, df_in)
+            step.add_rows(_rows(df_in), _rows(df))
+            if measurement is not None:
+                measurement.add_rows(_rows(df_in), _rows(df))
+            if df is None:
+                return
+            self.context.tables[file] = df
+            if self.checkpoint:
+                self.context.save_checkpoint(file)
+
+    def run_stage(self, stage: Stage) -> None:
+        """Runs a single stage, measuring it and each of its files, and logs its success or failure."""
+        logging.info(f"{stage.task_name} started...")
+        try:
+            with self.report.measure(stage.name) as measurement, self.profiler.profile(stage.name):
+                if stage.scope == "run":
+                    stage.func(self.context)
+                else:
+                    for file in self.context.files:
+                        self.run_file_stage(stage, file, measurement)
+            logging.info(f"{stage.task_name} completed successfully.")
+        except Exception as e:
+            logging.error(f"Error in {stage.task_name}: {e}")
+            raise
+
+    def streamed_chain(self, stages: list) -> list:
+        """
+        Returns the leading stages that can be streamed together: a streamable source followed by the streamable per-file stages after it.
+
+        The chain is empty when neither streaming nor parallel processing is enabled, or when the first stage is not a streamable source.
+        """
+        if not self.context.streams or not stages:
+            return []
+        if stages[0].scope != "source" or not stages[0].streamable:
+            return []
+        chain = [stages[0]]
+        for stage in stages[1:]:
+            if stage.scope != "file" or not stage.streamable:
+                break
+            chain.append(stage)
+        return chain
+
+    def stream_file(self, chain: list, file: str) -> int:
+        """
+        Streams a file through a chain of stages into the file's checkpoint.
+
+        With parallel processing enabled the file is split into byte ranges handled by a process pool; otherwise it is streamed batch by batch in this process.
+
+        Parameters:
+            chain (list): A streamable source followed by streamable per-file stages.
+            file (str): The file to stream.
+
+        Returns:
+            int: The number of rows written.
+        """
+        self.context.tables.pop(file, None)
+        if self.context.parallel_workers:
+            from utils.parallel import process_file_in_ranges
+            rows = process_file_in_ranges(self.context, chain, file)
+        else:
+            rows = stream_chain(self.context, chain, file, self.context.checkpoint_path(file))
+        self.context.clear_checkpoint(file)
+        return rows
+
+    def run_streamed(self, chain: list) -> None:
+        """Streams every file through a chain of stages and logs its success or failure."""
+        task_names = ", ".join(stage.task_name for stage in chain)
+        if self.context.parallel_workers:
+            logging.info(f"{task_names} started ({self.context.parallel_workers} parallel workers)...")
+        else:
+            logging.info(f"{task_names} started (streaming {self.context.batch_size} rows per batch)...")
+        name = "+".join(stage.name for stage in chain)
+        try:
+            with self.report.measure(name) as measurement, self.profiler.profile(name):
+                for file in self.context.files:
+                    with self.report.measure(name, file) as step:
+                        rows = self.stream_file(chain, file)
+                        step.add_rows(rows_out=rows)
+                        measurement.add_rows(rows_out=rows)
+                    logging.info(f"Streamed {rows} rows of {file}")
+            logging.info(f"{task_names} completed successfully.")
+        except Exception as e:
+            logging.error(f"Error in {task_names}: {e}")
+            raise
+
+    def run_task(self, task, file: Optional[str]) -> None:
+        """Runs a task of the stage graph for one file, or a run-wide task for the whole run, and logs its failure."""
+        if task.scope == "run":
+            self.run_stage(task.stages[0])
+            return
+        task_names = ", ".join(stage.task_name for stage in task.stages)
+        logging.info(f"{task_names} started for {file}...")
+        try:
+            with self.profiler.profile(task.name, file):
+                if task.streamed:
+                    with self.report.measure(task.name, file) as step:
+                        rows = self.stream_file(task.stages, file)
+                        step.add_rows(rows_out=rows)
+                    logging.info(f"Streamed {rows} rows of {file}")
+                else:
+                    for stage in task.stages:
+                        self.run_file_stage(stage, file)
+            logging.info(f"{task_names} completed for {file}.")
+        except Exception as e:
+            logging.error(f"Error in {task_names} for {file}: {e}")
+            raise
+
+    def run_scheduled(self, stages: list) -> None:
+        """Runs the stages file by file along their dependencies with the stage scheduler, leaving failed files out."""
+        tasks = build_tasks(stages, self.streamed_chain)
+        logging.info(f"Scheduling {len(tasks)} stage tasks on {self.workers} workers...")
+        with self.report.measure("scheduled"):
+            StageScheduler(tasks, self.context.files, self.workers, self.run_task, self.context.failed).run()
+        for file in self.context.failed:
+            self.context.tables.pop(file, None)
+        if self.context.failed:
+            logging.info(f"{len(self.context.failed)} files failed: {', '.join(self.context.failed)}")
+
+    def plan_incremental(self) -> None:
+        """Compares every input file with the run manifest and skips the files that are unchanged."""
+        manifest = self.context.manifest
+        skipped = []
+        for file in self.context.files:
+            state = manifest.file_state(file, self.context.input_location(file), self.context.salt)
+            if not self.force and manifest.is_current(file, state):
+                skipped.append(file)
+            else:
+                self._states[file] = state
+        self.context.skipped = skipped
+
+    def record_incremental(self) -> None:
+        """Records the processed files and their artifacts in the run manifest and logs the run report."""
+        manifest = self.context.manifest
+        processed = self.context.files
+        for file in processed:
+            artifacts = dict(self.context.artifacts.get(file, {}))
+            if (self.checkpoint or self.context.streams) and os.path.exists(self.context.checkpoint_path(file)):
+                artifacts["checkpoint"] = self.context.checkpoint_path(file)
+            manifest.record(file, self._states[file], artifacts)
+        removed = manifest.removed_files(self.context.config["csv_files"])
+        for file in removed:
+            manifest.forget(file)
+        manifest.save(processed, self.context.skipped, removed, forced=self.force)
+
+        logging.info(f"Processed {len(processed)} files: {', '.join(processed) or 'none'}")
+        logging.info(f"Skipped {len(self.context.skipped)} unchanged files: {', '.join(self.context.skipped) or 'none'}")
+        if removed:
+            logging.info(f"Removed {len(removed)} files no longer in the inputs: {', '.join(removed)}")
+
+    def run(self) -> PipelineContext:
+        """Runs every stage in order and returns the run context."""
+        logging.info("Pipeline started...")
+        if self.context.manifest is not None:
+            self.plan_incremental()
+
+        stages = list(self.stages)
+        try:
+            try:
+                if self.workers > 0:
+                    self.run_scheduled(stages)
+                    stages = []
+                while stages:
+                    chain = self.streamed_chain(stages)
+                    if chain:
+                        self.run_streamed(chain)
+                        stages = stages[len(chain):]
+                    else:
+                        self.run_stage(stages.pop(0))
+            finally:
+                with self.report.measure("close"):
+                    self.context.close()
+
+            if self.context.manifest is not None:
+                self.record_incremental()
+        except Exception as e:
+            self.report.write("failed", str(e), files=self.context.files, skipped=self.context.skipped,
+                              failed=self.context.failed)
+            raise
+
+        self.report.write("partial" if self.context.failed else "completed", files=self.context.files,
+                          skipped=self.context.skipped, failed=self.context.failed)
+        if self.report.path is not None:
+            logging.info(f"Run report saved at {self.report.path}")
+        logging.info("Pipeline completed.")
+        return self.context
@@ -0,0 +1,249 @@
+# -*- coding: utf-8 -*-
+"""
+Performance instrumentation of pipeline runs.
+
+Every stage, and every file within a per-file stage, is measured for wall time, CPU time, peak RSS growth, rows in and out, and bytes read and written. The measurements of a run are collected in a `RunReport` and written as JSON next to the run's log file. Stages can also be profiled with cProfile or tracemalloc when enabled in the `profiling` section of `config.yaml`; when profiling is disabled each stage only pays for a None check.
+
+Resource counters are read from `/proc/self` on Linux. Elsewhere the peak RSS falls back on the lifetime peak reported by `resource` and the byte counters are reported as None. CPU time includes the child processes (e.g. parallel workers) that finished during a step, while RSS and bytes cover the pipeline process only. When the stage scheduler runs steps side by side, these process-wide counters also include the work of the steps running at the same time; wall time and rows stay exact.
+
+Functions and Classes included in the module:
+- **io_counters()**: Returns the bytes read and written by the current process so far.
+- **reset_peak_rss()** and **peak_rss()**: Reset and read the peak resident set size of the current process.
+- **Measurement**: Context manager measuring the resource usage of one stage or per-file step.
+- **RunReport**: The measurements of a run, written as a JSON report.
+- **StageProfiler**: Opt-in cProfile or tracemalloc profiling of selected stages.
+"""
+
+import os
+import sys
+import json
+import time
+import cProfile
+import threading
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+from datetime import datetime
+from typing import Optional
+
+PROFILING_MODES = ("none", "cprofile", "tracemalloc")
+
+
+def io_counters() -> dict:
+    """Returns the `rchar`/`wchar` counters of the current process, or None values when unavailable."""
+    try:
+        with open("/proc/self/io") as f:
+            counters = dict(line.split(": ") for line in f.read().splitlines())
+        return {"read": int(counters["rchar"]), "written": int(counters["wchar"])}
+    except (OSError, KeyError, ValueError):
+        return {"read": None, "written": None}
+
+
+def _status_kb(field: str) -> Optional[int]:
+    """Returns a memory field of `/proc/self/status` in bytes, or None when unavailable."""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith(f"{field}:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+def reset_peak_rss() -> bool:
+    """Resets the peak resident set size of the current process; returns False where this is not supported."""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def peak_rss() -> int:
+    """Returns the peak resident set size of the current process in bytes, since start or the last reset."""
+    peak = _status_kb("VmHWM")
+    if peak is not None:
+        return peak
+    # Fall back on the lifetime peak, reported in kilobytes on Linux and in bytes on macOS
+    import resource
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def current_rss() -> int:
+    """Returns the resident set size of the current process in bytes (the peak where it cannot be read)."""
+    rss = _status_kb("VmRSS")
+    return rss if rss is not None else peak_rss()
+
+
+def _cpu_seconds() -> float:
+    """Returns the CPU time of the process and of its finished children."""
+    times = os.times()
+    return times.user + times.system + times.children_user + times.children_system
+
+
+class Measurement:
+    """
+    Measures the wall time, CPU time, peak RSS growth and bytes read and written of a stage or per-file step.
+
+    The peak RSS is reset once per run, by `RunReport`, so that measurements can be nested or run side by side without resetting each other. A step whose work raised the process peak reports that new peak; otherwise it reports the larger of its RSS at start and at end.
+
+    Parameters:
+        stage (str): The stage name.
+        file (str): The file of a per-file step, or None for a whole stage.
+    """
+
+    def __init__(self, stage: str, file: Optional[str] = None):
+        self.stage = stage
+        self.file = file
+        self.rows_in = None
+        self.rows_out = None
+        self.result = {}
+
+    def add_rows(self, rows_in: Optional[int] = None, rows_out: Optional[int] = None) -> None:
+        """Adds to the rows read and written by the step."""
+        if rows_in is not None:
+            self.rows_in = (self.rows_in or 0) + rows_in
+        if rows_out is not None:
+            self.rows_out = (self.rows_out or 0) + rows_out
+
+    def __enter__(self):
+        self._rss = current_rss()
+        self._peak = peak_rss()
+        self._io = io_counters()
+        self._cpu = _cpu_seconds()
+        self._wall = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        wall = time.perf_counter() - self._wall
+        cpu = _cpu_seconds() - self._cpu
+        io = io_counters()
+        peak = peak_rss()
+        if peak <= self._peak:
+            peak = max(self._rss, current_rss())
+        self.result = {
+            "stage": self.stage,
+            "file": self.file,
+            "status": "failed" if exc_type is not None else "completed",
+            "wall_seconds": round(wall, 6),
+            "cpu_seconds": round(cpu, 6),
+            "peak_rss_bytes": peak,
+            "peak_rss_delta_bytes": max(peak - self._rss, 0),
+            "rows_in": self.rows_in,
+            "rows_out": self.rows_out,
+            "bytes_read": None if io["read"] is None else io["read"] - self._io["read"],
+            "bytes_written": None if io["written"] is None else io["written"] - self._io["written"],
+        }
+        return False
+
+
+class RunReport:
+    """
+    The measurements of a pipeline run. Creating the report resets the peak RSS of the process.
+
+    Parameters:
+        path (str): The JSON file the report is written to, or None to only keep it in memory.
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path
+        self.started_at = datetime.now().isoformat(timespec="seconds")
+        self.steps = []
+        self._wall = time.perf_counter()
+        self._cpu = _cpu_seconds()
+        reset_peak_rss()
+
+    @contextmanager
+    def measure(self, stage: str, file: Optional[str] = None):
+        """Measures a stage or per-file step and adds it to the report, also when it fails."""
+        measurement = Measurement(stage, file)
+        try:
+            with measurement:
+                yield measurement
+        finally:
+            self.steps.append(measurement.result)
+
+    def to_dict(self, status: str = "completed", error: Optional[str] = None, **extra) -> dict:
+        """Returns the report as a JSON-serialisable dictionary."""
+        return dict({
+            "started_at": self.started_at,
+            "finished_at": datetime.now().isoformat(timespec="seconds"),
+            "status": status,
+            "error": error,
+            "wall_seconds": round(time.perf_counter() - self._wall, 6),
+            "cpu_seconds": round(_cpu_seconds() - self._cpu, 6),
+            "steps": self.steps,
+        }, **extra)
+
+    def write(self, status: str = "completed", error: Optional[str] = None, **extra) -> None:
+        """Writes the report to its JSON file, if it has one."""
+        if self.path is None:
+            return
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with open(self.path, "w") as f:
+            json.dump(self.to_dict(status, error, **extra), f, indent=2)
+
+
+class StageProfiler:
+    """
+    Opt-in per-stage profiling configured in the `profiling` section of the config.
+
+    With `mode: cprofile` each selected stage is run under cProfile and its stats are dumped to `{directory}/{run_id}_{stage}.prof` (readable with `pstats` or snakeviz). With `mode: tracemalloc` a tracemalloc snapshot is dumped to `{directory}/{run_id}_{stage}.tracemalloc` (readable with `tracemalloc.Snapshot.load`). Under the stage scheduler each file is profiled on its own, as `{run_id}_{stage}_{file}`. Profiled steps can run side by side: each cProfile profiler only sees the thread that enabled it, while tracemalloc traces the whole process, so its snapshots include the allocations of the steps running at the same time. `stages` selects stages by name; a fused streamed task such as `extract+clean+process` is profiled when any of its stages is selected.
+
+    Parameters:
+        config (dict): The parsed configuration.
+        run_id (str): Prefix of the profile files. Defaults to the current datetime.
+    """
+
+    def __init__(self, config: dict, run_id: Optional[str] = None):
+        profiling = config.get("profiling") or {}
+        self.mode = profiling.get("mode") or "none"
+        if self.mode not in PROFILING_MODES:
+            raise ValueError(f"Unknown profiling mode: {self.mode}")
+        self.stages = profiling.get("stages") or []
+        self.directory = profiling.get("directory") or "logs/profiles"
+        self.run_id = run_id or datetime.now().strftime("%Y%m%d_%H%M%S")
+        self._lock = threading.Lock()
+        self._tracing = 0
+
+    def profile(self, stage: str, file: Optional[str] = None):
+        """Returns a context manager profiling a stage, or one file of it, or a no-op one when the stage is not profiled."""
+        if self.mode == "none" or (self.stages and not set(stage.split("+")) & set(self.stages)):
+            return nullcontext()
+        return self._profile(stage, file)
+
+    @contextmanager
+    def _profile(self, stage: str, file: Optional[str] = None):
+        name = f"{stage}_{file}" if file else stage
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, f"{self.run_id}_{name}")
+        if self.mode == "cprofile":
+            profiler = cProfile.Profile()
+            # Only enabling and disabling the profilers is serialised, not the profiled steps
+            with self._lock:
+                profiler.enable()
+            try:
+                yield
+            finally:
+                with self._lock:
+                    profiler.disable()
+                profiler.dump_stats(f"{path}.prof")
+        else:
+            # tracemalloc is process-wide: it is started by the first traced step and stopped by the last one
+            with self._lock:
+                if self._tracing == 0 and not tracemalloc.is_tracing():
+                    tracemalloc.start(25)
+                    self._tracing = 1
+                elif self._tracing:
+                    self._tracing += 1
+            try:
+                yield
+            finally:
+                tracemalloc.take_snapshot().dump(f"{path}.tracemalloc")
+                with self._lock:
+                    if self._tracing:
+                        self._tracing -= 1
+                        if self._tracing == 0:
+                            tracemalloc.stop()
@@ -0,0 +1,330 @@
+# -*- coding: utf-8 -*-
+"""
+Persistent key index of the output dataset, for deduplication and upserts on a key column (e.g. `User Id`).
+
+The index is an embedded SQLite table mapping every key of the dataset to the fragment and row holding it. When new fragments are written, their keys are probed against the index in a single batched join, so the cost of a write grows with the incoming rows rather than with the size of the dataset. A key already in the dataset is an upsert: the newest row wins, and the earlier row is deleted by rewriting the fragment holding it. Only the fragments holding replaced rows are rewritten, then their rows are indexed again. A fragment left without rows is kept empty, so the run manifest still finds the fragments of its file.
+
+In incremental runs the replaced rows stay recoverable: they are kept in the index (as Arrow IPC batches) with the fragment that replaced them. When that fragment is removed, because its file changed or left the inputs, the rows it replaced are written back to the dataset, in a new fragment of their own file next to the one they came from, unless a newer fragment of another file holds their key by then. Otherwise a key held by two files would be lost with the file that won it.
+
+The index is kept next to the dataset (`{outputs}/{output_asset_name}.keys.sqlite` by default). On S3 it is downloaded at the start of a write and uploaded at the end. When the index is missing, it is rebuilt from the key columns of the existing fragments. Any duplicates already in the dataset are dropped at that point, keeping the row of the last fragment in path order; the rows replaced before are lost with the old index. Rows with a null key are never deduplicated.
+
+Key functionality Classes include:
+1. **KeyIndex**:
+   - Probes the keys of newly written fragments, deletes the rows they replace from earlier fragments, and records where each key now lives.
+   - Writes the replaced rows back when the fragments that replaced them are removed.
+"""
+
+import os
+import re
+import logging
+import posixpath
+import sqlite3
+from typing import Optional
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from utils.storage import LocalStorage, is_remote, open_storage
+
+# Rows handed to SQLite per batch of inserts, bounding the Python rows built at once
+PROBE_BATCH_ROWS = 10000
+
+
+class KeyIndex:
+    """
+    Key index of a Parquet dataset, stored in SQLite.
+
+    Fragments are identified by their path relative to the dataset, so the index works the same for local and S3 outputs.
+
+    Parameters:
+        path (str): The SQLite file of the index, local or on S3, or None for an index kept in memory (e.g. for a new snapshot).
+        dataset_path (str): The dataset directory or S3 prefix.
+        config (dict): The parsed configuration, giving the `dedup` key and the `output` settings used to rewrite fragments.
+        storage (LocalStorage): The storage backend of the outputs. Defaults to local files.
+    """
+
+    def __init__(self, path: Optional[str], dataset_path: str, config: dict, storage=None):
+        self.path = path
+        self.dataset_path = dataset_path.rstrip("/")
+        self.key = config["dedup"]["key"]
+        self.storage = storage or LocalStorage()
+        output = config.get("output") or {}
+        self.write_options = {
+            "row_group_size": int(output.get("row_group_size", 1024 * 1024)),
+            "compression": output.get("compression", "snappy"),
+            "use_dictionary": True if output.get("dictionary_columns") is None else list(output["dictionary_columns"]),
+        }
+        self.replaced = 0
+
+        if path is None:
+            self.connection = sqlite3.connect(":memory:")
+            self._create()
+            return
+        local = self.storage.local_path(path)
+        exists = self.storage.exists(path)
+        if exists:
+            local = self.storage.fetch(path)
+        else:
+            os.makedirs(os.path.dirname(local) or ".", exist_ok=True)
+            if os.path.exists(local):
+                os.remove(local)
+        self.connection = sqlite3.connect(local)
+        self._create()
+        if not exists:
+            self.rebuild()
+
+    @classmethod
+    def from_config(cls, config: dict, dataset_path: str, storage=None, persistent: bool = True) -> Optional["KeyIndex"]:
+        """
+        Opens the key index configured in the `dedup` section of the config.
+
+        Parameters:
+            config (dict): The parsed configuration.
+            dataset_path (str): The dataset directory or S3 prefix.
+            storage (LocalStorage): The storage backend of the outputs. Defaults to the one of the config's locations.
+            persistent (bool): Whether the index is kept with the dataset (`dedup.index`), or only in memory for a dataset written from scratch.
+
+        Returns:
+            KeyIndex: The index, or None when no `dedup.key` is configured.
+        """
+        dedup = config.get("dedup") or {}
+        if not dedup.get("key"):
+            return None
+        path = None
+        if persistent:
+            path = dedup.get("index") or f"{config['outputs']}/{config['output_asset_name']}.keys.sqlite"
+        return cls(path, dataset_path, config, storage or open_storage(config))
+
+    def _create(self) -> None:
+        self.connection.executescript("""
+            CREATE TABLE IF NOT EXISTS keys (key PRIMARY KEY, fragment TEXT NOT NULL, row INTEGER NOT NULL) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS keys_fragment ON keys (fragment);
+            CREATE TABLE IF NOT EXISTS replaced_batches (batch INTEGER PRIMARY KEY, fragment TEXT NOT NULL, data BLOB NOT NULL);
+            CREATE TABLE IF NOT EXISTS replaced (key NOT NULL, batch INTEGER NOT NULL, row INTEGER NOT NULL, replaced_by TEXT NOT NULL);
+            CREATE INDEX IF NOT EXISTS replaced_by_fragment ON replaced (replaced_by);
+            CREATE TEMP TABLE IF NOT EXISTS probe (key PRIMARY KEY, fragment TEXT NOT NULL, row INTEGER NOT NULL) WITHOUT ROWID;
+        """)
+
+    def _relative(self, location: str) -> str:
+        """Returns the path of a fragment relative to the dataset."""
+        return location[len(self.dataset_path) + 1:].replace(os.sep, "/")
+
+    def _location(self, fragment: str) -> str:
+        """Returns the location of a fragment, a local path or an S3 location."""
+        return f"{self.dataset_path}/{fragment}"
+
+    def _keys(self, local: str) -> pd.Series:
+        """Reads the key column of a fragment file."""
+        parquet_file = pq.ParquetFile(local)
+        try:
+            return parquet_file.read(columns=[self.key]).column(0).to_pandas()
+        finally:
+            parquet_file.close()
+
+    def __len__(self) -> int:
+        return self.connection.execute("SELECT COUNT(*) FROM keys").fetchone()[0]
+
+    def _insert(self, table: str, rows: pd.DataFrame) -> None:
+        """Inserts rows of (key, fragment, row) into a table in batches, the last row of a key winning."""
+        for start in range(0, len(rows), PROBE_BATCH_ROWS):
+            batch = rows.iloc[start:start + PROBE_BATCH_ROWS]
+            self.connection.executemany(f"INSERT OR REPLACE INTO {table} VALUES (?, ?, ?)", [
+                (_value(key), fragment, int(row)) for key, fragment, row in batch.itertuples(index=False, name=None)])
+
+    def _probe(self, rows: pd.DataFrame) -> pd.DataFrame:
+        """Loads rows of (key, fragment, row) into the probe table and returns the indexed locations of their keys."""
+        self.connection.execute("DELETE FROM probe")
+        self._insert("probe", rows)
+        return pd.DataFrame(self.connection.execute(
+            "SELECT k.key, k.fragment, k.row FROM probe p JOIN keys k ON k.key = p.key").fetchall(),
+            columns=["key", "fragment", "row"])
+
+    def locate(self, keys: list) -> dict:
+        """Returns the fragment and row of each of the given keys found in the index, probed in batches."""
+        found = self._probe(pd.DataFrame({"key": list(keys), "fragment": "", "row": 0}))
+        return {key: (fragment, row) for key, fragment, row in found.itertuples(index=False, name=None)}
+
+    def upsert(self, fragments: list, local_paths: Optional[list] = None, keep_replaced: bool = False) -> int:
+        """
+        Indexes newly written fragments, deleting the rows of earlier fragments whose key they hold again.
+
+        Parameters:
+            fragments (list): The locations of the new fragments, in write order. A key held by several of them is kept in the last one.
+            local_paths (list): Staging copies of the fragments, read and rewritten in place and published by the caller. By default the fragments are fetched from the storage, and published again when rewritten.
+            keep_replaced (bool): Keep the deleted rows of earlier fragments in the index, to write them back when the new fragments are removed (see `forget`).
+
+        Returns:
+            int: The number of rows deleted from the dataset.
+        """
+        staged = {}
+        if local_paths is not None:
+            staged = {self._relative(location): local for location, local in zip(fragments, local_paths)}
+        incoming = []
+        for location in fragments:
+            fragment = self._relative(location)
+            keys = self._keys(staged.get(fragment) or self.storage.fetch(location))
+            rows = pd.DataFrame({"key": keys, "fragment": fragment, "row": range(len(keys))})
+            incoming.append(rows[keys.notna().to_numpy()])
+        if not incoming:
+            return 0
+        incoming = pd.concat(incoming, ignore_index=True)
+
+        # Keys held twice by the new fragments keep their last row, keys already indexed lose their earlier row
+        earlier = self._probe(incoming)
+        # The probe table holds the new fragment of each key, which replaces its earlier row
+        earlier["replaced_by"] = earlier["key"].map(dict(self.connection.execute("SELECT key, fragment FROM probe").fetchall()))
+        replaced = pd.concat([incoming[incoming["key"].duplicated(keep="last")], earlier], ignore_index=True)
+        self.connection.execute("INSERT OR REPLACE INTO keys SELECT key, fragment, row FROM probe")
+        for fragment, rows in replaced.groupby("fragment", sort=True):
+            kept = rows.dropna(subset=["replaced_by"]) if keep_replaced else rows.iloc[:0]
+            self._delete_rows(fragment, set(rows["row"]), staged.get(fragment),
+                              dict(zip(kept["row"], kept["replaced_by"])))
+        self.connection.commit()
+        self.replaced += len(replaced)
+        return len(replaced)
+
+    def _delete_rows(self, fragment: str, rows: set, staged: Optional[str] = None, keep: Optional[dict] = None) -> None:
+        """Rewrites a fragment without some of its rows and indexes its remaining rows again; the rows in `keep` are kept in the index with the fragment that replaced them."""
+        location = self._location(fragment)
+        local = staged
+        if local is None:
+            if self.storage.missing([location]):
+                # The fragment was deleted outside of the pipeline; its entries are stale
+                self.connection.execute("DELETE FROM keys WHERE fragment = ?", (fragment,))
+                return
+            local = self.storage.fetch(location)
+        parquet_file = pq.ParquetFile(local)
+        try:
+            table = parquet_file.read()
+        finally:
+            parquet_file.close()
+        if keep:
+            self._keep_rows(fragment, table, keep)
+        table = table.filter(pa.array([row not in rows for row in range(table.num_rows)]))
+        partial = f"{local}.tmp"
+        pq.write_table(table, partial, **self.write_options)
+        os.replace(partial, local)
+        if staged is None:
+            self.storage.publish([location])
+
+        keys = table.column(self.key).to_pandas()
+        self.connection.execute("DELETE FROM keys WHERE fragment = ?", (fragment,))
+        self._insert("keys", pd.DataFrame({"key": keys, "fragment": fragment, "row": range(len(keys))})[
+            keys.notna().to_numpy()])
+
+    def _keep_rows(self, fragment: str, table: pa.Table, keep: dict) -> None:
+        """Stores rows of a fragment about to be deleted, with the fragment replacing each of them."""
+        rows = sorted(keep)
+        kept = table.take(pa.array(rows, type=pa.int64()))
+        sink = pa.BufferOutputStream()
+        with pa.ipc.new_stream(sink, kept.schema) as writer:
+            writer.write_table(kept)
+        batch = self.connection.execute("INSERT INTO replaced_batches (fragment, data) VALUES (?, ?)",
+                                        (fragment, sink.getvalue().to_pybytes())).lastrowid
+        keys = kept.column(self.key).to_pylist()
+        self.connection.executemany("INSERT INTO replaced VALUES (?, ?, ?, ?)", [
+            (key, batch, position, keep[row]) for position, (key, row) in enumerate(zip(keys, rows))])
+
+    def forget(self, fragments: list) -> int:
+        """
+        Drops the keys of deleted fragments from the index, and writes back the rows these fragments had replaced.
+
+        A replaced row whose key is held by another fragment by then is kept, as replaced by that fragment. The rows kept for the deleted fragments' own replaced rows are dropped.
+
+        Parameters:
+            fragments (list): The locations of the deleted fragments.
+
+        Returns:
+            int: The number of rows written back to the dataset.
+        """
+        removed = [self._relative(location) for location in fragments]
+        for fragment in removed:
+            self.connection.execute("DELETE FROM keys WHERE fragment = ?", (fragment,))
+            self.connection.execute(
+                "DELETE FROM replaced WHERE batch IN (SELECT batch FROM replaced_batches WHERE fragment = ?)", (fragment,))
+            self.connection.execute("DELETE FROM replaced_batches WHERE fragment = ?", (fragment,))
+        candidates = []
+        for fragment in removed:
+            candidates.extend(self.connection.execute(
+                "SELECT rowid, key, batch, row FROM replaced WHERE replaced_by = ?", (fragment,)).fetchall())
+        candidates = pd.DataFrame(candidates, columns=["rowid", "key", "batch", "row"]).sort_values("rowid")
+        held = self.locate(candidates["key"].unique().tolist()) if len(candidates) else {}
+
+        # The latest replaced row of a key is written back, unless another fragment holds the key by then
+        restored = candidates[~candidates["key"].isin(list(held))].drop_duplicates("key", keep="last")
+        restored_to = self._restore(restored)
+        held.update({key: restored_to[(batch, row)] for key, batch, row in
+                     restored[["key", "batch", "row"]].itertuples(index=False, name=None)})
+        self.connection.executemany("DELETE FROM replaced WHERE rowid = ?", [(int(rowid),) for rowid in restored["rowid"]])
+        self.connection.executemany("UPDATE replaced SET replaced_by = ? WHERE rowid = ?", [
+            (held[key][0], int(rowid)) for rowid, key in candidates[~candidates["rowid"].isin(restored["rowid"])][
+                ["rowid", "key"]].itertuples(index=False, name=None)])
+        self.connection.execute("DELETE FROM replaced_batches WHERE batch NOT IN (SELECT batch FROM replaced)")
+        self.connection.commit()
+        if len(restored):
+            logging.info(f"Restored {len(restored)} rows on {self.key} replaced by the removed fragments")
+        return len(restored)
+
+    def _restore(self, restored: pd.DataFrame) -> dict:
+        """
+        Writes replaced rows back to the dataset, in one new fragment per fragment they came from, and indexes them.
+
+        Returns:
+            dict: The new fragment and row of each restored (batch, row).
+        """
+        tables = {}
+        for batch, rows in restored.groupby("batch", sort=True):
+            fragment, data = self.connection.execute(
+                "SELECT fragment, data FROM replaced_batches WHERE batch = ?", (int(batch),)).fetchone()
+            table = pa.ipc.open_stream(pa.py_buffer(data)).read_all().take(pa.array(rows["row"].tolist(), type=pa.int64()))
+            tables.setdefault(fragment, []).append((int(batch), rows["row"].tolist(), table))
+
+        locations = {}
+        for fragment, parts in tables.items():
+            target = self._next_fragment(fragment)
+            location = self._location(target)
+            local = self.storage.local_path(location)
+            os.makedirs(os.path.dirname(local) or ".", exist_ok=True)
+            table = pa.concat_tables([table for _, _, table in parts])
+            pq.write_table(table, local, **self.write_options)
+            self.storage.publish([location])
+            keys = table.column(self.key).to_pandas()
+            self._insert("keys", pd.DataFrame({"key": keys, "fragment": target, "row": range(len(keys))}))
+            position = 0
+            for batch, rows, _ in parts:
+                for row in rows:
+                    locations[(batch, row)] = (target, position)
+                    position += 1
+        return locations
+
+    def _next_fragment(self, fragment: str) -> str:
+        """Returns an unused fragment name of the same file and directory, e.g. `people_a-3.parquet` for `people_a-0.parquet`."""
+        directory, name = posixpath.split(fragment)
+        match = re.fullmatch(r"(.*)-(\d+)\.parquet", name)
+        stem = match.group(1) if match else posixpath.splitext(name)[0]
+        pattern = re.compile(rf"{re.escape(stem)}-(\d+)\.parquet")
+        names = [posixpath.basename(location.replace(os.sep, "/"))
+                 for location in self.storage.list(self._location(directory) if directory else self.dataset_path)]
+        used = [int(found.group(1)) for found in map(pattern.fullmatch, names) if found]
+        return posixpath.join(directory, f"{stem}-{max(used, default=-1) + 1}.parquet")
+
+    def rebuild(self) -> None:
+        """Indexes every fragment of the dataset from scratch, dropping the duplicates the dataset holds."""
+        fragments = [location for location in self.storage.list(self.dataset_path) if location.endswith(".parquet")]
+        self.connection.execute("DELETE FROM keys")
+        replaced = self.upsert(fragments)
+        logging.info(f"Rebuilt the key index of {self.dataset_path}: {len(self)} keys in {len(fragments)} fragments, "
+                     f"{replaced} duplicate rows removed")
+
+    def close(self) -> None:
+        """Commits the index and stores it with the dataset."""
+        self.connection.commit()
+        self.connection.close()
+        if self.path is not None and is_remote(self.path):
+            self.storage.publish([self.path])
+
+
+def _value(value):
+    """Returns a key as a value SQLite can bind, e.g. a Python int for a NumPy integer."""
+    return value.item() if hasattr(value, "item") else value
@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+"""
+Persistent run manifest for incremental pipeline runs.
+
+The manifest records, for every input file, a content fingerprint (size, modification time and a BLAKE2 hash of the bytes), a hash of the config sections that affect its output, a hash of the salt, and the artifacts produced for it (the temp checkpoint and the output fragments). On the next run a file whose fingerprint, config and salt are unchanged and whose output fragments still exist is skipped by every stage.
+
+The file is only hashed again when its size or modification time differ from the recorded ones, so an unchanged input costs a `stat` call; a file that was touched without being modified is still recognised as unchanged by its hash. Inputs and manifests on S3 are read through the storage backend (`utils.storage`): an object is fingerprinted by its ETag instead of being downloaded, and the output fragments of a file are checked with a single listing.
+
+Key functionality Classes include:
+1. **RunManifest**:
+   - Loads and saves the manifest JSON, fingerprints input files, decides which files are current and records the artifacts of processed files.
+"""
+
+import os
+import json
+import hashlib
+from datetime import datetime
+from typing import Optional
+
+from utils.storage import LocalStorage, open_storage
+
+MANIFEST_VERSION = 1
+
+# Config sections whose values change the processed rows or the output layout of a file
+CONFIG_SECTIONS = ("variables", "date_formats", "remove_columns", "cols_to_hash", "uppercase",
+                   "partition_columns", "output_asset_name", "dedup")
+
+HASH_BLOCK_SIZE = 1 << 20
+
+
+def _digest(data: bytes) -> str:
+    """Returns the BLAKE2 hex digest of some bytes."""
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+class RunManifest:
+    """
+    Manifest of the input files processed by earlier runs and of the artifacts produced for them.
+
+    Parameters:
+        path (str): The manifest JSON file. It is created on the first save.
+        config (dict): The parsed configuration of the current run.
+        storage (LocalStorage): The storage backend of the manifest, the inputs and the outputs. Defaults to local files.
+    """
+
+    def __init__(self, path: str, config: dict, storage: Optional[LocalStorage] = None):
+        self.path = path
+        self.config = config
+        self.storage = storage or LocalStorage()
+        self.entries = {}
+        self.last_run = None
+        if self.storage.exists(path):
+            with open(self.storage.fetch(path)) as f:
+                manifest = json.load(f)
+            if manifest.get("version") == MANIFEST_VERSION:
+                self.entries = manifest.get("files", {})
+                self.last_run = manifest.get("last_run")
+
+    @classmethod
+    def from_config(cls, config: dict) -> "RunManifest":
+        """Creates the manifest configured in the `incremental` section of the config, on the storage of its locations."""
+        incremental = config.get("incremental") or {}
+        return cls(incremental.get("manifest") or f"{config['outputs']}/manifest.json", config, open_storage(config))
+
+    def fingerprint(self, file: str, path: str) -> dict:
+        """
+        Returns the size, modification time and content hash of an input file.
+
+        The recorded hash is reused when the size and modification time are unchanged. S3 objects are identified by their ETag, a digest of the content kept by the store, so they are not downloaded.
+        """
+        stat = self.storage.stat(path)
+        recorded = self.entries.get(file, {}).get("fingerprint") or {}
+        if recorded.get("size") == stat["size"] and recorded.get("mtime_ns") == stat["mtime_ns"]:
+            return dict(recorded)
+        if "etag" in stat:
+            return {"size": stat["size"], "mtime_ns": stat["mtime_ns"], "hash": f"etag:{stat['etag']}"}
+
+        digest = hashlib.blake2b(digest_size=16)
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b""):
+                digest.update(block)
+        return {"size": stat["size"], "mtime_ns": stat["mtime_ns"], "hash": digest.hexdigest()}
+
+    def config_hash(self) -> str:
+        """Returns the hash of the config sections that affect the output of a file."""
+        sections = {name: self.config.get(name) for name in CONFIG_SECTIONS}
+        return _digest(json.dumps(sections, sort_keys=True, default=str).encode("utf-8"))
+
+    def file_state(self, file: str, path: str, salt: str) -> dict:
+        """
+        Returns the current state of an input file, to be compared with and stored in the manifest.
+
+        Parameters:
+            file (str): The file name.
+            path (str): The input CSV path or S3 location.
+            salt (str): The hashing salt; only its hash is stored.
+
+        Returns:
+            dict: The fingerprint, config hash and salt hash of the file.
+        """
+        return {
+            "fingerprint": self.fingerprint(file, path),
+            "config": self.config_hash(),
+            "salt": _digest(salt.encode("utf-8")),
+        }
+
+    def is_current(self, file: str, state: dict) -> bool:
+        """Returns whether a file was processed with the same content, config and salt and its output still exists."""
+        entry = self.entries.get(file)
+        if entry is None:
+            return False
+        if entry["fingerprint"].get("hash") != state["fingerprint"]["hash"]:
+            return False
+        if entry["config"] != state["config"] or entry["salt"] != state["salt"]:
+            return False
+        # The output fragments must still exist; temp checkpoints are intermediates and may be cleared
+        return not self.storage.missing(entry.get("artifacts", {}).get("output", []))
+
+    def removed_files(self, files: list) -> list:
+        """Returns the files recorded in the manifest that are no longer inputs of the run."""
+        return [file for file in self.entries if file not in files]
+
+    def artifacts(self, file: str) -> dict:
+        """Returns the artifacts recorded for a file."""
+        return self.entries.get(file, {}).get("artifacts", {})
+
+    def record(self, file: str, state: dict, artifacts: dict) -> None:
+        """Records the state of a processed file and the artifacts produced for it."""
+        self.entries[file] = dict(state, artifacts=artifacts,
+                                  processed_at=datetime.now().isoformat(timespec="seconds"))
+
+    def forget(self, file: str) -> None:
+        """Removes a file from the manifest."""
+        self.entries.pop(file, None)
+
+    def save(self, processed: list, skipped: list, removed: Optional[list] = None, forced: bool = False) -> None:
+        """
+        Writes the manifest with a report of the run, replacing the previous manifest atomically.
+
+        Parameters:
+            processed (list): Files processed by the run.
+            skipped (list): Unchanged files skipped by the run.
+            removed (list): Files dropped from the inputs since the previous run.
+            forced (bool): Whether the run ignored the manifest.
+        """
+        self.last_run = {
+            "finished_at": datetime.now().isoformat(timespec="seconds"),
+            "forced": forced,
+            "processed": list(processed),
+            "skipped": list(skipped),
+            "removed": list(removed or []),
+        }
+        local = self.storage.local_path(self.path)
+        os.makedirs(os.path.dirname(local) or ".", exist_ok=True)
+        partial = f"{local}.tmp"
+        with open(partial, "w") as f:
+            json.dump({"version": MANIFEST_VERSION, "files": self.entries, "last_run": self.last_run},
+                      f, indent=2, sort_keys=True)
+        os.replace(partial, local)
+        self.storage.publish([self.path])
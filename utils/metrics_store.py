@@ -0,0 +1,305 @@
+# -*- coding: utf-8 -*-
+"""
+Append-optimized history of the quality metrics of every run, with time series and drift queries.
+
+The metrics stages write a summary per file and run (`{file}_{kind}_{datetime}.parquet`), so comparing a metric over time used to mean listing and loading every one of those small files. The store keeps the same metrics in a single long table with one row per file, kind ('raw' or 'processed'), column, metric and run time. A run appends its metrics as a small delta file. Once `compact_every` deltas have piled up, the deltas are compacted into one Parquet table sorted by metric, kind, file, column and run time. A query only reads the row groups of the metrics it asks for, plus the few deltas not compacted yet, so it takes milliseconds however many runs are stored.
+
+The store lives next to the metrics (`{outputs}/quality_metrics/history` by default), locally or on S3 through the storage backend of the run. Compaction only deletes the deltas it compacted, so deltas appended meanwhile are kept. Summaries written before the store existed can be loaded with `backfill`.
+
+Drift compares each run with the previous run of the same file, kind and column. Percentages (metrics ending with '(%)', e.g. the null percentage) drift when they move by more than their threshold in percentage points. Other metrics (e.g. the distinct count) drift when they change by more than their threshold relative to the previous run.
+
+Key functionality Classes include:
+1. **MetricsStore**:
+   - Records the quality summary of a file for a run, compacts the deltas, and answers time series and drift queries.
+
+Usage:
+    python -m utils.metrics_store series "Distinct Count" --file people_1
+    python -m utils.metrics_store drift
+    python -m utils.metrics_store backfill
+"""
+
+import os
+import re
+import uuid
+import logging
+import threading
+from datetime import datetime
+from typing import Optional
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from utils.storage import LocalStorage, open_storage
+
+# Long layout of the history; a row is identified by every field but the value
+SCHEMA = pa.schema([
+    ("metric", pa.string()),
+    ("kind", pa.string()),
+    ("file", pa.string()),
+    ("column", pa.string()),
+    ("run_time", pa.timestamp("us")),
+    ("value", pa.float64()),
+])
+KEY = ["metric", "kind", "file", "column", "run_time"]
+
+# Drift thresholds: percentage points for percentages, relative change for the other metrics
+DRIFT_THRESHOLDS = {"Null Percentage (%)": 5.0, "Distinct Count": 0.1}
+
+# Summaries written by the metrics stages: {file}_{kind}_{YYYYmmdd_HHMMSS}.parquet
+SUMMARY_NAME = re.compile(r"^(?P<file>.+)_(?P<kind>raw|processed)_(?P<stamp>\d{8}_\d{6})\.parquet$")
+
+
+def summary_rows(file: str, kind: str, quality_df: pd.DataFrame, run_time: datetime) -> pd.DataFrame:
+    """
+    Returns a quality summary in the long layout of the history, without its missing values.
+
+    Parameters:
+        file (str): The input file the summary describes.
+        kind (str): 'raw' or 'processed'.
+        quality_df (pd.DataFrame): The summary, with metrics as rows and columns as columns (`QualityAccumulator.to_frame`).
+        run_time (datetime): The time of the run.
+    """
+    rows = quality_df.rename_axis(index="metric", columns="column").stack().rename("value").reset_index()
+    rows["metric"] = rows["metric"].astype(str)
+    rows["column"] = rows["column"].astype(str)
+    rows["value"] = pd.to_numeric(rows["value"], errors="coerce")
+    rows = rows[rows["value"].notna()]
+    rows["kind"] = kind
+    rows["file"] = file
+    rows["run_time"] = pd.Timestamp(run_time)
+    return rows[SCHEMA.names]
+
+
+class MetricsStore:
+    """
+    History of the quality metrics of every file and run.
+
+    Parameters:
+        path (str): The directory or S3 prefix of the store, holding the compacted `metrics.parquet` and the `deltas`.
+        storage (LocalStorage): The storage backend of the outputs. Defaults to local files.
+        compact_every (int): Deltas that trigger a compaction when the store is closed.
+        row_group_size (int): Rows per row group of the compacted table; smaller groups let a query skip more of the table.
+        thresholds (dict): Drift threshold of each metric checked by `drift`. Defaults to `DRIFT_THRESHOLDS`.
+    """
+
+    def __init__(self, path: str, storage=None, compact_every: int = 50, row_group_size: int = 64 * 1024,
+                 thresholds: Optional[dict] = None):
+        self.path = path.rstrip("/")
+        self.storage = storage or LocalStorage()
+        self.compact_every = max(int(compact_every), 1)
+        self.row_group_size = int(row_group_size)
+        self.thresholds = dict(thresholds or DRIFT_THRESHOLDS)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config: dict, storage=None) -> Optional["MetricsStore"]:
+        """
+        Opens the store configured in the `metrics_history` section of the config.
+
+        Parameters:
+            config (dict): The parsed configuration.
+            storage (LocalStorage): The storage backend of the outputs. Defaults to the one of the config's locations.
+
+        Returns:
+            MetricsStore: The store, or None when the history is not enabled.
+        """
+        history = config.get("metrics_history") or {}
+        if not history.get("enabled", False):
+            return None
+        return cls(history.get("path") or f"{config['outputs']}/quality_metrics/history",
+                   storage or open_storage(config),
+                   compact_every=history.get("compact_every", 50),
+                   row_group_size=history.get("row_group_size", 64 * 1024),
+                   thresholds=history.get("drift"))
+
+    @property
+    def table_path(self) -> str:
+        """The location of the compacted table."""
+        return f"{self.path}/metrics.parquet"
+
+    def deltas(self) -> list:
+        """Returns the locations of the deltas not compacted yet, oldest first."""
+        return [path for path in self.storage.list(f"{self.path}/deltas") if path.endswith(".parquet")]
+
+    def _write(self, rows: pd.DataFrame, location: str) -> None:
+        """Writes rows of the history to a Parquet file, atomically, and stores it."""
+        local = self.storage.local_path(location)
+        os.makedirs(os.path.dirname(local), exist_ok=True)
+        table = pa.Table.from_pandas(rows, schema=SCHEMA, preserve_index=False)
+        partial = f"{local}.{uuid.uuid4().hex}.tmp"
+        pq.write_table(table, partial, row_group_size=self.row_group_size, compression="zstd")
+        os.replace(partial, local)
+        self.storage.publish([location])
+
+    def append(self, rows: pd.DataFrame) -> None:
+        """Appends rows in the long layout of the history as a new delta."""
+        if rows.empty:
+            return
+        stamp = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
+        self._write(rows, f"{self.path}/deltas/{stamp}-{uuid.uuid4().hex[:8]}.parquet")
+
+    def record(self, file: str, kind: str, quality_df: pd.DataFrame, run_time: datetime) -> None:
+        """Appends the quality summary of a file for a run (see `summary_rows`)."""
+        self.append(summary_rows(file, kind, quality_df, run_time))
+
+    def backfill(self, metrics_dir: str) -> int:
+        """
+        Loads the summaries written by earlier runs (`{metrics_dir}/{kind}/{file}_{kind}_{datetime}.parquet`) into the store, and compacts it.
+
+        Summaries already in the store are replaced rather than duplicated, so a backfill can be run again.
+
+        Returns:
+            int: The number of summaries loaded.
+        """
+        frames = []
+        for kind in ("raw", "processed"):
+            for location in self.storage.list(f"{metrics_dir.rstrip('/')}/{kind}"):
+                match = SUMMARY_NAME.match(location.rsplit("/", 1)[-1])
+                if match is None or match["kind"] != kind:
+                    continue
+                run_time = datetime.strptime(match["stamp"], "%Y%m%d_%H%M%S")
+                frames.append(summary_rows(match["file"], kind, pd.read_parquet(self.storage.fetch(location)), run_time))
+        if frames:
+            self.append(pd.concat(frames, ignore_index=True))
+            self.compact()
+        logging.info(f"Loaded {len(frames)} quality summaries from {metrics_dir} into {self.path}")
+        return len(frames)
+
+    def _read_file(self, location: str, filters: Optional[list]) -> pd.DataFrame:
+        """Reads the rows of a history file that match some filters."""
+        return pq.read_table(self.storage.fetch(location), filters=filters, schema=SCHEMA).to_pandas()
+
+    def read(self, metric: Optional[str] = None, kind: Optional[str] = None, file: Optional[str] = None,
+             column: Optional[str] = None, since: Optional[datetime] = None) -> pd.DataFrame:
+        """
+        Returns the rows of the history matching the given fields, sorted by their key.
+
+        The filters are pushed down to the Parquet reader, which skips the row groups of the compacted table holding other metrics.
+
+        Parameters:
+            metric (str): A metric, e.g. 'Null Percentage (%)'. Defaults to every metric.
+            kind (str): 'raw' or 'processed'. Defaults to both.
+            file (str): An input file. Defaults to every file.
+            column (str): A column. Defaults to every column.
+            since (datetime): The earliest run time. Defaults to every run.
+        """
+        filters = [(name, "==", value) for name, value in
+                   (("metric", metric), ("kind", kind), ("file", file), ("column", column)) if value is not None]
+        if since is not None:
+            filters.append(("run_time", ">=", pd.Timestamp(since)))
+        filters = filters or None
+
+        locations = self.deltas()
+        if self.storage.exists(self.table_path):
+            locations.insert(0, self.table_path)
+        frames = [self._read_file(location, filters) for location in locations]
+        if not frames:
+            return pd.DataFrame({name: pd.Series(dtype=field.type.to_pandas_dtype())
+                                 for name, field in zip(SCHEMA.names, SCHEMA)})
+        rows = pd.concat(frames, ignore_index=True)
+        # A summary recorded again (e.g. by a backfill) replaces the earlier one
+        rows = rows.drop_duplicates(KEY, keep="last")
+        return rows.sort_values(KEY, kind="stable").reset_index(drop=True)
+
+    def series(self, metric: str, kind: str = "processed", file: Optional[str] = None, column: Optional[str] = None,
+               since: Optional[datetime] = None) -> pd.DataFrame:
+        """
+        Returns the time series of a metric, one row per file, column and run.
+
+        Returns:
+            pd.DataFrame: The `run_time`, `file`, `column` and `value` of every run, oldest first.
+        """
+        rows = self.read(metric, kind, file, column, since)
+        return rows.sort_values(["run_time", "file", "column"], kind="stable")[
+            ["run_time", "file", "column", "value"]].reset_index(drop=True)
+
+    def drift(self, thresholds: Optional[dict] = None, kind: str = "processed", file: Optional[str] = None,
+              since: Optional[datetime] = None) -> pd.DataFrame:
+        """
+        Returns the runs in which a metric moved beyond its threshold since the previous run of the same file and column.
+
+        Parameters:
+            thresholds (dict): The threshold of each metric to check. Defaults to the store's thresholds.
+            kind (str): 'raw' or 'processed'.
+            file (str): An input file. Defaults to every file.
+            since (datetime): The earliest run time reported. The run before it is still read to compare with.
+
+        Returns:
+            pd.DataFrame: The `metric`, `file`, `column`, `run_time`, `previous` value, `value` and `change` (percentage points or relative change) of every drifted run.
+        """
+        thresholds = self.thresholds if thresholds is None else thresholds
+        drifted = []
+        for metric, threshold in thresholds.items():
+            rows = self.read(metric, kind, file)
+            rows["previous"] = rows.groupby(["file", "column"], sort=False)["value"].shift()
+            rows = rows[rows["previous"].notna()]
+            if metric.endswith("(%)"):
+                rows["change"] = rows["value"] - rows["previous"]
+            else:
+                # A metric leaving zero changes by an infinite ratio, so it drifts beyond any threshold
+                rows["change"] = (rows["value"] - rows["previous"]) / rows["previous"].abs()
+            rows = rows[rows["change"].abs() > threshold]
+            if since is not None:
+                rows = rows[rows["run_time"] >= pd.Timestamp(since)]
+            drifted.append(rows[["metric", "file", "column", "run_time", "previous", "value", "change"]])
+        return pd.concat(drifted, ignore_index=True).sort_values(["run_time", "file", "column", "metric"],
+                                                                 kind="stable").reset_index(drop=True)
+
+    def compact(self) -> int:
+        """
+        Merges the deltas into the compacted table, sorted by metric, kind, file, column and run time, and deletes them.
+
+        Returns:
+            int: The number of deltas compacted.
+        """
+        with self._lock:
+            deltas = self.deltas()
+            if not deltas:
+                return 0
+            locations = deltas
+            if self.storage.exists(self.table_path):
+                locations = [self.table_path] + deltas
+            rows = pd.concat([self._read_file(location, None) for location in locations], ignore_index=True)
+            rows = rows.drop_duplicates(KEY, keep="last").sort_values(KEY, kind="stable")
+            self._write(rows, self.table_path)
+            # Deltas appended since the listing are left for the next compaction
+            self.storage.remove(deltas)
+            logging.info(f"Compacted {len(deltas)} metrics deltas into {self.table_path} ({len(rows)} rows)")
+            return len(deltas)
+
+    def close(self) -> None:
+        """Compacts the store when `compact_every` deltas or more are waiting."""
+        if len(self.deltas()) >= self.compact_every:
+            self.compact()
+
+
+def main(argv: Optional[list] = None) -> None:
+    """Prints a time series or the drifted runs of the metrics history configured in `config.yaml`, or backfills or compacts it."""
+    import argparse
+    import yaml
+
+    parser = argparse.ArgumentParser(description="Query the history of the quality metrics.")
+    parser.add_argument("command", choices=("series", "drift", "backfill", "compact"))
+    parser.add_argument("metric", nargs="?", default="Null Percentage (%)", help="the metric of a series")
+    parser.add_argument("--config", default="config.yaml", help="the configuration file (default: %(default)s)")
+    parser.add_argument("--kind", default="processed", choices=("raw", "processed"))
+    parser.add_argument("--file", help="an input file (default: every file)")
+    args = parser.parse_args(argv)
+
+    with open(args.config) as f:
+        config = yaml.safe_load(f)
+    config["metrics_history"] = dict(config.get("metrics_history") or {}, enabled=True)
+    store = MetricsStore.from_config(config)
+    if args.command == "series":
+        print(store.series(args.metric, args.kind, args.file).to_string(index=False))
+    elif args.command == "drift":
+        print(store.drift(kind=args.kind, file=args.file).to_string(index=False))
+    elif args.command == "backfill":
+        print(f"Loaded {store.backfill(config['outputs'] + '/quality_metrics')} summaries")
+    else:
+        print(f"Compacted {store.compact()} deltas")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,244 @@
+# -*- coding: utf-8 -*-
+"""
+Multi-core processing of a single CSV split into newline-aligned byte ranges.
+
+A CSV is split into contiguous byte ranges that each start and end on a record boundary. A newline only counts as a boundary when the number of quote characters before it is even, so quoted fields containing newlines are never cut in half (this assumes RFC 4180 quoting, where a quote inside a quoted field is escaped by doubling it). Each range is parsed with the shared header by a worker process and pushed through the streamable stage chain into its own part file, together with partial quality metrics accumulators. The parts and accumulators are then merged into the file's checkpoint in range order, so the output is deterministic whatever the worker count.
+
+Functions and Classes included in the module:
+- **split_byte_ranges(path, parts)**: Returns the header bytes and the record-aligned byte ranges of a CSV.
+- **RangeFile**: A read-only file object serving the header followed by one byte range.
+- **ByteRangeContext**: A pipeline context whose `read_input` reads a single byte range of the CSV already fetched and validated by the parent.
+- **process_file_in_ranges(context, chain, file)**: Processes a file's ranges in a process pool and merges the results.
+"""
+
+import io
+import os
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional
+
+import pandas as pd
+
+from utils.engine import PipelineContext, load_stages, stream_chain
+from utils.streaming import intermediate_format, merge_parts
+
+BLOCK_SIZE = 1 << 20
+
+
+def _next_record_boundary(f, position: int, parity: int, quotechar: bytes, block_size: int):
+    """
+    Finds the first newline at or after `position` that lies outside quotes.
+
+    Parameters:
+        f: The CSV opened in binary mode.
+        position (int): Offset to start searching from.
+        parity (int): Number of quote characters before `position`, modulo 2.
+        quotechar (bytes): The quote character.
+        block_size (int): Bytes read per block.
+
+    Returns:
+        tuple: The offset just after the newline (or the file size when none is found) and the quote parity at that offset.
+    """
+    f.seek(position)
+    while True:
+        block = f.read(block_size)
+        if not block:
+            return position, parity
+        newline = block.find(b"\n")
+        while newline != -1:
+            if (parity + block.count(quotechar, 0, newline)) % 2 == 0:
+                return position + newline + 1, 0
+            newline = block.find(b"\n", newline + 1)
+        parity = (parity + block.count(quotechar)) % 2
+        position += len(block)
+
+
+def split_byte_ranges(path: str, parts: int, quotechar: str = '"',
+                      block_size: int = BLOCK_SIZE) -> tuple:
+    """
+    Splits a CSV into up to `parts` contiguous byte ranges aligned on record boundaries.
+
+    Quote parity is tracked from the start of the file, so every candidate boundary is known to be outside a quoted field. Ranges that would be empty (e.g. for small files) are dropped, so fewer than `parts` ranges may be returned.
+
+    Parameters:
+        path (str): The CSV file.
+        parts (int): The number of ranges wanted.
+        quotechar (str): The quote character of the CSV.
+        block_size (int): Bytes read per block while scanning.
+
+    Returns:
+        tuple: The header bytes (including its newline) and a list of `(start, end)` byte offsets covering every data record.
+    """
+    quote = quotechar.encode()
+    size = os.path.getsize(path)
+
+    with open(path, "rb") as f:
+        header_end, _ = _next_record_boundary(f, 0, 0, quote, block_size)
+        f.seek(0)
+        header = f.read(header_end)
+
+        ranges = []
+        start = header_end
+        step = max((size - header_end) // max(parts, 1), 1)
+
+        # Quote parity is even at every record boundary, so each search starts from a known state
+        position, parity = start, 0
+        f.seek(start)
+        while start < size:
+            target = start + step
+            if len(ranges) == parts - 1 or target >= size:
+                ranges.append((start, size))
+                break
+            # Advance to the target, keeping track of the quote parity on the way
+            while position < target:
+                chunk = f.read(min(block_size, target - position))
+                parity = (parity + chunk.count(quote)) % 2
+                position += len(chunk)
+            end, parity = _next_record_boundary(f, target, parity, quote, block_size)
+            ranges.append((start, end))
+            start = position = end
+            f.seek(position)
+
+    return header, ranges
+
+
+class RangeFile(io.RawIOBase):
+    """
+    Read-only binary file object serving a header followed by one byte range of a file.
+
+    Parameters:
+        path (str): The file to read from.
+        header (bytes): The bytes served before the range.
+        start (int): Offset of the first byte of the range.
+        end (int): Offset just past the last byte of the range.
+    """
+
+    def __init__(self, path: str, header: bytes, start: int, end: int):
+        super().__init__()
+        self._header = header
+        self._file = open(path, "rb")
+        self._file.seek(start)
+        self._remaining = end - start
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        view = memoryview(buffer)
+        if self._header:
+            n = min(len(view), len(self._header))
+            view[:n] = self._header[:n]
+            self._header = self._header[n:]
+            return n
+        n = self._file.readinto(view[:min(len(view), self._remaining)])
+        self._remaining -= n
+        return n
+
+    def close(self) -> None:
+        self._file.close()
+        super().close()
+
+
+class ByteRangeContext(PipelineContext):
+    """
+    Pipeline context reading a single byte range of the source CSV, used inside the worker processes.
+
+    Parameters:
+        config (dict): The parsed configuration.
+        salt (str): The hashing salt, passed from the parent so workers do not re-read it.
+        path (str): The local path of the source CSV, already fetched by the parent.
+        header (bytes): The CSV header shared by every range.
+        byte_range (tuple): The `(start, end)` offsets of the range.
+    """
+
+    def __init__(self, config: dict, salt: Optional[str], path: str, header: bytes, byte_range: tuple):
+        super().__init__(config)
+        self._salt = salt
+        self.path = path
+        self.header = header
+        self.byte_range = byte_range
+
+    def input_path(self, file: str) -> str:
+        """Returns the local copy of the source CSV fetched by the parent, without going through the storage again."""
+        return self.path
+
+    def validate_input(self, file: str) -> None:
+        """Does nothing: the parent validates the file once before splitting it."""
+
+    def read_input(self, file: str, chunksize: Optional[int] = None, **options):
+        """Reads the context's byte range of the source CSV, preceded by the shared header."""
+        start, end = self.byte_range
+        return pd.read_csv(io.BufferedReader(RangeFile(self.path, self.header, start, end)),
+                           chunksize=chunksize, **options)
+
+
+def _process_range(config: dict, salt: Optional[str], stage_names: list, file: str, path: str,
+                   header: bytes, byte_range: tuple, part_path: str) -> tuple:
+    """
+    Worker entry point: streams one byte range through the named stages into a part file.
+
+    Returns:
+        tuple: The number of rows written and the partial quality metrics accumulators of the range.
+    """
+    stages = {stage.name: stage for stage in load_stages()}
+    chain = [stages[name] for name in stage_names]
+    context = ByteRangeContext(config, salt, path, header, byte_range)
+    rows = stream_chain(context, chain, file, part_path)
+    return rows, context.quality
+
+
+def process_file_in_ranges(context: PipelineContext, chain: list, file: str) -> int:
+    """
+    Processes one CSV in parallel by splitting it into byte ranges, then merges the parts in range order.
+
+    The file is validated once, before it is split. The number of ranges is the configured worker count, reduced so that no range is smaller than `parallel.min_range_bytes`. A file without data records is run through the chain in this process, which writes an empty checkpoint with the schema of the chain's output.
+
+    Parameters:
+        context (PipelineContext): The run context.
+        chain (list): A streamable source followed by streamable per-file stages.
+        file (str): The file to process.
+
+    Returns:
+        int: The number of rows written to the file's checkpoint.
+    """
+    parallel = context.config.get("parallel") or {}
+    workers = context.parallel_workers
+    min_range_bytes = int(parallel.get("min_range_bytes", 8 * 1024 * 1024))
+
+    path = context.input_path(file)
+    context.validate_input(file)
+    parts = max(1, min(workers, os.path.getsize(path) // max(min_range_bytes, 1)))
+    header, ranges = split_byte_ranges(path, parts)
+    checkpoint = context.checkpoint_path(file)
+    if not ranges:
+        logging.info(f"{file} has no data records")
+        return stream_chain(context, chain, file, checkpoint)
+    logging.info(f"Processing {file} in {len(ranges)} byte ranges")
+
+    part_paths = [f"{checkpoint}.part-{i:05d}" for i in range(len(ranges))]
+    stage_names = [stage.name for stage in chain]
+    salt = context.salt if any(stage.name == "process" for stage in chain) else None
+
+    mp_context = multiprocessing.get_context(parallel.get("start_method", "spawn"))
+    try:
+        with ProcessPoolExecutor(max_workers=min(workers, len(ranges)), mp_context=mp_context) as pool:
+            futures = [
+                pool.submit(_process_range, context.config, salt, stage_names, file, path,
+                            header, byte_range, part_path)
+                for byte_range, part_path in zip(ranges, part_paths)
+            ]
+            # Partial quality metrics of each range are merged in range order
+            context.reset_quality(file)
+            for future in futures:
+                _, quality = future.result()
+                for (quality_file, kind), accumulator in quality.items():
+                    context.quality_accumulator(quality_file, kind).merge(accumulator)
+
+        return merge_parts([p for p in part_paths if os.path.exists(p)], checkpoint, *intermediate_format(context.config))
+    except BaseException:
+        # A failed range leaves the parts of the other ranges behind; the merge only removes them when it succeeds
+        for part_path in part_paths:
+            if os.path.exists(part_path):
+                os.remove(part_path)
+        raise
@@ -0,0 +1,186 @@
+# -*- coding: utf-8 -*-
+"""
+Background rendering of the quality metrics charts.
+
+Drawing the matplotlib/seaborn charts of every file used to dominate the run time of the metrics stage. The `ChartRenderer` takes the charts off the critical path: each chart is queued with its metrics DataFrame and drawn by a pool of worker processes on the non-interactive Agg backend while the pipeline carries on. The pipeline waits for the pool at the very end of the run, or with `charts.wait: false` hands the remaining charts to a detached process and does not wait at all.
+
+Rendered charts are kept in a content-addressed cache keyed by a hash of the metrics DataFrame, so a file whose metrics are unchanged since an earlier run has its chart copied from the cache instead of being drawn again.
+
+Functions and Classes included in the module:
+- **chart_digest(df)**: Returns the content hash of a metrics DataFrame used as its render cache key.
+- **ChartRenderer**: Queues charts, draws them in background processes and reuses cached renders.
+"""
+
+import os
+import sys
+import pickle
+import shutil
+import hashlib
+import logging
+import subprocess
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+import pandas as pd
+
+from utils.storage import is_remote, open_storage
+
+# Bump when the chart layout changes so that earlier renders are no longer reused
+RENDER_VERSION = 1
+
+
+def chart_digest(df: pd.DataFrame) -> str:
+    """
+    Returns a hash of the values, labels and dtypes of a metrics DataFrame and of the chart layout version.
+
+    Parameters:
+        df (pd.DataFrame): The quality metrics summary.
+
+    Returns:
+        str: A hex digest identifying the rendered chart.
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(f"{RENDER_VERSION}|{list(df.columns)}|{list(df.index)}|{list(df.dtypes.astype(str))}".encode("utf-8"))
+    digest.update(pd.util.hash_pandas_object(df, index=False).to_numpy().tobytes())
+    return digest.hexdigest()
+
+
+def _init_worker() -> None:
+    """Selects the non-interactive backend before pyplot is imported in a render worker."""
+    import matplotlib
+    matplotlib.use("Agg")
+
+
+def _render_chart(df: pd.DataFrame, cache_path: str, destination: str) -> str:
+    """
+    Draws a chart into the render cache (unless another worker already did) and copies it to its destination.
+
+    Returns:
+        str: The destination path.
+    """
+    if not os.path.exists(cache_path):
+        _init_worker()
+        from utils.utils import QualityMetrics
+        cache_dir, name = os.path.split(cache_path)
+        # Draw under a private name so that concurrent renders never expose a partial file
+        partial = QualityMetrics.plot_quality_metrics(df, save_directory=cache_dir,
+                                                      file_name=f"{os.getpid()}.{name}")
+        os.replace(partial, cache_path)
+    os.makedirs(os.path.dirname(destination), exist_ok=True)
+    shutil.copyfile(cache_path, destination)
+    return destination
+
+
+def _render_jobs(job_path: str) -> None:
+    """Draws the charts of a job file written by a renderer that did not wait, then deletes the file."""
+    with open(job_path, "rb") as f:
+        jobs = pickle.load(f)
+    for df, cache_path, destination in jobs:
+        _render_chart(df, cache_path, destination)
+    os.remove(job_path)
+
+
+class ChartRenderer:
+    """
+    Renders quality metrics charts in background processes, reusing cached renders of unchanged metrics.
+
+    Parameters:
+        config (dict): The parsed configuration. The `charts` section sets the number of render `workers` (0 draws each chart in this process when it is submitted), whether the run should `wait` for the charts, and the render `cache_dir` (defaults to `{outputs}/quality_metrics/chart_cache`). With outputs on S3 the run always waits, as it uploads the charts, and the cache is kept in the local staging copy of its location.
+    """
+
+    def __init__(self, config: dict):
+        charts = config.get("charts") or {}
+        self.workers = int(charts.get("workers", 2))
+        self.wait = bool(charts.get("wait", True)) or is_remote(config["outputs"])
+        self.start_method = charts.get("start_method", "spawn")
+        self.cache_dir = open_storage(config).local_path(
+            charts.get("cache_dir") or f"{config['outputs']}/quality_metrics/chart_cache")
+        self.cache_hits = 0
+        self._pool = None
+        self._futures = []
+        self._pending = []
+        self._lock = threading.Lock()
+
+    def submit(self, df: pd.DataFrame, save_directory: str) -> str:
+        """
+        Queues the chart of a metrics DataFrame, to be saved in `save_directory` under a datetime-stamped name.
+
+        Parameters:
+            df (pd.DataFrame): The quality metrics summary.
+            save_directory (str): Directory to save the chart in.
+
+        Returns:
+            str: The path the chart is (or will be) saved to.
+        """
+        current_datetime = datetime.now().strftime("%Y%m%d_%H%M%S")
+        destination = os.path.join(save_directory, f"combined_quality_metrics_{current_datetime}.png")
+        cache_path = os.path.join(self.cache_dir, f"{chart_digest(df)}.png")
+
+        if os.path.exists(cache_path):
+            logging.info(f"Reusing cached chart for {save_directory}")
+            self.cache_hits += 1
+            os.makedirs(save_directory, exist_ok=True)
+            shutil.copyfile(cache_path, destination)
+            return destination
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+        # Stages of several files may submit charts at once; pyplot is not thread-safe
+        with self._lock:
+            if self.workers <= 0:
+                return _render_chart(df, cache_path, destination)
+            if not self.wait:
+                self._pending.append((df, cache_path, destination))
+                return destination
+
+            if self._pool is None:
+                mp_context = multiprocessing.get_context(self.start_method)
+                self._pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=mp_context,
+                                                 initializer=_init_worker)
+            self._futures.append(self._pool.submit(_render_chart, df, cache_path, destination))
+        return destination
+
+    def close(self) -> None:
+        """
+        Finishes the queued charts and shuts the render pool down.
+
+        Raises:
+            Exception: The first error raised while drawing a chart.
+        """
+        self.flush(shutdown=True)
+
+    def flush(self, shutdown: bool = False) -> None:
+        """
+        Finishes the queued charts: waits for the render pool, or hands the charts to a detached process when the run does not wait.
+
+        Parameters:
+            shutdown (bool): Whether to shut the render pool down, or keep its workers for later charts (e.g. of the next batch of a watch daemon).
+
+        Raises:
+            Exception: The first error raised while drawing a chart.
+        """
+        if self._pending:
+            job_path = os.path.join(self.cache_dir, f"jobs_{os.getpid()}_{datetime.now():%Y%m%d_%H%M%S_%f}.pkl")
+            with open(job_path, "wb") as f:
+                pickle.dump(self._pending, f)
+            subprocess.Popen([sys.executable, "-m", "utils.render", job_path], cwd=os.getcwd(),
+                             stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL,
+                             stderr=subprocess.DEVNULL, start_new_session=True)
+            logging.info(f"Rendering {len(self._pending)} charts in the background")
+            self._pending = []
+
+        if self._pool is not None:
+            logging.info(f"Waiting for {len(self._futures)} charts to render...")
+            try:
+                for future in self._futures:
+                    future.result()
+            finally:
+                self._futures = []
+                if shutdown:
+                    self._pool.shutdown()
+                    self._pool = None
+
+
+if __name__ == "__main__":
+    _render_jobs(sys.argv[1])
@@ -0,0 +1,171 @@
+# -*- coding: utf-8 -*-
+"""
+Dependency-graph scheduling of the pipeline stages, file by file.
+
+Every stage declares the stages it depends on (by default the stage registered before it). The stages of a run are grouped into tasks, with a streamed chain of stages forming a single task, and each per-file task runs for a file as soon as the tasks it depends on are done for that same file. Files therefore move through the pipeline independently: a file is extracted while the previous one is cleaned, and stages that do not depend on each other (e.g. the raw metrics and the cleaning of a file) run side by side. A run-wide task (e.g. the output) runs once the tasks it depends on are done for every file.
+
+Tasks run on a pool of `workers` threads. Ready tasks are started in file order, so earlier files are finished first and the number of files in flight stays close to the number of workers. Most of the heavy lifting (CSV parsing, Arrow kernels, Parquet I/O, S3 transfers) releases the GIL, and chart rendering and byte-range parallel processing use their own process pools.
+
+A failed per-file task is isolated: the file is left out of its remaining tasks and of the run-wide tasks, and the other files carry on. A failed run-wide task fails the run.
+
+Functions and Classes included in the module:
+- **Task**: A node of the stage graph: one stage, or a streamed chain of stages, with the tasks it depends on.
+- **build_tasks(stages, streamed_chain)**: Groups the stages of a run into tasks and resolves their dependencies.
+- **StageScheduler**: Runs the tasks for every file on a thread pool, isolating per-file failures.
+"""
+
+import logging
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from typing import Callable, Optional
+
+
+@dataclass
+class Task:
+    """
+    A node of the stage graph.
+
+    Attributes:
+        name (str): The stage name, or the stage names joined by '+' for a streamed chain.
+        stages (list): The stages run by the task, in order.
+        scope (str): 'file' for tasks run for each file, 'run' for tasks run once per run.
+        streamed (bool): Whether the stages are streamed together batch by batch.
+        depends_on (set): Names of the tasks that must be done first.
+    """
+    name: str
+    stages: list
+    scope: str
+    streamed: bool = False
+    depends_on: set = field(default_factory=set)
+
+
+def build_tasks(stages: list, streamed_chain: Callable[[list], list]) -> list:
+    """
+    Groups the stages of a run into tasks and resolves their declared dependencies.
+
+    A stage without declared dependencies depends on the stage before it. Dependencies on stages that are not part of the run (e.g. skipped when resuming) are considered met.
+
+    Parameters:
+        stages (list): The stages of the run, in order.
+        streamed_chain (Callable): Returns the leading stages of a list that are streamed together, or an empty list.
+
+    Returns:
+        list: The tasks, in stage order.
+
+    Raises:
+        ValueError: When a stage depends on itself or on a later stage.
+    """
+    tasks = []
+    task_of = {}
+    previous = None
+    remaining = list(stages)
+    while remaining:
+        chain = streamed_chain(remaining)
+        group = chain or remaining[:1]
+        remaining = remaining[len(group):]
+        task = Task("+".join(stage.name for stage in group), group,
+                    "run" if group[0].scope == "run" else "file", streamed=bool(chain))
+        names = [stage.name for stage in group]
+        for i, stage in enumerate(group):
+            depends_on = (previous,) if stage.depends_on is None and previous else (stage.depends_on or ())
+            for name in depends_on:
+                if name in names[:i]:
+                    continue
+                if name in task_of:
+                    task.depends_on.add(task_of[name])
+                elif name in names[i:] or any(later.name == name for later in remaining):
+                    raise ValueError(f"Stage {stage.name} must come after the stage it depends on: {name}")
+            previous = stage.name
+        for name in names:
+            task_of[name] = task.name
+        tasks.append(task)
+    return tasks
+
+
+class StageScheduler:
+    """
+    Runs a task graph for every file of a run on a thread pool.
+
+    Parameters:
+        tasks (list): The tasks, in stage order.
+        files (list): The files of the run, in order.
+        workers (int): Tasks run at once.
+        run_task (Callable): Runs a task, called as `run_task(task, file)` for per-file tasks and `run_task(task, None)` for run-wide ones.
+        failed (dict): Collects the error of each failed file as soon as it fails, e.g. so that the run-wide tasks leave it out. Defaults to a new dictionary.
+    """
+
+    def __init__(self, tasks: list, files: list, workers: int, run_task: Callable, failed: Optional[dict] = None):
+        self.tasks = {task.name: task for task in tasks}
+        self.order = [task.name for task in tasks]
+        self.files = list(files)
+        self.workers = max(int(workers), 1)
+        self.run_task = run_task
+        self.done = set()
+        self.failed = {} if failed is None else failed
+
+    def _pending(self) -> list:
+        """Returns the `(task, file)` pairs not done yet, earlier files and stages first; run-wide tasks come last."""
+        pending = []
+        for position, file in enumerate(self.files):
+            if file in self.failed:
+                continue
+            for index, name in enumerate(self.order):
+                if self.tasks[name].scope == "file" and (name, file) not in self.done:
+                    pending.append(((position, index), name, file))
+        for index, name in enumerate(self.order):
+            if self.tasks[name].scope == "run" and (name, None) not in self.done:
+                pending.append(((len(self.files), index), name, None))
+        return [(name, file) for _, name, file in sorted(pending)]
+
+    def _ready(self, name: str, file: Optional[str]) -> bool:
+        """Returns whether the dependencies of a task are done for its file, or for every file still in the run."""
+        for dependency in self.tasks[name].depends_on:
+            if self.tasks[dependency].scope == "run":
+                if (dependency, None) not in self.done:
+                    return False
+            elif file is not None:
+                if (dependency, file) not in self.done:
+                    return False
+            elif any((dependency, other) not in self.done for other in self.files if other not in self.failed):
+                return False
+        return True
+
+    def run(self) -> dict:
+        """
+        Runs every task for every file.
+
+        Returns:
+            dict: The error message of each file whose task failed.
+
+        Raises:
+            Exception: The error of a failed run-wide task, once the tasks in progress are done.
+        """
+        running = {}
+        error = None
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="stage") as pool:
+            while True:
+                if error is None:
+                    started = set(running.values())
+                    for name, file in self._pending():
+                        if len(running) >= self.workers:
+                            break
+                        if (name, file) not in started and self._ready(name, file):
+                            running[pool.submit(self.run_task, self.tasks[name], file)] = (name, file)
+                if not running:
+                    break
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    name, file = running.pop(future)
+                    try:
+                        future.result()
+                        self.done.add((name, file))
+                    except Exception as e:
+                        if file is None:
+                            error = error or e
+                        else:
+                            # The file is left out of the rest of the run; the other files carry on
+                            logging.error(f"{file} is left out of the run after an error in {name}: {e}")
+                            self.failed[file] = str(e)
+        if error is not None:
+            raise error
+        return self.failed
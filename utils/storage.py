@@ -0,0 +1,322 @@
+# -*- coding: utf-8 -*-
+"""
+Storage backends for the inputs and outputs of the pipeline.
+
+The `inputs` and `outputs` locations of `config.yaml` are either local directories or S3 locations (`s3://bucket/prefix`, also for S3-compatible stores such as MinIO through `storage.endpoint_url`). The `temp` checkpoints and the `salt` always stay local.
+
+The stages keep reading and writing local files, through a local staging copy of every S3 object under `storage.cache_dir`:
+- **fetch(path)** returns a local path to read: S3 inputs are downloaded with concurrent ranged GETs of `part_size` bytes, and a copy whose size and modification time still match the object is reused. `prefetch(paths)` downloads the next inputs in the background while the current one is processed.
+- **local_path(path)** returns the local path to write an output to, and **publish(paths)** uploads the written files with concurrent multipart uploads, then deletes their staging copies.
+- **stat**, **exists**, **missing**, **list** and **remove** inspect and delete stored files without downloading them; S3 objects are fingerprinted by their ETag.
+
+For local paths every method works on the path itself, so fetching and publishing cost nothing. All S3 requests share one client, whose connection pool holds `max_concurrency` connections per transfer thread pool.
+
+Functions and Classes included in the module:
+- **is_remote(path)**: Returns whether a path is an S3 location.
+- **LocalStorage**: Storage of local files.
+- **S3Storage**: Storage of local files and S3 objects, staged through a local cache.
+- **open_storage(config)**: Returns the storage backend for the locations of a config.
+"""
+
+import os
+import logging
+import threading
+import posixpath
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+S3_SCHEME = "s3://"
+DEFAULT_PART_SIZE = 8 * 1024 * 1024
+
+
+def is_remote(path: str) -> bool:
+    """Returns whether a path is an S3 location."""
+    return str(path).startswith(S3_SCHEME)
+
+
+def split_s3(path: str) -> tuple:
+    """Returns the bucket and key of an `s3://bucket/key` location."""
+    bucket, _, key = path[len(S3_SCHEME):].partition("/")
+    return bucket, key
+
+
+class LocalStorage:
+    """
+    Storage of local files: every path is read and written in place.
+    """
+
+    def local_path(self, path: str) -> str:
+        """Returns the local path a file is written to before it is published."""
+        return path
+
+    def fetch(self, path: str) -> str:
+        """Returns a local path to read a file from."""
+        return path
+
+    def prefetch(self, paths: list) -> None:
+        """Starts fetching files that will be read soon."""
+
+    def publish(self, paths: list) -> None:
+        """Stores the files written to the local paths of `paths`."""
+
+    def stat(self, path: str) -> dict:
+        """Returns the `size` and `mtime_ns` of a file."""
+        stat = os.stat(path)
+        return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+    def exists(self, path: str) -> bool:
+        """Returns whether a file exists."""
+        return os.path.exists(path)
+
+    def missing(self, paths: list) -> list:
+        """Returns the paths of a list that do not exist."""
+        return [path for path in paths if not os.path.exists(path)]
+
+    def list(self, path: str) -> list:
+        """Returns the paths of all files under a directory, or an empty list when it does not exist."""
+        return sorted(os.path.join(directory, name) for directory, _, names in os.walk(path) for name in names)
+
+    def remove(self, paths: list) -> None:
+        """Deletes files; missing files are ignored."""
+        for path in paths:
+            if os.path.exists(path):
+                os.remove(path)
+
+    def close(self) -> None:
+        """Releases the resources of the storage, e.g. the background transfers."""
+
+
+class S3Storage(LocalStorage):
+    """
+    Storage of S3 objects, read and written through local staging copies; local paths are handled as by `LocalStorage`.
+
+    Parameters:
+        cache_dir (str): Local directory of the staging copies, mirroring `bucket/key`.
+        endpoint_url (str): Endpoint of an S3-compatible store. Defaults to AWS S3.
+        region (str): The region of the buckets. Defaults to the AWS configuration.
+        max_concurrency (int): Concurrent requests of a transfer: ranged GETs of a download or parts of a multipart upload, and files published at once.
+        part_size (int): Size in bytes of the ranges and upload parts; smaller objects are transferred with a single request.
+        prefetch_files (int): Inputs downloaded ahead of the one being processed.
+    """
+
+    def __init__(self, cache_dir: str, endpoint_url: Optional[str] = None, region: Optional[str] = None,
+                 max_concurrency: int = 8, part_size: int = DEFAULT_PART_SIZE, prefetch_files: int = 1):
+        self.cache_dir = cache_dir
+        self.endpoint_url = endpoint_url
+        self.region = region
+        self.max_concurrency = max(int(max_concurrency), 1)
+        self.part_size = int(part_size)
+        self.prefetch_files = max(int(prefetch_files), 0)
+        self._client = None
+        self._transfer_config = None
+        self._lock = threading.Lock()
+        self._fetched = {}
+        self._prefetches = {}
+        self._prefetch_pool = None
+
+    @property
+    def client(self):
+        """The S3 client shared by every request, created on first use."""
+        with self._lock:
+            if self._client is None:
+                import boto3
+                from botocore.config import Config
+                # Every transfer thread of a download or upload and of the publishing pool reuses a pooled connection
+                self._client = boto3.session.Session().client(
+                    "s3", endpoint_url=self.endpoint_url, region_name=self.region,
+                    config=Config(max_pool_connections=self.max_concurrency * 2,
+                                  retries={"max_attempts": 5, "mode": "adaptive"}))
+            return self._client
+
+    @property
+    def transfer_config(self):
+        """The transfer settings of downloads (ranged GETs) and uploads (multipart parts)."""
+        if self._transfer_config is None:
+            from boto3.s3.transfer import TransferConfig
+            self._transfer_config = TransferConfig(multipart_threshold=self.part_size,
+                                                   multipart_chunksize=self.part_size,
+                                                   max_concurrency=self.max_concurrency, use_threads=True)
+        return self._transfer_config
+
+    def local_path(self, path: str) -> str:
+        """Returns the local staging path of an S3 object, or a local path itself."""
+        if not is_remote(path):
+            return path
+        bucket, key = split_s3(path)
+        return os.path.join(self.cache_dir, bucket, *key.split("/"))
+
+    def _download(self, path: str) -> str:
+        """Downloads an object to its staging path, unless the staged copy is still current."""
+        bucket, key = split_s3(path)
+        local = self.local_path(path)
+        head = self.client.head_object(Bucket=bucket, Key=key)
+        modified = head["LastModified"].timestamp()
+        if (not os.path.exists(local) or os.path.getsize(local) != head["ContentLength"]
+                or os.path.getmtime(local) != modified):
+            os.makedirs(os.path.dirname(local), exist_ok=True)
+            partial = f"{local}.{threading.get_ident()}.part"
+            self.client.download_file(bucket, key, partial, Config=self.transfer_config)
+            os.utime(partial, (modified, modified))
+            os.replace(partial, local)
+            logging.info(f"Downloaded {path} ({head['ContentLength']} bytes)")
+        with self._lock:
+            self._fetched[path] = local
+        return local
+
+    def fetch(self, path: str) -> str:
+        """Returns a local copy of an S3 object, waiting for its prefetch or downloading it; a local path is returned as it is."""
+        if not is_remote(path):
+            return path
+        with self._lock:
+            if path in self._fetched:
+                return self._fetched[path]
+            future = self._prefetches.pop(path, None)
+        if future is not None:
+            return future.result()
+        return self._download(path)
+
+    def prefetch(self, paths: list) -> None:
+        """Downloads up to `prefetch_files` of the given S3 objects in the background."""
+        paths = [path for path in paths if is_remote(path)][:self.prefetch_files]
+        with self._lock:
+            for path in paths:
+                if path in self._fetched or path in self._prefetches:
+                    continue
+                if self._prefetch_pool is None:
+                    self._prefetch_pool = ThreadPoolExecutor(max_workers=max(self.prefetch_files, 1),
+                                                             thread_name_prefix="s3-prefetch")
+                self._prefetches[path] = self._prefetch_pool.submit(self._download, path)
+
+    def _upload(self, path: str) -> None:
+        """Uploads the staging copy of an object and deletes it."""
+        bucket, key = split_s3(path)
+        local = self.local_path(path)
+        self.client.upload_file(local, bucket, key, Config=self.transfer_config)
+        os.remove(local)
+        with self._lock:
+            self._fetched.pop(path, None)
+
+    def publish(self, paths: list) -> None:
+        """Uploads the staging copies of S3 objects, several files at a time and large files in concurrent parts."""
+        paths = [path for path in paths if is_remote(path)]
+        if not paths:
+            return
+        with ThreadPoolExecutor(max_workers=min(self.max_concurrency, len(paths))) as pool:
+            for future in [pool.submit(self._upload, path) for path in paths]:
+                future.result()
+        prefix = posixpath.commonpath([path[len(S3_SCHEME):] for path in paths])
+        logging.info(f"Uploaded {len(paths)} files to {S3_SCHEME}{prefix}")
+
+    def stat(self, path: str) -> dict:
+        """Returns the `size` and `mtime_ns` of a file, and the `etag` of an S3 object."""
+        if not is_remote(path):
+            return super().stat(path)
+        bucket, key = split_s3(path)
+        head = self.client.head_object(Bucket=bucket, Key=key)
+        return {"size": head["ContentLength"], "mtime_ns": int(head["LastModified"].timestamp() * 1e9),
+                "etag": head["ETag"].strip('"')}
+
+    def exists(self, path: str) -> bool:
+        """Returns whether a file or S3 object exists."""
+        if not is_remote(path):
+            return super().exists(path)
+        return not self.missing([path])
+
+    def _keys(self, bucket: str, prefix: str, delimiter: Optional[str] = None) -> list:
+        """Returns the keys of a bucket starting with a prefix; with a delimiter, only those not nested deeper."""
+        keys = []
+        options = {"Delimiter": delimiter} if delimiter else {}
+        for page in self.client.get_paginator("list_objects_v2").paginate(Bucket=bucket, Prefix=prefix, **options):
+            keys.extend(item["Key"] for item in page.get("Contents", []))
+        return keys
+
+    def _has_key(self, bucket: str, key: str) -> bool:
+        """Returns whether an object exists, from a HEAD request."""
+        from botocore.exceptions import ClientError
+        try:
+            self.client.head_object(Bucket=bucket, Key=key)
+            return True
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+                return False
+            raise
+
+    def missing(self, paths: list) -> list:
+        """
+        Returns the paths of a list that do not exist.
+
+        The S3 objects are grouped by their parent prefix, and each prefix holding several of them is listed once, without the objects nested deeper. Objects alone under their prefix, or at the root of the bucket, are checked with a HEAD request, so a listing never covers more than a directory.
+        """
+        missing = super().missing([path for path in paths if not is_remote(path)])
+        by_parent = {}
+        for path in paths:
+            if is_remote(path):
+                bucket, key = split_s3(path)
+                parent = key.rpartition("/")[0]
+                by_parent.setdefault((bucket, parent), []).append(key)
+        for (bucket, parent), keys in by_parent.items():
+            if parent and len(keys) > 1:
+                existing = set(self._keys(bucket, f"{parent}/", delimiter="/"))
+                missing.extend(f"{S3_SCHEME}{bucket}/{key}" for key in keys if key not in existing)
+            else:
+                missing.extend(f"{S3_SCHEME}{bucket}/{key}" for key in keys if not self._has_key(bucket, key))
+        return missing
+
+    def list(self, path: str) -> list:
+        """Returns the paths of all files or objects under a directory or prefix."""
+        if not is_remote(path):
+            return super().list(path)
+        bucket, key = split_s3(path)
+        return sorted(f"{S3_SCHEME}{bucket}/{item}" for item in self._keys(bucket, f"{key.rstrip('/')}/"))
+
+    def remove(self, paths: list) -> None:
+        """Deletes files and S3 objects, with their staging copies; missing ones are ignored."""
+        super().remove([path for path in paths if not is_remote(path)])
+        by_bucket = {}
+        for path in paths:
+            if is_remote(path):
+                bucket, key = split_s3(path)
+                by_bucket.setdefault(bucket, []).append(key)
+        for bucket, keys in by_bucket.items():
+            # A request deletes at most 1000 objects
+            for start in range(0, len(keys), 1000):
+                self.client.delete_objects(Bucket=bucket, Delete={
+                    "Objects": [{"Key": key} for key in keys[start:start + 1000]], "Quiet": True})
+        super().remove([self.local_path(path) for path in paths if is_remote(path)])
+
+    def close(self) -> None:
+        """Cancels the prefetches not started yet and waits for the running ones."""
+        with self._lock:
+            pool, self._prefetch_pool = self._prefetch_pool, None
+            self._prefetches = {}
+        if pool is not None:
+            pool.shutdown(wait=True, cancel_futures=True)
+
+
+def open_storage(config: dict) -> LocalStorage:
+    """
+    Returns the storage backend for the `inputs` and `outputs` locations of a config.
+
+    Parameters:
+        config (dict): The parsed configuration. Its `storage` section tunes the S3 transfers.
+
+    Returns:
+        LocalStorage: An `S3Storage` when a location is on S3, otherwise a `LocalStorage`.
+
+    Raises:
+        ValueError: When the temp directory or the salt is not local.
+    """
+    for location in ("temp", "salt"):
+        if is_remote(config.get(location, "")):
+            raise ValueError(f"The {location} location must be a local directory, not {config[location]}")
+    if not any(is_remote(config.get(location, "")) for location in ("inputs", "outputs")):
+        return LocalStorage()
+    storage = config.get("storage") or {}
+    return S3Storage(
+        cache_dir=storage.get("cache_dir") or f"{config['temp']}/storage_cache",
+        endpoint_url=storage.get("endpoint_url"),
+        region=storage.get("region"),
+        max_concurrency=storage.get("max_concurrency", 8),
+        part_size=storage.get("part_size", DEFAULT_PART_SIZE),
+        prefetch_files=storage.get("prefetch_files", 1),
+    )
@@ -0,0 +1,404 @@
+# -*- coding: utf-8 -*-
+"""
+Bounded-memory helpers for streaming files through the pipeline in batches.
+
+The intermediates in `temp` (checkpoints, streamed files and their parallel parts) are written as Parquet or as Arrow IPC files, as set in the `intermediate` section of the config. Arrow IPC files are opened memory-mapped: reading an uncompressed file is zero-copy, and the columns that are not read are never paged in. LZ4 or ZSTD compression trades that for smaller files. Intermediates are written under a temporary name and renamed when complete, so a reader never sees a partial file and a file still mapped by a reader is never overwritten in place. Readers recognise either format from the file itself, so checkpoints written with the other format are still read.
+
+Key functionality Classes include:
+1. **ParquetBatchWriter** and **ArrowBatchWriter**:
+   - Append DataFrame batches to a single Parquet or Arrow IPC file, so a file of any size can be written while only one batch is held in memory; `open_batch_writer` picks the writer of an intermediate format.
+2. **read_intermediate(path, columns)** and **iter_intermediate_batches(path, batch_size, columns)**:
+   - Read an intermediate whole or batch by batch, memory-mapped for Arrow IPC files, optionally only some of its columns.
+3. **merge_parts(part_paths, path)**:
+   - Concatenates part files into one file batch by batch, in the given order.
+4. **PartitionedDatasetWriter**:
+   - Streams record batches of DataFrames, Arrow tables and Parquet files into a Hive-partitioned Parquet dataset, with configurable row groups, compression and dictionary encoding, in overwrite, append or overwrite-partition mode, optionally keeping a single row per key within each source.
+"""
+
+import os
+import uuid
+import shutil
+from typing import Optional, Union
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+WRITE_MODES = ("overwrite", "append", "overwrite_partition")
+
+# Formats of the intermediates in `temp`, with their file extension
+INTERMEDIATE_FORMATS = {"parquet": ".parquet", "arrow": ".arrow"}
+
+ARROW_MAGIC = b"ARROW1"
+
+
+def intermediate_format(config: dict) -> tuple:
+    """
+    Returns the format and compression of the intermediates set in the `intermediate` section of the config.
+
+    Returns:
+        tuple: The format ('parquet' when not set, or 'arrow') and the compression codec (None for the writer's default, or 'none' for uncompressed Arrow IPC files).
+
+    Raises:
+        ValueError: When the format is unknown.
+    """
+    intermediate = config.get("intermediate") or {}
+    fmt = intermediate.get("format") or "parquet"
+    if fmt not in INTERMEDIATE_FORMATS:
+        raise ValueError(f"Unknown intermediate format: {fmt}")
+    compression = intermediate.get("compression")
+    return fmt, None if compression is None else str(compression).lower()
+
+
+def intermediate_path(config: dict, file: str, fmt: Optional[str] = None) -> str:
+    """Returns the path of a file's intermediate in `temp`, in the configured format or in `fmt`."""
+    fmt = fmt or intermediate_format(config)[0]
+    return f"{config['temp']}/{file}{INTERMEDIATE_FORMATS[fmt]}"
+
+
+def find_intermediate(config: dict, file: str) -> str:
+    """Returns the path of a file's intermediate in the configured format, or in another format when only that one exists."""
+    path = intermediate_path(config, file)
+    if not os.path.exists(path):
+        for fmt in INTERMEDIATE_FORMATS:
+            if os.path.exists(intermediate_path(config, file, fmt)):
+                return intermediate_path(config, file, fmt)
+    return path
+
+
+def is_arrow_file(path: str) -> bool:
+    """Returns whether a file is an Arrow IPC file, from its leading magic bytes."""
+    with open(path, "rb") as f:
+        return f.read(len(ARROW_MAGIC)) == ARROW_MAGIC
+
+
+def read_intermediate(path: str, columns: Optional[list] = None) -> pa.Table:
+    """
+    Reads an intermediate Parquet or Arrow IPC file as an Arrow table.
+
+    Arrow IPC files are memory-mapped: the table references the mapped pages (zero-copy when uncompressed), so only the columns used are read from disk.
+
+    Parameters:
+        path (str): The intermediate file.
+        columns (list): The columns to read. Defaults to every column.
+    """
+    if is_arrow_file(path):
+        table = pa.ipc.open_file(pa.memory_map(path, "r")).read_all()
+        return table.select(columns) if columns is not None else table
+    parquet_file = pq.ParquetFile(path)
+    try:
+        return parquet_file.read(columns=columns)
+    finally:
+        parquet_file.close()
+
+
+def iter_intermediate_batches(path: str, batch_size: int = 64 * 1024, columns: Optional[list] = None):
+    """Yields the record batches of an intermediate Parquet or Arrow IPC file (memory-mapped), optionally only some of its columns."""
+    if is_arrow_file(path):
+        reader = pa.ipc.open_file(pa.memory_map(path, "r"))
+        for i in range(reader.num_record_batches):
+            batch = reader.get_batch(i)
+            if columns is not None:
+                batch = batch.select(columns)
+            # Slices of a mapped batch are views, so large batches cost nothing to split
+            for start in range(0, batch.num_rows, batch_size):
+                yield batch.slice(start, batch_size)
+        return
+    parquet_file = pq.ParquetFile(path)
+    try:
+        yield from parquet_file.iter_batches(batch_size=batch_size, columns=columns)
+    finally:
+        parquet_file.close()
+
+
+def read_intermediate_schema(path: str) -> pa.Schema:
+    """Returns the Arrow schema of an intermediate Parquet or Arrow IPC file."""
+    if is_arrow_file(path):
+        return pa.ipc.open_file(pa.memory_map(path, "r")).schema
+    return pq.read_schema(path)
+
+
+class ParquetBatchWriter:
+    """
+    Incremental Parquet writer appending one row group per DataFrame batch.
+
+    The schema is taken from the first batch; later batches are cast to it, so a column inferred as integer in one batch and as float (because of missing values) in another still lands in one consistent file. The file is written under a temporary name and renamed when the writer is closed; when the writing fails it is discarded, and when no batch was written an earlier file at the path is removed.
+
+    Parameters:
+        path (str): The Parquet file to write. Its directory is created when missing.
+        compression (str): The Parquet compression codec.
+    """
+
+    def __init__(self, path: str, compression: str = "snappy"):
+        self.path = path
+        self.compression = compression
+        self.rows = 0
+        self._partial = f"{path}.tmp"
+        self._schema = None
+        self._writer = None
+
+    def write(self, df: pd.DataFrame) -> None:
+        """Appends a DataFrame batch as a new row group."""
+        self.write_table(pa.Table.from_pandas(df, preserve_index=False))
+
+    def _open(self, schema: pa.Schema):
+        return pq.ParquetWriter(self._partial, schema, compression=self.compression)
+
+    def write_table(self, table: pa.Table) -> None:
+        """Appends an Arrow table as a new row group."""
+        if self._writer is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            self._schema = table.schema
+            self._writer = self._open(table.schema)
+        elif not table.schema.equals(self._schema):
+            table = table.cast(self._schema)
+        self._writer.write_table(table)
+        self.rows += table.num_rows
+
+    def close(self) -> None:
+        """Closes the underlying writer and moves the complete file into place."""
+        if self._writer is None:
+            if os.path.exists(self.path):
+                os.remove(self.path)
+            return
+        self._writer.close()
+        self._writer = None
+        os.replace(self._partial, self.path)
+
+    def abort(self) -> None:
+        """Discards the partial file."""
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+        if os.path.exists(self._partial):
+            os.remove(self._partial)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is not None:
+            self.abort()
+        else:
+            self.close()
+
+
+class ArrowBatchWriter(ParquetBatchWriter):
+    """
+    Incremental Arrow IPC file writer appending one record batch per DataFrame batch, to be read back memory-mapped.
+
+    Parameters:
+        path (str): The Arrow IPC file to write. Its directory is created when missing.
+        compression (str): 'lz4' or 'zstd' to compress the buffers, or None (or 'none') for zero-copy reads.
+    """
+
+    def __init__(self, path: str, compression: Optional[str] = None):
+        super().__init__(path, None if compression in (None, "none") else compression)
+
+    def _open(self, schema: pa.Schema):
+        options = pa.ipc.IpcWriteOptions(compression=self.compression)
+        return pa.ipc.new_file(self._partial, schema, options=options)
+
+
+def open_batch_writer(path: str, fmt: str = "parquet", compression: Optional[str] = None) -> ParquetBatchWriter:
+    """Returns the batch writer of an intermediate format ('parquet' or 'arrow'), with its default compression unless given."""
+    if fmt == "arrow":
+        return ArrowBatchWriter(path, compression)
+    return ParquetBatchWriter(path, compression or "snappy")
+
+
+def merge_parts(part_paths: list, path: str, fmt: str = "parquet", compression: Optional[str] = None) -> int:
+    """
+    Concatenates part files into a single intermediate file and removes the parts.
+
+    Batches are copied one at a time in the order of `part_paths`, so memory stays bounded by the largest batch.
+
+    Parameters:
+        part_paths (list): The part files (Parquet or Arrow IPC), in output order.
+        path (str): The file to write.
+        fmt (str): The format of the file to write, 'parquet' or 'arrow'.
+        compression (str): Its compression codec. Defaults to the one of the format.
+
+    Returns:
+        int: The number of rows written.
+    """
+    with open_batch_writer(path, fmt, compression) as writer:
+        for part_path in part_paths:
+            for batch in iter_intermediate_batches(part_path, batch_size=1024 * 1024):
+                writer.write_table(pa.Table.from_batches([batch]))
+    for part_path in part_paths:
+        os.remove(part_path)
+    return writer.rows
+
+
+def _source_schema(source) -> pa.Schema:
+    """Returns the Arrow schema of a DataFrame, Arrow table or Parquet file path."""
+    if isinstance(source, pd.DataFrame):
+        return pa.Schema.from_pandas(source, preserve_index=False)
+    if isinstance(source, pa.Table):
+        return source.schema
+    return read_intermediate_schema(source)
+
+
+def _source_batches(source, batch_size: int):
+    """Yields the record batches of a DataFrame, Arrow table or Parquet file path, one batch at a time."""
+    if isinstance(source, pd.DataFrame):
+        source = pa.Table.from_pandas(source, preserve_index=False)
+    if isinstance(source, pa.Table):
+        yield from source.to_batches(max_chunksize=batch_size)
+        return
+    yield from iter_intermediate_batches(source, batch_size)
+
+
+def _last_rows(source, column: str):
+    """Returns a boolean mask of the rows of a source holding the last occurrence of their key, or a null key."""
+    if isinstance(source, pd.DataFrame):
+        keys = source[column] if column in source.columns else None
+    elif isinstance(source, pa.Table):
+        keys = source.column(column).to_pandas() if column in source.column_names else None
+    else:
+        # Only the key column is read; the pages of the other columns of a mapped Arrow file stay on disk
+        names = read_intermediate_schema(source).names
+        keys = read_intermediate(source, [column]).column(0).to_pandas() if column in names else None
+    if keys is None:
+        # Sources without the key column get nulls for it and are kept whole
+        return None
+    return (~keys.duplicated(keep="last") | keys.isna()).to_numpy()
+
+
+def _conform(batch: pa.RecordBatch, schema: pa.Schema) -> pa.RecordBatch:
+    """Casts a record batch to a schema, in the schema's column order, filling the columns it lacks with nulls."""
+    columns = []
+    for field in schema:
+        index = batch.schema.get_field_index(field.name)
+        if index == -1:
+            columns.append(pa.nulls(batch.num_rows, field.type))
+        else:
+            columns.append(batch.column(index).cast(field.type))
+    return pa.RecordBatch.from_arrays(columns, schema=schema)
+
+
+class PartitionedDatasetWriter:
+    """
+    Writes DataFrames, Arrow tables and Parquet files into a Hive-partitioned Parquet dataset, one record batch at a time.
+
+    All sources of a `write` call are chained into a single stream of record batches cast to their unified schema, so memory is bounded by the batch size and the buffered row groups rather than by the total number of rows.
+
+    Modes:
+    - **overwrite**: replaces the whole dataset.
+    - **append**: adds new fragments next to the existing ones; every `write` call uses new fragment names.
+    - **overwrite_partition**: deletes the existing partitions the written rows fall in, and leaves the others untouched.
+
+    Parameters:
+        path (str): The dataset directory.
+        partition_columns (list): Columns to partition on, as `column=value` directories.
+        mode (str): 'overwrite', 'append' or 'overwrite_partition'.
+        row_group_size (int): Maximum rows per row group.
+        min_rows_per_group (int): Rows buffered per partition before a row group is written (0 writes each batch's rows as they come).
+        compression (str or dict): The Parquet compression codec, or a mapping of column names to codecs.
+        dictionary_columns (list): Columns to dictionary encode. None encodes every column.
+        batch_size (int): Rows per record batch read from the sources.
+        basename_template (str): Template of the fragment file names, containing '{i}'. Defaults to a unique name per `write` call in append mode.
+        unique_key (str): Column whose duplicate values are dropped within each source, keeping the last row of each value (rows with a null key are all kept). Only the key column of a source is read ahead, so memory grows with the rows of one source rather than with its width.
+    """
+
+    def __init__(self, path: str, partition_columns: Optional[list] = None, mode: str = "overwrite",
+                 row_group_size: int = 1024 * 1024, min_rows_per_group: int = 0,
+                 compression: Union[str, dict] = "snappy", dictionary_columns: Optional[list] = None,
+                 batch_size: int = 64 * 1024, basename_template: Optional[str] = None,
+                 unique_key: Optional[str] = None):
+        if mode not in WRITE_MODES:
+            raise ValueError(f"Unknown dataset write mode: {mode}")
+        self.path = path
+        self.partition_columns = list(partition_columns or [])
+        self.mode = mode
+        self.row_group_size = row_group_size
+        self.min_rows_per_group = min(min_rows_per_group, row_group_size)
+        self.batch_size = batch_size
+        self.basename_template = basename_template
+        self.unique_key = unique_key
+        # pyarrow.dataset is only imported by the output stage, keeping it off the startup of the other stages
+        import pyarrow.dataset as ds
+        self.file_options = ds.ParquetFileFormat().make_write_options(
+            compression=compression,
+            use_dictionary=True if dictionary_columns is None else list(dictionary_columns),
+        )
+        self.rows = 0
+        self.duplicates = 0
+
+    @classmethod
+    def from_config(cls, config: dict, path: str, mode: str, **kwargs) -> "PartitionedDatasetWriter":
+        """
+        Creates a writer with the `partition_columns` of the config, the row group, compression and dictionary settings of its `output` section and the `dedup` key.
+
+        Parameters:
+            config (dict): The parsed configuration.
+            path (str): The dataset directory.
+            mode (str): The write mode.
+            kwargs: Further writer arguments, e.g. `basename_template`.
+        """
+        output = config.get("output") or {}
+        settings = {
+            "row_group_size": int(output.get("row_group_size", 1024 * 1024)),
+            "min_rows_per_group": int(output.get("min_rows_per_group", 0)),
+            "compression": output.get("compression", "snappy"),
+            "dictionary_columns": output.get("dictionary_columns"),
+            "unique_key": (config.get("dedup") or {}).get("key") or None,
+        }
+        settings.update(kwargs)
+        return cls(path, config.get("partition_columns"), mode, **settings)
+
+    def write(self, sources: list) -> list:
+        """
+        Streams the sources into the dataset.
+
+        Parameters:
+            sources (list): DataFrames, Arrow tables or Parquet file paths, written in order.
+
+        Returns:
+            list: The paths of the fragments written.
+        """
+        if not sources:
+            return []
+        schemas = [_source_schema(source) for source in sources]
+        schema = pa.unify_schemas([s.remove_metadata() for s in schemas], promote_options="permissive")
+        # Keep the pandas metadata of the first source so that column dtypes round-trip through pandas
+        schema = schema.with_metadata(schemas[0].metadata)
+
+        if self.unique_key is not None and schema.get_field_index(self.unique_key) == -1:
+            raise ValueError(f"The key column {self.unique_key} is not in the written data")
+
+        def batches():
+            for source in sources:
+                keep = _last_rows(source, self.unique_key) if self.unique_key is not None else None
+                offset = 0
+                for batch in _source_batches(source, self.batch_size):
+                    if keep is not None:
+                        mask = keep[offset:offset + batch.num_rows]
+                        offset += batch.num_rows
+                        if not mask.all():
+                            self.duplicates += int((~mask).sum())
+                            batch = batch.filter(pa.array(mask))
+                    self.rows += batch.num_rows
+                    yield _conform(batch, schema)
+
+        if self.mode == "overwrite" and os.path.exists(self.path):
+            shutil.rmtree(self.path)
+        basename_template = self.basename_template
+        if basename_template is None:
+            basename_template = f"part-{uuid.uuid4().hex}-{{i}}.parquet" if self.mode == "append" else "part-{i}.parquet"
+
+        import pyarrow.dataset as ds
+        written = []
+        ds.write_dataset(pa.RecordBatchReader.from_batches(schema, batches()),
+                         self.path,
+                         format="parquet",
+                         file_options=self.file_options,
+                         partitioning=self.partition_columns or None,
+                         partitioning_flavor="hive",
+                         basename_template=basename_template,
+                         existing_data_behavior="delete_matching" if self.mode == "overwrite_partition" else "overwrite_or_ignore",
+                         min_rows_per_group=self.min_rows_per_group,
+                         max_rows_per_group=self.row_group_size,
+                         file_visitor=lambda written_file: written.append(written_file.path))
+        return sorted(written)
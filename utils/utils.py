@@ -1 +1 @@
-# -*- coding: utf-8 -*-"""This module provides a set of classes and methods for data processing, validation, cleaning, and quality metrics generation for DataFrame operations.Key functionality Classes include:1. **DataFrame Validation**:   - Validate the structure of DataFrames against configuration dictionaries, checking for matching variable names, types, and counts.2. **Data Cleaning**:   - Methods to clean DataFrames by removing special characters, whitespace, and converting column values to uppercase.3. **Data Processing**:   - Includes functionality for adding new columns (e.g., year from a date column), removing PII (Personally Identifiable Information) columns, and hashing specified columns with SHA-256.4. **Quality Metrics**:   - Calculates various data quality metrics including row counts, null percentages, distinct values, maximum and minimum column lengths, and statistical summaries for numeric columns.   - Generates visual plots for these quality metrics.5. **Output Handling**:   - Handles the processing of multiple Parquet files, combining them, and saving the result to a specified output location.Created on: Fri Jan 3 09:23:38 2025@author: DanielCheung"""import osimport sysimport pandas as pdimport reimport hashlibimport loggingimport matplotlib.pyplot as pltimport seaborn as snsimport warningsimport boto3from datetime import datetimeclass DataFrameValidation:    """    A class for validating DataFrame structures against configuration dictionaries.    """    @staticmethod    def variable_names(df, config) -> bool:        """        Validates whether the column names of a DataFrame align with the keys in a configuration dictionary.        Parameters:            df (pd.DataFrame): The DataFrame whose variable names are being validated.            config (dict):  The configuration dictionary containing expected variable keys.        Returns:            bool: True if columns align, False otherwise.        """        if list(df.columns) == list(config['variables'].keys()):            logging.info(                f"SUCCESS: Variable names align between config and dataframe.")            return True        else:            logging.info(                f"Please check that the correct variables are included in both the table and the config.")            return False    @staticmethod    def variable_types(df, config) -> bool:        """        Validates whether the data types of the columns in a DataFrame align with the types specified in the configuration dictionary.        Parameters:            df (pd.DataFrame): The DataFrame whose column types are being validated.            config (dict): A dictionary containing the expected variable types. The values of the 'variables' key in the dictionary should represent the expected data types for each variable.        Returns:            bool: True if the column types in the DataFrame align with the expected types in the config, False otherwise.        Logs a success message if the types match, or a warning if there is a mismatch.        """        if df.dtypes.tolist() == list(config['variables'].values()):            logging.info(                "SUCCESS: Variable types align between config and dataframe.")            return True        else:            logging.warning(                "Please check that the correct types are consistent in both the table and the config.")            return False    @staticmethod    def variable_count(df, config) -> bool:        """        Validates whether the number of columns in a DataFrame matches the number of expected variables in a configuration dictionary.        Parameters:            df (pd.DataFrame): The DataFrame to validate.            config (dict): The configuration dictionary containing expected variable keys.        Returns:            bool: True if the number of columns matches the number of expected variables, False otherwise.        """        expected_variable_count = len(config['variables'])        actual_variable_count = len(df.columns)        if actual_variable_count == expected_variable_count:            logging.info(f"SUCCESS: Number of variables matches:{actual_variable_count}.")            return True        else:            error_message = (f"ERROR: Mismatch in variable count. "                             f"Expected: {expected_variable_count}, Found: {actual_variable_count}.")            logging.error(error_message)            raise ValueError(error_message)class Cleaning:    @staticmethod    def remove_special_characters(df: pd.DataFrame, column_name: str) -> pd.DataFrame:        """        Removes special characters from a specific column in the DataFrame.        Parameters:            df (pd.DataFrame): The DataFrame containing the column to clean.            column_name (str): The name of the column from which special characters will be removed.        Returns:            pd.DataFrame: A DataFrame with special characters removed from the specified column.        """        # Use regex to remove all non-alphanumeric characters (except spaces)        df[column_name] = df[column_name].apply(            lambda x: re.sub(r'[^a-zA-Z0-9\s]', '', str(x)))        return df    @staticmethod    def remove_whitespaces(df: pd.DataFrame) -> pd.DataFrame:        """        Removes whitespaces from all columns in the DataFrame.        Parameters:            df (pd.DataFrame): The DataFrame to clean.        Returns:            pd.DataFrame: The DataFrame with whitespaces removed from all columns.        """        # Apply whitespace removal to all columns        df = df.applymap(lambda x: ''.join(str(x).split()))        return df    @staticmethod    def convert_columns_uppercase(df: pd.DataFrame, columns: list) -> pd.DataFrame:        """        Converts all values in specified columns to uppercase.        Parameters:            df (pd.DataFrame): The DataFrame containing the columns to convert.            columns (list): A list of column names to convert to uppercase.        Returns:            pd.DataFrame: A DataFrame with the specified columns' values in uppercase.        """        for column in columns:            df[column] = df[column].apply(lambda x: str(x).upper())        return dfclass Processing:    @staticmethod    def add_year_column(df: pd.DataFrame, date_column: str) -> pd.DataFrame:        """        Adds a new 'year' column to the DataFrame extracted from the provided date column.        Parameters:            df (pd.DataFrame): The DataFrame containing the date column.            date_column (str): The name of the date column in 'YYYY-MM-DD' format.        Returns:            pd.DataFrame: A DataFrame with the new 'year' column.        """        # Ensure the date column is in datetime format        df[date_column] = pd.to_datetime(df[date_column])        # Create a new 'year' column by extracting the year from the date column        df['Year of birth'] = df[date_column].dt.year        return df    @staticmethod    def remove_pii_columns(df: pd.DataFrame, pii_columns: list) -> pd.DataFrame:        """        Removes columns from the DataFrame that are considered PII (Personally Identifiable Information).        Parameters:            df (pd.DataFrame): The DataFrame from which PII columns will be removed.            pii_columns (list): A list of column names to be removed from the DataFrame.        Returns:            pd.DataFrame: A DataFrame with the specified PII columns removed.        """        # Remove the PII columns if they exist in the DataFrame        df = df.drop(columns=[col for col in pii_columns if col in df.columns])        return df    @staticmethod    def hash_columns_sha256_salt(df: pd.DataFrame, columns: list, salt: str) -> pd.DataFrame:        """        Hashes columns in the DataFrame using SHA-256 with a salt.        Parameters:            df (pd.DataFrame): The DataFrame containing the columns to hash.            columns (list): A list of column names to hash.            salt (str): The salt value.        Returns:            pd.DataFrame: The DataFrame with new columns containing the hashed values.        """        for column in columns:            df[f'{column}_hashed'] = df[column].apply(                lambda x: hashlib.sha256(                    f'{x}{salt}'.encode('utf-8')).hexdigest()            )            df.drop(columns=[f"{column}"], inplace=True)        return df    @staticmethod    def add_sourcefile_variable(df, default_value=None) -> pd.DataFrame:        """        Adds a new column to the DataFrame with a default value.        Parameters:        df (pd.DataFrame): The DataFrame to which the column will be added.        column_name (str): The name of the new column.        default_value: The value to initialize the new column with. Defaults to None.        Returns:        pd.DataFrame: The updated DataFrame with the new column added.        """        df["source_file"] = default_value        return dfclass QualityMetrics:    @staticmethod    def calculate_data_quality(df: pd.DataFrame) -> pd.DataFrame:        """Calculates various data quality metrics for a DataFrame."""        # (1) Total row counts        total_rows = len(df)        # (2) Null counts and percentage        null_counts = df.isnull().sum()        null_percentage = (null_counts / total_rows) * 100        # (3) Distinct counts and percentage        distinct_counts = df.nunique()        distinct_percentage = (distinct_counts / total_rows) * 100        # (4) Maximum character length per column        max_length = df.apply(lambda x: x.astype(str).str.len().max())        # (5) Minimum character length per column        min_length = df.apply(lambda x: x.astype(str).str.len().min())        # (6) For numeric columns: max, min, mean, and std        numeric_metrics = df.select_dtypes(            include=['number']).agg(['max', 'min', 'mean', 'std'])        # Prepare a DataFrame to consolidate the results        summary = pd.DataFrame({            'Total Count': total_rows,            'Null Count': null_counts,            'Null Percentage (%)': null_percentage,            'Distinct Count': distinct_counts,            'Distinct Percentage (%)': distinct_percentage,            'Max Length': max_length,            'Min Length': min_length,        }).T        # Add numeric-specific statistics to summary        summary = pd.concat([summary, numeric_metrics.T], axis=0)        return summary    @staticmethod    def suppress_warnings():        """Suppresses warnings and console messages."""        warnings.filterwarnings("ignore")        sns.set(rc={"figure.max_open_warning": 0})  # Suppress Seaborn warnings    @staticmethod    def get_plot_customizations():        """Returns a dictionary of global customization options."""        return {            "title_fontsize": 16,            "label_fontsize": 12,            "tick_fontsize": 10,            "palette": sns.color_palette("Spectral", as_cmap=False),            "figsize": (12, 18),            "style": "whitegrid"        }    @staticmethod    def plot_quality_metrics(df: pd.DataFrame, save_directory: str = './charts/') -> None:        """Generates and saves a single chart with subplots for quality metrics."""        # Suppress warnings and messages        QualityMetrics.suppress_warnings()        # Ensure the save directory exists        os.makedirs(save_directory, exist_ok=True)        # Drop unnecessary columns        quality_metrics = df.drop(columns=['max', 'min', 'mean', 'std'])        # Customizations        customizations = QualityMetrics.get_plot_customizations()        sns.set_theme(style=customizations["style"])        fig, axes = plt.subplots(3, 1, figsize=customizations["figsize"])        # Metrics and their titles        metrics = [            ('Null Percentage (%)', 'Null Percentage by Column'),            ('Distinct Percentage (%)', 'Distinct Percentage by Column'),            ('Max Length', 'Max Length by Column')        ]        # Loop through metrics to create subplots        for ax, (metric, title) in zip(axes, metrics):            sns.barplot(                x=quality_metrics.columns,                y=quality_metrics.loc[metric],                palette=customizations["palette"],                ax=ax            )            ax.set_title(                title, fontsize=customizations["title_fontsize"], fontweight='bold')            ax.set_ylabel(metric, fontsize=customizations["label_fontsize"])            ax.set_xticklabels(quality_metrics.columns, rotation=45,                               fontsize=customizations["tick_fontsize"])        # Get current datetime and format it as a string        current_datetime = datetime.now().strftime("%Y%m%d_%H%M%S")        plt.tight_layout()        plt.savefig(os.path.join(save_directory,                    f'combined_quality_metrics_{current_datetime}.png'))        plt.close()class Output:    @staticmethod    def format_and_save_parquet(config):        """        Processes multiple parquet files, combines them, and saves the result to a final location.        Parameters:            config (dict): Configuration dictionary containing:                - 'csv_files': List of base file names (without extension).                - 'temp': Directory containing the parquet files.                - 'outputs': Directory to save the final parquet file.                - 'output_asset_name': Base name for the output file.                - 'partition_columns': List of columns to use for partitioning.        Returns:            None        """        # Get list of parquet files        parquet_files = [f"{x}.parquet" for x in config['csv_files']]        df_list = []  # List to hold individual DataFrames        for file in parquet_files:            # Read each parquet file            file_path = f"{config['temp']}/{file}"            df = pd.read_parquet(file_path)            df_list.append(df)        # Combine all DataFrames        df_combined = pd.concat(df_list, ignore_index=True)        # Get current datetime and format it as a string        current_datetime = datetime.now().strftime("%Y%m%d_%H%M%S")        # Save it to final location        output_path = f"{config['outputs']}/{config['output_asset_name']}_{current_datetime}.parquet"        df_combined.to_parquet(output_path,                               partition_cols=config['partition_columns'],                               engine='pyarrow')        print(f"SUCCESS: Combined parquet file saved at {output_path}")
\ No newline at end of file
+# -*- coding: utf-8 -*-"""This module provides a set of classes and methods for data processing, validation, cleaning, and quality metrics generation for DataFrame operations.Key functionality Classes include:1. **DataFrame Validation**:   - Validate the structure of DataFrames against configuration dictionaries, checking for matching variable names, types, and counts.   - Validates a CSV's header, and the types of a sample of its rows, before the file is loaded.   - Translates the `variables` schema and `date_formats` of the configuration into explicit `pd.read_csv` dtypes and fixed-format date parsing (**Schema**).2. **Data Cleaning**:   - Methods to clean DataFrames by removing special characters, whitespace, and converting column values to uppercase.   - Runs them value by value in Python or as vectorised Arrow kernels (`utils.arrow_cleaning`), with identical results.3. **Data Processing**:   - Includes functionality for adding new columns (e.g., year from a date column), removing PII (Personally Identifiable Information) columns, and hashing specified columns with SHA-256.   - Caches salted digests of repeated values in a bounded LRU cache shared across files.4. **Quality Metrics**:   - Calculates various data quality metrics including row counts, null percentages, distinct values, maximum and minimum column lengths, and statistical summaries for numeric columns.   - Generates visual plots for these quality metrics. matplotlib and seaborn are only imported when a chart is drawn.5. **Output Handling**:   - Streams the processed files into a partitioned Parquet dataset at a specified output location, local or on S3, as a new snapshot, by appending or by overwriting partitions.   - Keeps a single row per key (e.g. `User Id`) across files and runs, with upserts found through a persistent key index.Created on: Fri Jan 3 09:23:38 2025@author: DanielCheung"""import osimport sysimport numpy as npimport pandas as pdimport reimport hashlibimport loggingimport warningsimport posixpathimport threadingfrom collections import OrderedDictfrom utils import arrow_cleaningfrom utils.key_index import KeyIndexfrom utils.storage import is_remote, open_storagefrom utils.streaming import PartitionedDatasetWriter, find_intermediatefrom datetime import datetimeclass Schema:    """    Reading options derived from the `variables` schema of the configuration.    """    # Schema types read as object columns of Python strings    TEXT_TYPES = ("string", "str", "object")    @staticmethod    def pandas_dtype(type_name: str):        """        Returns the pandas dtype a column of a schema type is read as.        Parameters:            type_name (str): The type in the `variables` schema, e.g. 'string', 'datetime' or 'int64'.        Returns:            np.dtype: The dtype, `object` for text and `datetime64[ns]` for dates.        """        if type_name in Schema.TEXT_TYPES:            return np.dtype(object)        if type_name == "datetime":            return np.dtype("datetime64[ns]")        return pd.api.types.pandas_dtype(type_name)    @staticmethod    def read_options(config) -> dict:        """        Returns the `pd.read_csv` options reading the `variables` with explicit types instead of inferring them.        Datetime variables are parsed with their format in `date_formats` (e.g. '%Y-%m-%d'), or inferred when they have none.        Parameters:            config (dict): The configuration dictionary with the `variables` schema.        Returns:            dict: The `dtype`, `parse_dates` and `date_format` options, or no options without a schema.        """        variables = config.get('variables') or {}        if not variables:            return {}        dates = [name for name, type_name in variables.items() if type_name == "datetime"]        options = {"dtype": {name: (str if type_name in Schema.TEXT_TYPES else type_name)                             for name, type_name in variables.items() if type_name != "datetime"}}        if dates:            options["parse_dates"] = dates            formats = {name: fmt for name, fmt in (config.get('date_formats') or {}).items() if name in dates}            if formats:                options["date_format"] = formats        return optionsclass DataFrameValidation:    """    A class for validating DataFrame structures against configuration dictionaries.    """    @staticmethod    def variable_names(df, config) -> bool:        """        Validates whether the column names of a DataFrame align with the keys in a configuration dictionary.        Parameters:            df (pd.DataFrame): The DataFrame whose variable names are being validated.            config (dict):  The configuration dictionary containing expected variable keys.        Returns:            bool: True if columns align, False otherwise.        """        if list(df.columns) == list(config['variables'].keys()):            logging.info(                f"SUCCESS: Variable names align between config and dataframe.")            return True        else:            logging.info(                f"Please check that the correct variables are included in both the table and the config.")            return False    @staticmethod    def variable_types(df, config) -> bool:        """        Validates whether the data types of the columns in a DataFrame align with the types specified in the configuration dictionary.        Parameters:            df (pd.DataFrame): The DataFrame whose column types are being validated.            config (dict): A dictionary containing the expected variable types. The values of the 'variables' key in the dictionary should represent the expected data types for each variable.        Returns:            bool: True if the column types in the DataFrame align with the expected types in the config, False otherwise.        Logs a success message if the types match, or a warning if there is a mismatch.        """        expected_types = [Schema.pandas_dtype(type_name) for type_name in config['variables'].values()]        if df.dtypes.tolist() == expected_types:            logging.info(                "SUCCESS: Variable types align between config and dataframe.")            return True        else:            logging.warning(                "Please check that the correct types are consistent in both the table and the config.")            return False    @staticmethod    def variable_count(df, config) -> bool:        """        Validates whether the number of columns in a DataFrame matches the number of expected variables in a configuration dictionary.        Parameters:            df (pd.DataFrame): The DataFrame to validate.            config (dict): The configuration dictionary containing expected variable keys.        Returns:            bool: True if the number of columns matches the number of expected variables, False otherwise.        """        expected_variable_count = len(config['variables'])        actual_variable_count = len(df.columns)        if actual_variable_count == expected_variable_count:            logging.info(f"SUCCESS: Number of variables matches:{actual_variable_count}.")            return True        else:            error_message = (f"ERROR: Mismatch in variable count. "                             f"Expected: {expected_variable_count}, Found: {actual_variable_count}.")            logging.error(error_message)            raise ValueError(error_message)    @staticmethod    def validate_header(path: str, config, sample_rows: int = 0) -> None:        """        Validates a CSV before it is loaded, from its header and optionally a sample of its rows.        The variable names and count are checked on the header alone, so a file with the wrong columns is rejected without being parsed. The types are then checked on the first `sample_rows` rows, read with the types of the schema.        Parameters:            path (str): The CSV file to validate.            config (dict): The configuration dictionary containing the expected variables.            sample_rows (int): The number of rows whose types are checked (0 to check the header only). A file without rows passes on its header.        Raises:            ValueError: If the variable names or count do not match the configuration, a date in the sample does not parse, or the sample cannot be read with the schema types.        """        header = pd.read_csv(path, nrows=0)        if not DataFrameValidation.variable_names(header, config):            error_message = (f"ERROR: Mismatch in variable names in {path}. "                             f"Expected: {list(config['variables'])}, Found: {list(header.columns)}.")            logging.error(error_message)            raise ValueError(error_message)        DataFrameValidation.variable_count(header, config)        if not sample_rows:            return        sample = pd.read_csv(path, nrows=sample_rows, **Schema.read_options(config))        if sample.empty:            # A header-only file has no values to check            return        unparsed = [name for name in Schema.read_options(config).get("parse_dates", [])                    if not pd.api.types.is_datetime64_any_dtype(sample[name])]        if unparsed:            error_message = (f"ERROR: Dates that do not parse in {path}, in variables {unparsed}. "                             f"Expected formats: {config.get('date_formats') or 'inferred'}.")            logging.error(error_message)            raise ValueError(error_message)        if not DataFrameValidation.variable_types(sample, config):            error_message = (f"ERROR: Mismatch in variable types in {path}. "                             f"Expected: {list(config['variables'].values())}, Found: {sample.dtypes.astype(str).tolist()}.")            logging.error(error_message)            raise ValueError(error_message)class Cleaning:    @staticmethod    def _check_engine(engine: str) -> None:        if engine not in arrow_cleaning.CLEANING_ENGINES:            raise ValueError(f"Unknown cleaning engine: {engine}")    @staticmethod    def remove_special_characters(df: pd.DataFrame, column_name: str, engine: str = "python") -> pd.DataFrame:        """        Removes special characters from a specific column in the DataFrame.        Parameters:            df (pd.DataFrame): The DataFrame containing the column to clean.            column_name (str): The name of the column from which special characters will be removed.            engine (str): 'python' to clean value by value, 'arrow' to use vectorised Arrow kernels.        Returns:            pd.DataFrame: A DataFrame with special characters removed from the specified column.        """        Cleaning._check_engine(engine)        if engine == "arrow":            df[column_name] = arrow_cleaning.remove_special_characters(df[column_name])            return df        # Use regex to remove all non-alphanumeric characters (except spaces)        df[column_name] = df[column_name].apply(            lambda x: re.sub(r'[^a-zA-Z0-9\s]', '', str(x)))        return df    @staticmethod    def remove_whitespaces(df: pd.DataFrame, engine: str = "python", columns: list = None) -> pd.DataFrame:        """        Removes whitespaces from all columns in the DataFrame.        Parameters:            df (pd.DataFrame): The DataFrame to clean.            engine (str): 'python' to clean value by value, 'arrow' to use vectorised Arrow kernels.            columns (list): The columns to clean. Defaults to all columns.        Returns:            pd.DataFrame: The DataFrame with whitespaces removed from all columns.        """        Cleaning._check_engine(engine)        if engine == "arrow":            df = df.copy(deep=False)            positions = range(df.shape[1]) if columns is None else [df.columns.get_loc(column) for column in columns]            for i in positions:                df.isetitem(i, arrow_cleaning.remove_whitespaces(df.iloc[:, i]))            return df        # Apply whitespace removal to all columns        if columns is None:            df = df.applymap(lambda x: ''.join(str(x).split()))        else:            df = df.copy()            df[columns] = df[columns].applymap(lambda x: ''.join(str(x).split()))        return df    @staticmethod    def convert_columns_uppercase(df: pd.DataFrame, columns: list, engine: str = "python") -> pd.DataFrame:        """        Converts all values in specified columns to uppercase.        Parameters:            df (pd.DataFrame): The DataFrame containing the columns to convert.            columns (list): A list of column names to convert to uppercase.            engine (str): 'python' to convert value by value, 'arrow' to use vectorised Arrow kernels.        Returns:            pd.DataFrame: A DataFrame with the specified columns' values in uppercase.        """        Cleaning._check_engine(engine)        for column in columns:            if engine == "arrow":                df[column] = arrow_cleaning.convert_uppercase(df[column])            else:                df[column] = df[column].apply(lambda x: str(x).upper())        return dfclass Processing:    @staticmethod    def add_year_column(df: pd.DataFrame, date_column: str) -> pd.DataFrame:        """        Adds a new 'year' column to the DataFrame extracted from the provided date column.        Parameters:            df (pd.DataFrame): The DataFrame containing the date column.            date_column (str): The name of the date column in 'YYYY-MM-DD' format.        Returns:            pd.DataFrame: A DataFrame with the new 'year' column.        """        # Ensure the date column is in datetime format (it already is when read with the schema)        if not pd.api.types.is_datetime64_any_dtype(df[date_column]):            df[date_column] = pd.to_datetime(df[date_column])        # Create a new 'year' column by extracting the year from the date column        df['Year of birth'] = df[date_column].dt.year        return df    @staticmethod    def remove_pii_columns(df: pd.DataFrame, pii_columns: list) -> pd.DataFrame:        """        Removes columns from the DataFrame that are considered PII (Personally Identifiable Information).        Parameters:            df (pd.DataFrame): The DataFrame from which PII columns will be removed.            pii_columns (list): A list of column names to be removed from the DataFrame.        Returns:            pd.DataFrame: A DataFrame with the specified PII columns removed.        """        # Remove the PII columns if they exist in the DataFrame        df = df.drop(columns=[col for col in pii_columns if col in df.columns])        return df    @staticmethod    def hash_columns_sha256_salt(df: pd.DataFrame, columns: list, salt: str,                                 cache: "DigestCache" = None) -> pd.DataFrame:        """        Hashes columns in the DataFrame using SHA-256 with a salt.        Each column is dictionary-encoded first, so every distinct value is hashed once and the digests are mapped back to the rows. The digests are identical to hashing `f'{value}{salt}'` row by row.        Parameters:            df (pd.DataFrame): The DataFrame containing the columns to hash.            columns (list): A list of column names to hash.            salt (str): The salt value.            cache (DigestCache): Optional LRU cache of digests shared between calls (e.g. across the files of a run).        Returns:            pd.DataFrame: The DataFrame with new columns containing the hashed values.        """        def digest(text):            return hashlib.sha256(f'{text}{salt}'.encode('utf-8')).hexdigest()        for column in columns:            values = df[column]            # Nullable columns (e.g. Int64) are converted the way `Series.apply` converts them,            # so an Int64 column holding missing values is hashed as floats ('1.0', 'nan')            if pd.api.types.is_extension_array_dtype(values.dtype) and not isinstance(values.dtype, pd.CategoricalDtype):                values = pd.Series(values.array.to_numpy(), index=values.index)            # Values that compare equal but format differently (1 and 1.0 in an object column,            # -0.0 and 0.0 in a float column) are formatted first so they stay distinct keys            if values.dtype == object and pd.api.types.infer_dtype(values, skipna=True) != 'string':                values = values.map(lambda x: f'{x}')            elif values.dtype.kind == 'f' and np.signbit(values[values == 0]).any():                values = values.map(lambda x: f'{x}')            codes, uniques = pd.factorize(values)            texts = [f'{x}' for x in uniques]            if cache is not None:                digests = cache.digests(texts, salt)            else:                digests = [digest(text) for text in texts]            hashed = np.empty(len(values), dtype=object)            encoded = codes >= 0            hashed[encoded] = np.asarray(digests, dtype=object)[codes[encoded]]            # Missing values are not dictionary-encoded; hash their own text (e.g. 'nan', 'None'),            # except in categorical columns, whose missing values were never hashed            if not encoded.all():                if isinstance(values.dtype, pd.CategoricalDtype):                    hashed[~encoded] = np.nan                else:                    hashed[~encoded] = [digest(x) for x in values[~encoded]]            df[f'{column}_hashed'] = hashed            df.drop(columns=[f"{column}"], inplace=True)        return df    @staticmethod    def add_sourcefile_variable(df, default_value=None) -> pd.DataFrame:        """        Adds a new column to the DataFrame with a default value.        Parameters:        df (pd.DataFrame): The DataFrame to which the column will be added.        column_name (str): The name of the new column.        default_value: The value to initialize the new column with. Defaults to None.        Returns:        pd.DataFrame: The updated DataFrame with the new column added.        """        df["source_file"] = default_value        return dfclass DigestCache:    """    Bounded LRU cache of salted SHA-256 digests, keyed by salt and value.    One instance is shared by the files of a run, so a value that repeats across files (e.g. a job title) is hashed only once per salt. It is thread-safe, as files may be processed concurrently by the stage scheduler.    Parameters:        maxsize (int): Maximum number of digests kept across all salts.    """    def __init__(self, maxsize: int = 100000):        self.maxsize = maxsize        self.hits = 0        self.misses = 0        self._digests = OrderedDict()        self._lock = threading.Lock()    def __len__(self) -> int:        return len(self._digests)    def digests(self, texts: list, salt: str) -> list:        """        Returns the salted SHA-256 hex digests of a list of values, computing only those not cached.        Parameters:            texts (list): The values to hash, already formatted as strings.            salt (str): The salt value.        Returns:            list: The hex digests, in the order of `texts`.        """        results = []        with self._lock:            for text in texts:                key = (salt, text)                digest = self._digests.get(key)                if digest is None:                    self.misses += 1                    digest = hashlib.sha256(f'{text}{salt}'.encode('utf-8')).hexdigest()                    self._digests[key] = digest                    if len(self._digests) > self.maxsize:                        self._digests.popitem(last=False)                else:                    self.hits += 1                    self._digests.move_to_end(key)                results.append(digest)        return resultsclass QualityMetrics:    @staticmethod    def calculate_data_quality(df: pd.DataFrame) -> pd.DataFrame:        """Calculates various data quality metrics for a DataFrame."""        # (1) Total row counts        total_rows = len(df)        # (2) Null counts and percentage        null_counts = df.isnull().sum()        null_percentage = (null_counts / total_rows) * 100        # (3) Distinct counts and percentage        distinct_counts = df.nunique()        distinct_percentage = (distinct_counts / total_rows) * 100        # (4) Maximum character length per column        max_length = df.apply(lambda x: x.astype(str).str.len().max())        # (5) Minimum character length per column        min_length = df.apply(lambda x: x.astype(str).str.len().min())        # (6) For numeric columns: max, min, mean, and std        numeric_metrics = df.select_dtypes(            include=['number']).agg(['max', 'min', 'mean', 'std'])        # Prepare a DataFrame to consolidate the results        summary = pd.DataFrame({            'Total Count': total_rows,            'Null Count': null_counts,            'Null Percentage (%)': null_percentage,            'Distinct Count': distinct_counts,            'Distinct Percentage (%)': distinct_percentage,            'Max Length': max_length,            'Min Length': min_length,        }).T        # Add numeric-specific statistics to summary        summary = pd.concat([summary, numeric_metrics.T], axis=0)        return summary    @staticmethod    def suppress_warnings():        """Suppresses warnings and console messages."""        import seaborn as sns        warnings.filterwarnings("ignore")        sns.set(rc={"figure.max_open_warning": 0})  # Suppress Seaborn warnings    @staticmethod    def get_plot_customizations():        """Returns a dictionary of global customization options."""        import seaborn as sns        return {            "title_fontsize": 16,            "label_fontsize": 12,            "tick_fontsize": 10,            "palette": sns.color_palette("Spectral", as_cmap=False),            "figsize": (12, 18),            "style": "whitegrid"        }    @staticmethod    def plot_quality_metrics(df: pd.DataFrame, save_directory: str = './charts/', file_name: str = None) -> str:        """        Generates and saves a single chart with subplots for quality metrics.        Parameters:            df (pd.DataFrame): The quality metrics summary.            save_directory (str): Directory to save the chart in.            file_name (str): Name of the PNG file. Defaults to a name stamped with the current datetime.        Returns:            str: The path of the saved chart.        """        # Plotting libraries are slow to import, so they are only imported when a chart is drawn        import matplotlib.pyplot as plt        import seaborn as sns        # Suppress warnings and messages        QualityMetrics.suppress_warnings()        # Ensure the save directory exists        os.makedirs(save_directory, exist_ok=True)        # Drop unnecessary columns        quality_metrics = df.drop(columns=['max', 'min', 'mean', 'std'])        # Customizations        customizations = QualityMetrics.get_plot_customizations()        sns.set_theme(style=customizations["style"])        fig, axes = plt.subplots(3, 1, figsize=customizations["figsize"])        # Metrics and their titles        metrics = [            ('Null Percentage (%)', 'Null Percentage by Column'),            ('Distinct Percentage (%)', 'Distinct Percentage by Column'),            ('Max Length', 'Max Length by Column')        ]        # Loop through metrics to create subplots        for ax, (metric, title) in zip(axes, metrics):            sns.barplot(                x=quality_metrics.columns,                y=quality_metrics.loc[metric],                palette=customizations["palette"],                ax=ax            )            ax.set_title(                title, fontsize=customizations["title_fontsize"], fontweight='bold')            ax.set_ylabel(metric, fontsize=customizations["label_fontsize"])            ax.set_xticklabels(quality_metrics.columns, rotation=45,                               fontsize=customizations["tick_fontsize"])        # Get current datetime and format it as a string        if file_name is None:            current_datetime = datetime.now().strftime("%Y%m%d_%H%M%S")            file_name = f'combined_quality_metrics_{current_datetime}.png'        plt.tight_layout()        path = os.path.join(save_directory, file_name)        plt.savefig(path)        plt.close()        return pathclass Output:    @staticmethod    def format_and_save_parquet(config, dataframes: list = None, files: list = None, incremental: bool = False,                                storage=None) -> dict:        """        Streams the processed files into the final partitioned Parquet dataset.        When 'outputs' is an S3 location, the dataset is written to a local staging copy and the fragments are then uploaded by the storage backend.        The record batches of every file are written straight into the Hive-style partitions of `partition_columns`, so the files are never combined into one DataFrame. The write mode is taken from `config['output']['mode']`:        - 'snapshot' (default): writes a new `{output_asset_name}_{datetime}.parquet`.        - 'append': adds the files to `{output_asset_name}.parquet`.        - 'overwrite_partition': replaces the partitions of `{output_asset_name}.parquet` that the files contain.        Parameters:            config (dict): Configuration dictionary containing:                - 'csv_files': List of base file names (without extension).                - 'temp': Directory containing the intermediate files (Parquet or Arrow IPC).                - 'outputs': Directory to save the final parquet file.                - 'output_asset_name': Base name for the output file.                - 'partition_columns': List of columns to use for partitioning.                - 'output': Write mode, row group size, compression and dictionary columns (optional).            dataframes (list): Processed DataFrames already held in memory, written batch by batch. When omitted, the intermediate files in 'temp' (Parquet or Arrow IPC) are streamed instead.            files (list): The files to save. Defaults to 'csv_files'.            incremental (bool): Update the output in place file by file, whatever the mode. Each file is written to its own fragments of `{output_asset_name}.parquet` after its previous fragments are deleted, so partitions without rows of the given files are not rewritten.            storage (LocalStorage): The storage backend of the outputs. Defaults to the one of the config's locations.        With a `dedup.key` configured, each key is kept once: within a file the last row of a key is kept, and a key written again replaces its earlier row (an upsert), found through the key index of the output (`utils.key_index.KeyIndex`). The 'overwrite_partition' mode does not support deduplication.        Returns:            dict: The fragments written for each file in incremental mode, otherwise an empty dict.        Raises:            ValueError: When deduplication is configured with the 'overwrite_partition' mode.        """        files = config['csv_files'] if files is None else files        sources = list(dataframes) if dataframes is not None else [find_intermediate(config, x) for x in files]        storage = storage or open_storage(config)        mode = 'append' if incremental else (config.get('output') or {}).get('mode', 'snapshot')        if mode == 'snapshot':            # Get current datetime and format it as a string            current_datetime = datetime.now().strftime("%Y%m%d_%H%M%S")            output_path = f"{config['outputs']}/{config['output_asset_name']}_{current_datetime}.parquet"        else:            output_path = Output.incremental_output_path(config)        if mode == 'overwrite_partition' and (config.get('dedup') or {}).get('key'):            raise ValueError("Deduplication on a key needs the 'snapshot' or 'append' output mode, or an incremental run")        # A new snapshot is deduplicated on its own, the output updated in place against its persistent key index        key_index = KeyIndex.from_config(config, output_path, storage, persistent=mode != 'snapshot')        def write(mode, sources, **kwargs) -> list:            # Fragments are written under the local path of the output, then stored at their output location            local_path = storage.local_path(output_path)            written = PartitionedDatasetWriter.from_config(config, local_path, mode, **kwargs).write(sources)            stored = [output_path + path[len(local_path):].replace(os.sep, "/") for path in written]            if mode == 'overwrite_partition' and is_remote(output_path):                # The partitions were only replaced in the staging copy: delete the earlier objects of the same partitions                partitions = {posixpath.dirname(path) for path in stored}                storage.remove([path for path in storage.list(output_path)                                if posixpath.dirname(path) in partitions and path not in stored])            if key_index is not None:                # Incremental runs keep the replaced rows, written back if the file replacing them is removed                key_index.upsert(stored, written, keep_replaced=incremental)            storage.publish(stored)            return stored        try:            if incremental:                fragments = {}                for file, source in zip(files, sources):                    Output.remove_fragments(config, file, storage, key_index)                    fragments[file] = write("append", [source], basename_template=f"{file}-{{i}}.parquet")                print(f"SUCCESS: Updated {len(files)} files in parquet file at {output_path}")                return fragments            if key_index is not None:                # Files are indexed one after another, so a key held by several files keeps the row of the last one                for i, source in enumerate(sources):                    write('overwrite' if mode == 'snapshot' and i == 0 else 'append', [source])            else:                # Stream the record batches of every file into the partitioned output                write('overwrite' if mode == 'snapshot' else mode, sources)        finally:            if key_index is not None:                if key_index.replaced:                    logging.info(f"Replaced {key_index.replaced} rows by their newest version on {key_index.key}")                key_index.close()        print(f"SUCCESS: Combined parquet file saved at {output_path}")        return {}    @staticmethod    def incremental_output_path(config) -> str:        """Returns the path of the output updated in place by incremental, append and overwrite-partition runs."""        return f"{config['outputs']}/{config['output_asset_name']}.parquet"    @staticmethod    def remove_fragments(config, file: str, storage=None, key_index=None) -> None:        """        Deletes the fragments of a file from the incremental output, and the local partition directories left empty.        Parameters:            config (dict): Configuration dictionary containing 'outputs' and 'output_asset_name'.            file (str): The base file name whose fragments are deleted.            storage (LocalStorage): The storage backend of the outputs. Defaults to the one of the config's locations.            key_index (KeyIndex): The key index of the output, from which the keys of the fragments are dropped. Defaults to the index configured in `dedup`, if any.        """        storage = storage or open_storage(config)        output_path = Output.incremental_output_path(config)        fragment_name = re.compile(rf"{re.escape(file)}-\d+\.parquet")        fragments = [fragment for fragment in storage.list(output_path)                     if fragment_name.fullmatch(posixpath.basename(fragment.replace(os.sep, "/")))]        storage.remove(fragments)        if key_index is not None:            key_index.forget(fragments)        else:            key_index = KeyIndex.from_config(config, output_path, storage)            if key_index is not None:                key_index.forget(fragments)                key_index.close()        local_path = storage.local_path(output_path)        for directory, _, _ in sorted(os.walk(local_path), reverse=True):            if directory != local_path and not os.listdir(directory):                os.rmdir(directory)
\ No newline at end of file
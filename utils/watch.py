@@ -0,0 +1,279 @@
+# -*- coding: utf-8 -*-
+"""
+Long-running watch mode of the pipeline.
+
+`python main.py --watch` keeps the pipeline resident: the config is loaded, the stages are registered and the chart render pool is started once, and each CSV landing in the `inputs` directory is run through the stages within seconds, instead of paying the startup cost of a new process per file.
+
+A watcher thread polls the inputs directory every `poll_seconds` (polling needs no extra dependency and also works on network and container mounts, where inotify events are not delivered). A file is ready once it has not been modified for `settle_seconds`, so files still being copied in are left alone; producers should preferably write under another name (e.g. `.csv.part`) and rename the file when done. Ready files are put on a bounded queue of `queue_size` files: when the pipeline falls behind the queue fills up and the watcher waits for room before it picks up more files, so memory stays bounded however fast files arrive.
+
+The main thread takes micro-batches of up to `batch_size` files from the queue, waiting up to `batch_wait_seconds` for more files once one arrived, and runs each batch as an incremental run: the run manifest skips the files that are unchanged, so only the new and modified files are processed, and the output is updated file by file. A failed batch is logged and the daemon carries on; as the manifest does not record its files, the watcher picks them up again after `retry_seconds`, a delay doubled after every consecutive failed batch up to `max_retry_seconds`. A file rewritten in the meantime is picked up as soon as it settles.
+
+SIGTERM and SIGINT stop the daemon gracefully: the batch in progress is completed and the files still queued are left for the next start, which picks them up from the manifest.
+
+Key functionality Classes include:
+1. **InputWatcher**:
+   - Polls the inputs directory and returns the files that are new or changed and settled.
+2. **WatchDaemon**:
+   - Queues the ready files with back-pressure and runs them through the pipeline in micro-batches until stopped.
+"""
+
+import os
+import time
+import queue
+import fnmatch
+import logging
+import threading
+from typing import Optional
+
+from utils.engine import PipelineRunner
+from utils.manifest import RunManifest
+from utils.render import ChartRenderer
+from utils.storage import is_remote
+
+
+class InputWatcher:
+    """
+    Polls a directory for CSV files that are new or changed and no longer being written.
+
+    Parameters:
+        directory (str): The inputs directory.
+        pattern (str): Glob pattern of the input files.
+        settle_seconds (float): Time a file must go unmodified before it is ready.
+    """
+
+    def __init__(self, directory: str, pattern: str = "*.csv", settle_seconds: float = 2.0):
+        self.directory = directory
+        self.pattern = pattern
+        self.settle_seconds = settle_seconds
+        self._ready = {}
+        self._retries = {}
+        self._paths = {}
+        self._lock = threading.Lock()
+
+    def _stat(self) -> dict:
+        """Returns the size, modification time, last modification (epoch seconds) and path of the matching files."""
+        states = {}
+        try:
+            entries = list(os.scandir(self.directory))
+        except FileNotFoundError:
+            return states
+        for entry in entries:
+            if not entry.is_file() or not fnmatch.fnmatch(entry.name, self.pattern):
+                continue
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            states[os.path.splitext(entry.name)[0]] = ((stat.st_size, stat.st_mtime_ns), stat.st_mtime, entry.path)
+        return states
+
+    def scan(self) -> list:
+        """
+        Polls the directory once.
+
+        Returns:
+            list: The files (names without extension) that became ready since the last scan, oldest first.
+        """
+        now = time.time()
+        states = self._stat()
+        ready = []
+        with self._lock:
+            for file in list(self._ready):
+                if file not in states:
+                    del self._ready[file]
+                    del self._paths[file]
+            for file, (signature, due) in list(self._retries.items()):
+                # A retry is dropped when the file changed since, as it is then picked up anew
+                if self._ready.get(file) != signature:
+                    del self._retries[file]
+                elif now >= due:
+                    del self._ready[file]
+                    del self._retries[file]
+            for file, (signature, modified, path) in sorted(states.items(), key=lambda item: item[1][1]):
+                if self._ready.get(file) != signature and now - modified >= self.settle_seconds:
+                    self._ready[file] = signature
+                    self._paths[file] = path
+                    ready.append(file)
+        return ready
+
+    def retry(self, files: list, delay: float) -> None:
+        """
+        Makes ready files ready again after a delay, so that a scan picks them up although they did not change.
+
+        Parameters:
+            files (list): The files to pick up again.
+            delay (float): Seconds to wait before they are ready again.
+        """
+        due = time.time() + delay
+        with self._lock:
+            for file in files:
+                if file in self._ready:
+                    self._retries[file] = (self._ready[file], due)
+
+    def path(self, file: str) -> Optional[str]:
+        """Returns the path of a ready file, with the extension it was found with, or None when it is not ready."""
+        with self._lock:
+            return self._paths.get(file)
+
+    def settled_files(self) -> list:
+        """Returns the ready files that are unchanged since they became ready, i.e. those safe to read now."""
+        states = self._stat()
+        with self._lock:
+            return sorted(file for file, signature in self._ready.items()
+                          if file in states and states[file][0] == signature)
+
+
+class WatchDaemon:
+    """
+    Runs the pipeline on the input files as they land, until stopped.
+
+    Parameters:
+        config (dict): The parsed configuration; its `watch` section tunes the daemon.
+        stages (list): The registered stages, run for every batch.
+        report_prefix (str): Path prefix of the batch run reports, written to `{report_prefix}.batch-{n}.report.json`, or None for no reports.
+
+    Raises:
+        ValueError: When the inputs are not a local directory (e.g. on S3), as they are polled.
+    """
+
+    def __init__(self, config: dict, stages: list, report_prefix: Optional[str] = None):
+        if is_remote(config["inputs"]):
+            raise ValueError(f"Watch mode needs a local inputs directory, not {config['inputs']}")
+        watch = config.get("watch") or {}
+        self.config = config
+        self.stages = stages
+        self.report_prefix = report_prefix
+        self.poll_seconds = watch.get("poll_seconds", 1.0)
+        self.batch_size = max(int(watch.get("batch_size", 10)), 1)
+        self.batch_wait_seconds = watch.get("batch_wait_seconds", 0.5)
+        self.retry_seconds = watch.get("retry_seconds", 5.0)
+        self.max_retry_seconds = watch.get("max_retry_seconds", 300.0)
+        self.watcher = InputWatcher(config["inputs"], watch.get("pattern", "*.csv"), watch.get("settle_seconds", 2.0))
+        self.queue = queue.Queue(maxsize=max(int(watch.get("queue_size", 100)), 1))
+        self.batches = 0
+        self.failed_batches = 0
+        self._failures = 0
+        self._stop = threading.Event()
+        self._thread = None
+        self._started = time.time()
+        self._chart_renderer = ChartRenderer(config)
+
+    def stop(self, *args) -> None:
+        """Asks the daemon to stop after the batch in progress; usable as a signal handler."""
+        logging.info("Watch mode stopping after the current batch...")
+        self._stop.set()
+
+    def _put(self, file: str) -> bool:
+        """Queues a file, waiting while the queue is full; returns False when the daemon stops first."""
+        while not self._stop.is_set():
+            try:
+                self.queue.put(file, timeout=self.poll_seconds)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _watch(self) -> None:
+        """Body of the watcher thread: polls the inputs and queues the ready files."""
+        while not self._stop.is_set():
+            try:
+                for file in self.watcher.scan():
+                    logging.info(f"Input file ready: {file}")
+                    if not self._put(file):
+                        return
+            except OSError as e:
+                logging.error(f"Error while watching {self.watcher.directory}: {e}")
+            self._stop.wait(self.poll_seconds)
+
+    def next_batch(self, timeout: Optional[float] = None) -> list:
+        """
+        Takes the next micro-batch of files from the queue.
+
+        Parameters:
+            timeout (float): Time to wait for a first file. Defaults to `poll_seconds`.
+
+        Returns:
+            list: Up to `batch_size` distinct files, or an empty list when none arrived in time.
+        """
+        try:
+            batch = [self.queue.get(timeout=self.poll_seconds if timeout is None else timeout)]
+        except queue.Empty:
+            return []
+        deadline = time.monotonic() + self.batch_wait_seconds
+        while len(batch) < self.batch_size:
+            try:
+                file = self.queue.get(timeout=max(deadline - time.monotonic(), 0))
+            except queue.Empty:
+                break
+            if file not in batch:
+                batch.append(file)
+        return batch
+
+    def process_batch(self, batch: list):
+        """
+        Runs the pipeline for a batch of ready files.
+
+        The run covers every settled input file, so that the manifest keeps the output of the earlier files and drops the output of removed ones; the unchanged files are skipped. When the run fails, the files of the batch are retried after a backoff; when only some files fail (with scheduler workers, see `context.failed`), those files are.
+
+        Parameters:
+            batch (list): The files taken from the queue.
+
+        Returns:
+            PipelineContext: The context of the run, or None when the whole run failed.
+        """
+        self.batches += 1
+        config = dict(self.config, csv_files=self.watcher.settled_files())
+        report_path = f"{self.report_prefix}.batch-{self.batches:05d}.report.json" if self.report_prefix else None
+        logging.info(f"Watch batch {self.batches}: {', '.join(batch)}")
+        try:
+            runner = PipelineRunner(config, self.stages, manifest=RunManifest.from_config(config),
+                                    report_path=report_path, chart_renderer=self._chart_renderer)
+            context = runner.run()
+        except Exception as e:
+            self._retry(batch, e)
+            return None
+        if context.failed:
+            self._retry(list(context.failed), f"{len(context.failed)} files failed")
+        else:
+            self._failures = 0
+        now = time.time()
+        for file in batch:
+            path = self.watcher.path(file)
+            if file in context.failed or path is None:
+                continue
+            try:
+                modified = os.stat(path).st_mtime
+            except FileNotFoundError:
+                continue
+            # Files already there when the daemon started count from the start
+            landed = max(modified, self._started)
+            logging.info(f"Processed {file} {now - landed:.1f}s after it landed")
+        return context
+
+    def _retry(self, files: list, error) -> None:
+        """Counts a failed batch and makes its failed files ready again after the backoff."""
+        self.failed_batches += 1
+        self._failures += 1
+        delay = min(self.retry_seconds * 2 ** (self._failures - 1), self.max_retry_seconds)
+        logging.error(f"Watch batch {self.batches} failed: {error}; retrying {', '.join(files)} in {delay:.1f}s")
+        self.watcher.retry(files, delay)
+
+    def run(self) -> None:
+        """Watches the inputs and processes the ready files until `stop()` is called."""
+        logging.info(f"Watching {self.watcher.directory} for {self.watcher.pattern} files...")
+        self._started = time.time()
+        self._thread = threading.Thread(target=self._watch, name="input-watcher", daemon=True)
+        self._thread.start()
+        try:
+            while not self._stop.is_set():
+                batch = self.next_batch()
+                if batch:
+                    self.process_batch(batch)
+        finally:
+            self._stop.set()
+            self._thread.join()
+            self._chart_renderer.close()
+            left = self.queue.qsize()
+            if left:
+                logging.info(f"{left} queued files are left for the next start.")
+            logging.info("Watch mode stopped.")